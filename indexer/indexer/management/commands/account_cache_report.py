@@ -0,0 +1,84 @@
+import gc
+import random
+import tracemalloc
+from time import time
+
+from django.core.management import BaseCommand
+from django.db import transaction, connection
+
+from indexer.models import AccountCache
+from indexer.utils.account_cache import AccountTypes
+from indexer.utils.pgcopy import copy_binary, model_encoders
+
+
+class Rollback(Exception):
+    pass
+
+
+def load_models():
+    """Previous Ton20Logic.load_account_cache"""
+
+    account_cache = {}
+    for i in AccountCache.objects.all():
+        account_cache[i.address] = i.is_contract_wallet and not i.account_blacklist
+
+    return account_cache
+
+
+def load_compact():
+    account_types = AccountTypes()
+    account_types.load()
+    return account_types
+
+
+def insert_accounts(count):
+    columns = ['address', 'is_contract_wallet', 'account_blacklist', 'smc_hash']
+    rnd = random.Random(0)
+
+    with connection.cursor() as cursor:
+        copy_binary(cursor, AccountCache._meta.db_table, columns, model_encoders(AccountCache, columns),
+                    ((f"0:{rnd.getrandbits(256):064X}", rnd.random() < 0.9, rnd.random() < 0.01, '0' * 64)
+                     for _ in range(count)))
+
+
+def measure(loader):
+    gc.collect()
+    tracemalloc.start()
+    t = time()
+    result = loader()
+    elapsed = time() - t
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = len(result)
+    del result
+    return current, peak, elapsed, total
+
+
+class Command(BaseCommand):
+    help = 'Compare startup time & memory of model based and compact account types cache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--synthetic', type=int, default=0,
+                            help="Insert so many synthetic accounts before measure, rolled back after it")
+
+    def handle(self, *args, **options):
+        report = []
+
+        try:
+            with transaction.atomic():
+                if options['synthetic']:
+                    insert_accounts(options['synthetic'])
+
+                for name, loader in [('models', load_models), ('compact', load_compact)]:
+                    report.append((name, *measure(loader)))
+
+                raise Rollback
+        except Rollback:
+            pass
+
+        base = report[0][1]
+        for name, size, peak, elapsed, total in report:
+            self.stdout.write(f"{name:>8}: {total:>9} entries, {size / 1024 / 1024:8.1f} MB kept, "
+                              f"{peak / 1024 / 1024:8.1f} MB peak, load {elapsed:6.2f}s, "
+                              f"x{base / max(size, 1):.2f} smaller than models")
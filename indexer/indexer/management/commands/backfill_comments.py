@@ -0,0 +1,43 @@
+from time import time
+
+from django.core.management import BaseCommand
+from loguru import logger
+
+from indexer.models import Transaction
+from indexer.utils.pgcopy import copy_update
+from indexer.utils.tx_unpack import comment_columns
+
+COMMENT_COLUMNS = ['comment_valid', 'comment_p', 'comment_op', 'comment_tick', 'comment_amt', 'comment_to']
+
+
+class Command(BaseCommand):
+    help = 'Fill comment_* columns of transactions indexed before comments were parsed on index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk', type=int, default=50000, help="Transactions per update")
+
+    def handle(self, *args, **options):
+        t = time()
+        last_id = 0
+        total = 0
+
+        # Walk by pk, so each chunk is index range scan and restart continues from first not filled tx
+        while True:
+            rows = list(Transaction.objects.filter(id__gt=last_id).order_by('id')
+                        .values_list('id', 'comment_valid', 'in_msg_comment')[:options['chunk']])
+            if not rows:
+                break
+
+            last_id = rows[-1][0]
+            updates = []
+            for tx_id, comment_valid, comment in rows:
+                if comment_valid is None:
+                    columns = comment_columns(comment)
+                    updates.append((tx_id, *[columns[column] for column in COMMENT_COLUMNS]))
+
+            if updates:
+                total += copy_update(Transaction, ['id'] + COMMENT_COLUMNS, ['id'], updates)
+
+            logger.info(f"Backfilled comments up to id {last_id}, updated: {total}, at: {time() - t:.1f}s")
+
+        self.stdout.write(f"Updated {total} transactions")
@@ -0,0 +1,70 @@
+import random
+from time import time
+
+from django.core.management import BaseCommand
+
+from indexer.utils.ton20checks import AddressCache, parse_address, initiator
+
+
+def synthetic_txs(count, addresses, skew):
+    """Transfers with Pareto distributed popularity of senders & recipients, `to` has stripped leading zeros"""
+
+    pool = [(random.choice([0, -1]), f"{random.getrandbits(256):064X}") for _ in range(addresses)]
+
+    def pick():
+        return pool[min(int(random.paretovariate(skew)) - 1, addresses - 1)]
+
+    txs = []
+    for _ in range(count):
+        wc, address = pick()
+        to_wc, to_address = pick()
+        txs.append({'in_msg_src_addr_workchain_id': wc, 'in_msg_src_addr_address_hex': address,
+                    'in_msg_comment': {'to': f"{to_wc}:{to_address.lstrip('0')}"}})
+
+    return txs
+
+
+def uncached(txs):
+    for tx in txs:
+        # Ton20Logic.transfer & convert_tx parsed `to` each, initiator was built in 4 places
+        parse_address(tx['in_msg_comment']['to'])
+        parse_address(tx['in_msg_comment']['to'])
+
+        for _ in range(4):
+            f"{tx['in_msg_src_addr_workchain_id']}:{tx['in_msg_src_addr_address_hex']}"
+
+
+def cached(txs, cache):
+    for tx in txs:
+        cache(tx['in_msg_comment']['to'])
+        cache(tx['in_msg_comment']['to'])
+
+        for _ in range(4):
+            initiator(tx)
+
+
+class Command(BaseCommand):
+    help = 'Compare per transaction cost of address normalization without and with AddressCache'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--txs', type=int, default=200000)
+        parser.add_argument('--addresses', type=int, default=50000, help="Distinct addresses in synthetic stream")
+        parser.add_argument('--skew', type=float, default=1.2, help="Pareto alpha, lower - more skewed")
+        parser.add_argument('--cache-size', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        txs = synthetic_txs(options['txs'], options['addresses'], options['skew'])
+
+        t = time()
+        uncached(txs)
+        before = time() - t
+
+        cache = AddressCache(options['cache_size'])
+        t = time()
+        cached(txs, cache)
+        after = time() - t
+
+        self.stdout.write(f"uncached: {before / len(txs) * 1e6:8.2f} us/tx")
+        self.stdout.write(f"cached:   {after / len(txs) * 1e6:8.2f} us/tx, x{before / after:.1f}")
+        self.stdout.write(f"cache: {cache.stats()}")
@@ -0,0 +1,312 @@
+import gzip
+import os
+import random
+from time import perf_counter
+
+import orjson as json
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+
+from indexer.utils.tx_decode import parse_comment
+from indexer.utils.tx_feed import FEED_FIELDS
+from indexer.models import Transaction, AccountCache
+from indexer.utils.ton20checks import prevalidate, initiator
+from indexer.utils.ton20logic import Ton20Logic
+from indexer.utils.stage_timers import timers
+
+# Final state hashes of synthetic scenarios as given by original Ton20Logic & Ton20State (770d5fc),
+# a change of logic or serialization must keep them
+GOLDEN_PATH = settings.BASE_DIR / 'indexer' / 'data' / 'replay_golden.json'
+
+# Decimal fields of FEED_FIELDS, recorded as strings
+INT_FIELDS = ['mc_ref_seqno', 'lt']
+
+# ticks: deployed ticks, senders: distinct senders, mint: share of mints (rest are transfers)
+SCENARIOS = {
+    'mint_wave': {'ticks': 5, 'senders': 20000, 'mint': 0.95},
+    'transfer_heavy': {'ticks': 5, 'senders': 20000, 'mint': 0.2},
+    'many_small_ticks': {'ticks': 2000, 'senders': 5000, 'mint': 0.6},
+    'few_huge_ticks': {'ticks': 2, 'senders': 100000, 'mint': 0.7},
+}
+
+# After change point of Ton20Logic.initial_check, so txs go to non zero accounts
+CREATED_AT = 1702000000
+
+# Txs per block, lt of messages of one block share BLOCK_LT bucket
+BLOCK_TXS = 1000
+
+
+def synthetic_rows(scenario: dict, count: int, seed: int):
+    """
+    Rows in shape of process_new_transaction: FEED_FIELDS with parsed in_msg_comment, ordered by lt
+
+    All senders are contract wallets, transfers are sent mostly by holders of tick, so most of them succeed
+    Returns (rows, [(address, is good account), ...])
+    """
+
+    rnd = random.Random(seed)
+    senders = [(rnd.choice([0, -1]), f"{rnd.getrandbits(256):064X}") for _ in range(scenario['senders'])]
+    ticks = [f"b{i}" for i in range(scenario['ticks'])]
+    holders = {tick: [] for tick in ticks}
+
+    rows = []
+    for i in range(count):
+        wc, address = rnd.choice(senders)
+
+        if i < len(ticks):
+            comment = {'p': 'ton-20', 'op': 'deploy', 'tick': ticks[i], 'max': str(10 ** 15), 'lim': '1000'}
+        elif rnd.random() < scenario['mint']:
+            tick = rnd.choice(ticks)
+            comment = {'p': 'ton-20', 'op': 'mint', 'tick': tick, 'amt': str(rnd.randint(1, 1000))}
+            holders[tick].append((wc, address))
+        else:
+            tick = rnd.choice(ticks)
+            if holders[tick]:
+                wc, address = rnd.choice(holders[tick])
+
+            to_wc, to_address = rnd.choice(senders)
+            comment = {'p': 'ton-20', 'op': 'transfer', 'tick': tick, 'to': f"{to_wc}:{to_address}",
+                       'amt': str(rnd.randint(1, 100))}
+            holders[tick].append((to_wc, to_address))
+
+        block = i // BLOCK_TXS
+        row = dict.fromkeys(FEED_FIELDS)
+        row.update(mc_ref_seqno=1 + block, workchain=0, lt=10 ** 13 + i,
+                   account=f"{rnd.getrandbits(256):064X}", transaction_hash=f"{rnd.getrandbits(256):064X}",
+                   in_msg_comment=parse_comment(json.dumps(comment)),
+                   in_msg_created_lt=10 ** 13 + block * 10 ** 6 + i % BLOCK_TXS,
+                   in_msg_created_at=CREATED_AT + block, in_msg_hash=f"{rnd.getrandbits(256):064X}",
+                   in_msg_src_addr_workchain_id=wc, in_msg_src_addr_address_hex=address)
+        rows.append(row)
+
+    return rows, [(f"{wc}:{address}", True) for wc, address in senders]
+
+
+def open_rows(path, mode):
+    return gzip.open(path, mode) if path.endswith('.gz') else open(path, mode)
+
+
+def record_rows(path: str, from_lt: int, limit: int, valid_only=False) -> int:
+    """
+    Dump Transaction rows in process_new_transaction order with AccountCache type of sender
+
+    Each line is json of row with raw in_msg_comment and `_good`: sender is contract wallet and not blacklisted
+    valid_only: only txs with valid ton-20 comment (comment_valid), spam is skipped over partial index
+    """
+
+    queryset = Transaction.objects.filter(in_msg_created_lt__gte=from_lt)
+    if valid_only:
+        queryset = queryset.filter(comment_valid=True)
+
+    queryset = queryset.order_by('in_msg_created_lt', 'in_msg_hash').values_list(*FEED_FIELDS)[:limit]
+
+    rows = [dict(zip(FEED_FIELDS, row)) for row in queryset.iterator(chunk_size=10000)]
+    senders = {f"{row['in_msg_src_addr_workchain_id']}:{row['in_msg_src_addr_address_hex']}" for row in rows}
+    good = {address for address, is_contract_wallet, account_blacklist in
+            AccountCache.objects.filter(address__in=senders).values_list('address', 'is_contract_wallet',
+                                                                         'account_blacklist')
+            if is_contract_wallet and not account_blacklist}
+
+    with open_rows(path, 'wb') as f:
+        for row in rows:
+            row['_good'] = f"{row['in_msg_src_addr_workchain_id']}:{row['in_msg_src_addr_address_hex']}" in good
+            f.write(json.dumps(row, default=str) + b'\n')
+
+    return len(rows)
+
+
+def load_rows(path: str):
+    """Rows of record_rows, returns (rows, [(address, is good account), ...])"""
+
+    rows = []
+    accounts = {}
+
+    with open_rows(path, 'rb') as f:
+        for line in f:
+            row = json.loads(line)
+            for field in INT_FIELDS:
+                if row[field] is not None:
+                    row[field] = int(row[field])
+
+            row['in_msg_comment'] = parse_comment(row['in_msg_comment'])
+            accounts[f"{row['in_msg_src_addr_workchain_id']}:{row['in_msg_src_addr_address_hex']}"] = row.pop('_good')
+            rows.append(row)
+
+    return rows, list(accounts.items())
+
+
+class ReplayLogic(Ton20Logic):
+    """
+    Ton20Logic without DB: account types are given, statuses are not written, commit only serializes state
+
+    Commits are taken each commit_state_each_x_txs like in production, so sender window is reset at the same txs
+    """
+
+    def __init__(self, accounts, **kwargs):
+        self.accounts = accounts
+        self.commit_times = []
+        self.state_hash = None
+        super().__init__(status_txs_enabled=False, **kwargs)
+
+    def load_account_cache(self):
+        for address, good in self.accounts:
+            self.account_types.add(address, good, False)
+
+    def commit(self, last_tx, checkpoint=False):
+        if not checkpoint:
+            self.clear_by_block_by_account()
+
+        t = perf_counter()
+        cell = self.state.serialize(last_tx)
+        serialize_time = perf_counter() - t
+
+        t = perf_counter()
+        cell.to_boc()
+        self.commit_times.append((serialize_time, perf_counter() - t))
+
+        if not checkpoint:
+            self.uncommited_txs = 0
+        self.txs_since_commit = 0
+        self.committed_lt = last_tx['in_msg_created_lt']
+        self.state_hash = cell.get_hash()
+
+
+def percentiles(values, points=(50, 90, 99)) -> list:
+    if not values:
+        return [0.0] * (len(points) + 1)
+
+    values = sorted(values)
+    return [values[min(len(values) - 1, len(values) * p // 100)] for p in points] + [values[-1]]
+
+
+def replay(rows, accounts, batch_size, commit_each, **logic_params) -> dict:
+    """Feed rows through ReplayLogic like process_new_transaction does, returns timings & final state hash"""
+
+    logic = ReplayLogic(accounts, commit_state_each_x_txs=commit_each, **logic_params)
+    timers.reset()
+    stages = {'prefetch': 0.0, 'prevalidate': 0.0, 'apply': 0.0}
+    latencies = {}
+
+    started = perf_counter()
+    for i in range(0, len(rows), batch_size):
+        batch = rows[i:i + batch_size]
+
+        t = perf_counter()
+        logic.prefetch_accounts(batch)
+        stages['prefetch'] += perf_counter() - t
+
+        t = perf_counter()
+        prevalidate(batch)
+        stages['prevalidate'] += perf_counter() - t
+
+        for tx in batch:
+            t = perf_counter()
+            logic.add_transaction(tx)
+            elapsed = perf_counter() - t
+
+            stages['apply'] += elapsed
+            op = tx['in_msg_comment'].get('op')
+            latencies.setdefault(op if isinstance(op, str) else 'invalid', []).append(elapsed)
+
+    # Final state is hashed without reset of sender window, as checkpoint does
+    if logic.txs_since_commit:
+        logic.commit(rows[-1], checkpoint=True)
+
+    total = perf_counter() - started
+    logic.finalize()
+
+    return {'txs': len(rows), 'total': total, 'stages': stages, 'latencies': latencies, 'commits': logic.commit_times,
+            'state_hash': logic.state_hash, 'senders': len({initiator(tx) for tx in rows})}
+
+
+class Command(BaseCommand):
+    help = ("Replay synthetic or recorded transactions through Ton20Logic in memory, report throughput & latencies "
+            "and compare final state hash with golden one")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenarios', nargs='+', default=list(SCENARIOS), choices=list(SCENARIOS))
+        parser.add_argument('--txs', type=int, default=100000, help="Txs per synthetic scenario, rows to record")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--input', help="Replay rows recorded with --record instead of synthetic scenarios")
+        parser.add_argument('--record', help="Record rows from DB to this .jsonl(.gz) file and exit")
+        parser.add_argument('--from-lt', type=int, default=0, help="First in_msg_created_lt to record")
+        parser.add_argument('--valid-only', action='store_true', help="Record only txs with valid ton-20 comment")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per FETCH of process_new_transaction")
+        parser.add_argument('--commit-each', type=int, default=100000,
+                            help="COMMIT_STATE_EACH: commit after so many txs passed sender checks")
+        parser.add_argument('--incremental-serialize', action='store_true')
+        parser.add_argument('--serialize-workers', type=int, default=0)
+        parser.add_argument('--update-golden', action='store_true',
+                            help="Store final state hashes as golden, runs without golden fail without it. "
+                                 "Only for new scenarios / cadences, existing goldens are hashes of original logic")
+        parser.add_argument('--no-stage-timers', action='store_true', help="Measure without stage timers overhead")
+
+    def handle(self, *args, **options):
+        timers.enabled = not options['no_stage_timers']
+
+        if options['record']:
+            count = record_rows(options['record'], options['from_lt'], options['txs'], options['valid_only'])
+            self.stdout.write(f"Recorded {count} rows to {options['record']}")
+            return
+
+        # Window reset at commits changes results, so golden is kept per commit cadence
+        if options['input']:
+            runs = [(f"{os.path.basename(options['input'])}:{options['commit_each']}",
+                     lambda: load_rows(options['input']))]
+        else:
+            runs = [(f"{name}:{options['txs']}:{options['seed']}:{options['commit_each']}",
+                     lambda name=name: synthetic_rows(SCENARIOS[name], options['txs'], options['seed']))
+                    for name in options['scenarios']]
+
+        golden = json.loads(GOLDEN_PATH.read_bytes()) if GOLDEN_PATH.exists() else {}
+        mismatches = []
+
+        for name, load in runs:
+            rows, accounts = load()
+            if not rows:
+                raise CommandError(f"No rows to replay: {name}")
+
+            result = replay(rows, accounts, options['batch_size'], options['commit_each'],
+                            incremental_serialize=options['incremental_serialize'],
+                            serialize_workers=options['serialize_workers'])
+            self.report(name, result)
+
+            expected = golden.get(name)
+            if options['update_golden']:
+                golden[name] = result['state_hash']
+                self.stdout.write(f"  state hash: {result['state_hash']} stored as golden")
+            elif expected is None:
+                mismatches.append(name)
+                self.stdout.write(f"  state hash: {result['state_hash']} has no golden, store it with --update-golden")
+            elif expected != result['state_hash']:
+                mismatches.append(name)
+                self.stdout.write(f"  state hash: {result['state_hash']} MISMATCH, golden: {expected}")
+            else:
+                self.stdout.write(f"  state hash: {result['state_hash']} equals golden")
+
+        if options['update_golden']:
+            GOLDEN_PATH.write_bytes(json.dumps(golden, option=json.OPT_INDENT_2 | json.OPT_SORT_KEYS))
+
+        if mismatches:
+            raise CommandError(f"State hash differs from golden or golden is missing: {', '.join(mismatches)}")
+
+    def report(self, name, result):
+        stages = result['stages']
+        self.stdout.write(f"{name}: {result['txs']} txs, {result['senders']} senders, "
+                          f"{result['txs'] / result['total']:.0f} tx/s total, "
+                          f"{result['txs'] / stages['apply']:.0f} tx/s apply")
+        self.stdout.write("  stages: " + ", ".join(f"{k}: {v:.2f}s" for k, v in stages.items()))
+
+        for op, values in sorted(result['latencies'].items()):
+            p50, p90, p99, top = (i * 1e6 for i in percentiles(values))
+            self.stdout.write(f"  {op:>9}: {len(values):>8} txs, p50 {p50:8.1f} us, p90 {p90:8.1f} us, "
+                              f"p99 {p99:8.1f} us, max {top:10.1f} us")
+
+        serialize = [i[0] for i in result['commits']]
+        boc = [i[1] for i in result['commits']]
+        p50, p90, p99, top = percentiles(serialize)
+        self.stdout.write(f"  commits: {len(serialize)}, serialize p50 {p50:.3f}s, max {top:.3f}s, "
+                          f"total {sum(serialize):.2f}s, to_boc total {sum(boc):.2f}s")
+
+        for line in timers.report():
+            self.stdout.write(f"  {line}")
@@ -0,0 +1,72 @@
+from time import time
+
+from django.core.management import BaseCommand
+from django.db import transaction, connection
+
+from indexer.models import Ton20Wallet
+from indexer.utils.pgcopy import copy_binary, model_encoders
+from indexer.utils.ton20state import bulk_delete_wallets
+
+BENCH_TICK = '__bench_delete__'
+
+
+class Rollback(Exception):
+    pass
+
+
+def insert_wallets(pairs):
+    columns = ['tick', 'wallet', 'amount', 'txhash']
+
+    with connection.cursor() as cursor:
+        copy_binary(cursor, Ton20Wallet._meta.db_table, columns, model_encoders(Ton20Wallet, columns),
+                    ((tick, wallet, 1, '0' * 64) for tick, wallet in pairs))
+
+
+def delete_one_by_one(pairs):
+    for tick, wallet in pairs:
+        Ton20Wallet.objects.filter(wallet=wallet, tick=tick).delete()
+
+
+def measure(delete, pairs):
+    """Insert synthetic wallets, delete them and roll everything back"""
+
+    try:
+        with transaction.atomic():
+            insert_wallets(pairs)
+
+            t = time()
+            delete(pairs)
+            elapsed = time() - t
+
+            if Ton20Wallet.objects.filter(tick=BENCH_TICK).exists():
+                raise ValueError(f"Not all wallets were deleted by {delete.__name__}")
+
+            raise Rollback
+    except Rollback:
+        pass
+
+    return elapsed
+
+
+class Command(BaseCommand):
+    help = 'Compare one by one and bulk COPY deletion of Ton20Wallet rows, all changes are rolled back'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+        parser.add_argument('--max-one-by-one', type=int, default=1000000,
+                            help="Skip one by one path for larger sizes, it's one DB round trip per wallet")
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            pairs = [(BENCH_TICK, f"0:{i:064X}") for i in range(size)]
+
+            bulk = measure(bulk_delete_wallets, pairs)
+            line = f"{size:>8} wallets: bulk {bulk:8.2f}s ({size / bulk:10.0f} rows/s)"
+
+            if size <= options['max_one_by_one']:
+                single = measure(delete_one_by_one, pairs)
+                line += f", one by one {single:8.2f}s ({size / single:10.0f} rows/s), x{single / bulk:.1f}"
+            else:
+                line += ", one by one skipped"
+
+            self.stdout.write(line)
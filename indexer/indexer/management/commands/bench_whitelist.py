@@ -0,0 +1,63 @@
+import ast
+import gzip
+import random
+import tracemalloc
+from time import time
+
+from django.core.management import BaseCommand
+
+from indexer.utils.tx_parent import WHITELIST_SOURCE, SuccessTxCache
+
+
+def load_set():
+    """Previous whitelist: python set of hex strings"""
+
+    with gzip.open(WHITELIST_SOURCE, 'rb') as f:
+        return set(ast.literal_eval(f.read().decode()))
+
+
+class Command(BaseCommand):
+    help = 'Compare load time, memory & lookup cost of whitelist as python set and as memory-mapped sorted hashes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lookups', type=int, default=200000)
+        parser.add_argument('--hit-rate', type=float, default=0.5, help="Share of lookups of whitelisted hashes")
+
+    def handle(self, *args, **options):
+        tracemalloc.start()
+        t = time()
+        old = load_set()
+        set_load = time() - t
+        set_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        t = time()
+        new = SuccessTxCache()
+        new.init_cache()
+        mmap_load = time() - t
+        mmap_memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        random.seed(0)
+        known = list(old)
+        lookups = [random.choice(known) if random.random() < options['hit_rate'] else f"{random.getrandbits(256):064X}"
+                   for _ in range(options['lookups'])]
+
+        t = time()
+        set_hits = sum(1 for i in lookups if i in old)
+        set_lookup = time() - t
+
+        t = time()
+        mmap_hits = sum(1 for i in lookups if i in new)
+        mmap_lookup = time() - t
+
+        if set_hits != mmap_hits:
+            raise ValueError(f"Hits mismatch: set {set_hits}, mmap {mmap_hits}")
+
+        self.stdout.write(f"Hashes: {len(old)}, lookups: {len(lookups)}, hits: {set_hits}")
+        self.stdout.write(f"  set:  load {set_load:.3f}s, heap {set_memory / 2 ** 20:.1f} MB, "
+                          f"lookup {set_lookup / len(lookups) * 1e6:.2f} us")
+        self.stdout.write(f"  mmap: load {mmap_load:.3f}s, heap {mmap_memory / 2 ** 20:.1f} MB "
+                          f"(file {len(new) * 32 / 2 ** 20:.1f} MB mapped), "
+                          f"lookup {mmap_lookup / len(lookups) * 1e6:.2f} us")
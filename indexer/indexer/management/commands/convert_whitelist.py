@@ -0,0 +1,17 @@
+from django.core.management import BaseCommand
+
+from indexer.utils.tx_parent import WHITELIST_PATH, WHITELIST_SOURCE, convert_whitelist
+
+
+class Command(BaseCommand):
+    help = 'Convert first wave success whitelist to sorted binary hashes file used by check_tx_parent'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', type=str, default=str(WHITELIST_SOURCE), help="Gzipped list of hex hashes")
+        parser.add_argument('--output', type=str, default=str(WHITELIST_PATH))
+
+    def handle(self, *args, **options):
+        from pathlib import Path
+
+        count = convert_whitelist(Path(options['source']), Path(options['output']))
+        self.stdout.write(f"Converted {count} hashes to {options['output']}")
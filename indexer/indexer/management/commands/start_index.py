@@ -19,6 +19,8 @@ from tqdm import tqdm
 
 from indexer.utils.tx_unpack import get_in_msg_info
 from indexer.utils.lazy_account_cache import KnownAccountsLazy, load_account
+from indexer.utils.pgcopy import copy_upsert
+from indexer.utils.tx_notify import notify_new_transactions
 from multiprocessing import Pool, set_start_method, get_context, get_start_method
 from tonpy.libs.python_ton import globalSetVerbosity
 from django.conf import settings
@@ -126,20 +128,19 @@ def process_result(lc, outq):
                             total=len(tmp_load_accs), desc=f"Load accounts states")
 
                         for i in results:
-                            tmp_accs.append(AccountCache(address=i[0], is_contract_wallet=i[1] in WALLET_HASHES,
-                                                         smc_hash=i[1] if i[1] is not None else "0" * 64,
-                                                         account_blacklist=i[0] in wallets_blacklist))
+                            tmp_accs.append((i[0], i[1] in WALLET_HASHES, i[0] in wallets_blacklist,
+                                             i[1] if i[1] is not None else "0" * 64))
                 else:
                     for i in tqdm(map(load_account(lcparams=settings.LCPARAMS), tmp_load_accs),
                                   total=len(tmp_load_accs), desc=f"Load accounts states"):
-                        tmp_accs.append(AccountCache(address=i[0], is_contract_wallet=i[1] in WALLET_HASHES,
-                                                     smc_hash=i[1] if i[1] is not None else "0" * 64,
-                                                     account_blacklist=i[0] in wallets_blacklist))
+                        tmp_accs.append((i[0], i[1] in WALLET_HASHES, i[0] in wallets_blacklist,
+                                         i[1] if i[1] is not None else "0" * 64))
 
             if len(tmp_accs) > 0:
                 try:
                     logger.debug(f"Insert: {len(tmp_accs)}")
-                    AccountCache.objects.bulk_create(tmp_accs, ignore_conflicts=True, batch_size=100000)
+                    copy_upsert(AccountCache, ['address', 'is_contract_wallet', 'account_blacklist', 'smc_hash'],
+                                conflict_fields=['address'], update_fields=[], rows=tmp_accs)
                 except Exception as e:
                     print(e, traceback.format_exc())
                     os.kill(os.getpid(), signal.SIGKILL)
@@ -155,6 +156,9 @@ def process_result(lc, outq):
                     os.kill(os.getpid(), signal.SIGKILL)
 
                 logger.debug(f"Done of TXs insert: {time() - stat}")
+
+                if settings.TX_NOTIFY:
+                    notify_new_transactions(seqno, max(tx.in_msg_created_lt or 0 for tx in tmp_txs))
                 del tmp_txs
 
         latest = LatestIndex.objects.first()
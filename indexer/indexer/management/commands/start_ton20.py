@@ -1,63 +1,86 @@
+import os
+import signal
+import threading
+
 from django.core.management import BaseCommand
 from django.db import transaction, connection
-from indexer.models import Transaction, Ton20StateSerialized, \
-    get_field_names
-from time import sleep, time
+from indexer.models import Ton20StateSerialized
+from time import sleep, time, perf_counter
 from loguru import logger
 from tqdm import tqdm
-import orjson as json
 
-from multiprocessing import Pool, set_start_method, get_context, get_start_method
+from multiprocessing import set_start_method, get_start_method
 from tonpy.libs.python_ton import globalSetVerbosity
 
 from indexer.utils.ton20logic import Ton20Logic
+from indexer.utils.ton20shards import ShardedTon20Logic
+from indexer.utils.state_image import state_image_path
+from indexer.utils.stage_timers import timers
+from indexer.utils.tx_notify import TxListener
+from indexer.utils.tx_decode import parse_comment
+from indexer.utils.tx_feed import TxFeed, FEED_FIELDS, feed_query, new_transactions, resume_hash
 from django.conf import settings
 
 globalSetVerbosity(2)
 
-def process_new_transaction(logic, latest_lt, latest_hash, batch_size=1000):
-    allow_next = latest_hash is None
+def fetch_rows(latest_lt, latest_hash=None, batch_size=1000, shutdown=None):
+    """
+    Lists of up to batch_size tx dicts of feed_query, ends after current batch once shutdown is set
+
+    Commits of batches are made inside of cursor transaction, so it must be exhausted: closing it early rolls them back
+    """
 
     with connection.cursor() as cursor:
-        field_names = get_field_names(Transaction)
-        fields_str = ", ".join(field_names)
+        sql, params = feed_query(latest_lt, latest_hash)
 
         with transaction.atomic():
-            cursor.execute(
-                f"DECLARE mycursor CURSOR FOR SELECT {fields_str} FROM {Transaction._meta.db_table} WHERE in_msg_created_lt >= {latest_lt} ORDER BY in_msg_created_lt, in_msg_hash")
-            t = tqdm()
+            cursor.execute(f"DECLARE mycursor CURSOR FOR {sql}", params)
 
             while True:
+                fetch_started = perf_counter()
                 cursor.execute(f"FETCH {batch_size} FROM mycursor")
                 rows = cursor.fetchall()
+                timers.add('db_fetch', perf_counter() - fetch_started, max(len(rows), 1))
                 if not rows:
                     break
 
+                batch = []
+                decode_started = perf_counter()
                 for row in rows:
-                    row_dict = dict(zip(field_names, row))
-                    try:
-                        comment = json.loads(row_dict['in_msg_comment'])
-                        if not isinstance(comment, dict):
-                            comment = {}
-                    except KeyboardInterrupt:
-                        raise KeyboardInterrupt
-                    except Exception as e:
-                        comment = {}
-
-                    row_dict['in_msg_comment'] = comment
-                    if allow_next:
-                        logic.add_transaction(row_dict)
-
-                        latest_lt = row_dict['in_msg_created_lt']
-                        latest_hash = row_dict['in_msg_hash']
-                    else:
-                        if row_dict['in_msg_created_lt'] == latest_lt and row_dict['in_msg_hash'] == latest_hash:
-                            allow_next = True
-                            logger.info(f"Founded last state hash: {latest_hash}, start index from it")
-
-                    t.update(1)
+                    row_dict = dict(zip(FEED_FIELDS, row))
+                    row_dict['in_msg_comment'] = parse_comment(row_dict['in_msg_comment'])
+                    batch.append(row_dict)
+                timers.add('json_decode', perf_counter() - decode_started, len(rows))
+
+                yield batch
+
+                if shutdown is not None and shutdown.is_set():
+                    break
             cursor.execute("CLOSE mycursor")
 
+
+def process_new_transaction(logic, latest_lt, latest_hash, batch_size=1000, feed=None, shutdown=None):
+    """
+    Apply txs after (latest_lt, latest_hash), latest_hash is in_msg_hash of latest applied tx
+
+    Stops after current batch once shutdown is set
+    """
+
+    t = tqdm()
+
+    if feed is None:
+        batches = fetch_rows(latest_lt, latest_hash, batch_size, shutdown=shutdown)
+    else:
+        batches = feed.rows(latest_lt, latest_hash, shutdown=shutdown)
+
+    for batch in batches:
+        logic.add_transactions(batch)
+
+        latest_lt = batch[-1]['in_msg_created_lt']
+        latest_hash = batch[-1]['in_msg_hash']
+
+        t.update(len(batch))
+
     logic.state.save_to_db()
     return latest_lt, latest_hash
 
@@ -80,42 +103,118 @@ def batched_query(queryset, batch_size=1000):
 
 def start():
     logger.info(f"Start ton20logic")
+
+    # `kill -USR1 <pid>` logs stage timers after current batch
+    signal.signal(signal.SIGUSR1, lambda signum, frame: timers.request_dump())
     # TransactionStatus.objects.all().delete()
     # Ton20StateSerialized.objects.all().delete()
 
-    logic = Ton20Logic(commit_state_each_x_txs=settings.COMMIT_STATE_EACH)
-    state = Ton20StateSerialized.get_latest_state()
+    logic_params = dict(commit_state_each_x_txs=settings.COMMIT_STATE_EACH,
+                        incremental_serialize=settings.INCREMENTAL_SERIALIZE,
+                        serialize_workers=settings.SERIALIZE_WORKERS,
+                        snapshot_full_each=settings.SNAPSHOT_FULL_EACH,
+                        state_image_dir=settings.STATE_IMAGE_DIR,
+                        flush_dirty_each=settings.FLUSH_DIRTY_EACH,
+                        commit_in_flight=settings.COMMIT_IN_FLIGHT,
+                        commit_each_seconds=settings.COMMIT_EACH_SECONDS,
+                        commit_dirty_each=settings.COMMIT_DIRTY_EACH)
+
+    if settings.APPLY_WORKERS > 1:
+        logic = ShardedTon20Logic(apply_workers=settings.APPLY_WORKERS, **logic_params)
+    else:
+        logic = Ton20Logic(**logic_params)
+    t = time()
+    state = Ton20StateSerialized.get_latest_state(with_boc=False)
+
+    image_path = None
+    if state is not None and settings.STATE_IMAGE_DIR:
+        image_path = state_image_path(settings.STATE_IMAGE_DIR, state.base_state_hash or state.state_hash)
+        if not os.path.exists(image_path):
+            logger.info(f"No state image: {image_path}, load state BOC")
+            image_path = None
+
+    if state is not None and image_path is None:
+        state = Ton20StateSerialized.get_latest_state()
+    logger.info(f"Fetched latest state at: {time() - t}")
 
     if state is None:
         latest_lt = 0
         latest_hash = None
     else:
         latest_lt = state.in_msg_created_lt
-        latest_hash = state.transaction_hash
-        logic.state.deserialize(state.state_boc,
+        logic.state.deserialize(state.state_boc if image_path is None else None,
                                 latest_lt,
-                                latest_hash)
+                                state.transaction_hash,
+                                warm_restart=settings.WARM_RESTART,
+                                image_path=image_path,
+                                deltas=state.chain_deltas(),
+                                state_hash=state.state_hash)
+        logic.set_latest_snapshot(state)
+        logic.load_tick_stats(latest_lt)
+
+        # Feed resumes after in_msg_hash of latest applied tx
+        latest_hash = resume_hash(state.transaction_hash)
+        if latest_hash is None:
+            logger.warning(f"No tx {state.transaction_hash} of latest state in DB, resume from next lt")
+            latest_lt += 1
 
     if not get_start_method(allow_none=True):
         set_start_method("spawn")
 
-    latest_lt, latest_hash = process_new_transaction(logic, latest_lt, latest_hash)
+    # Rows are read & decoded in separate thread & processes ahead of logic
+    feed = TxFeed(settings.READ_WORKERS) if settings.READ_WORKERS > 0 else None
+
+    # Wakeups of start_index after each inserted batch, listen before first check so none is missed
+    listener = None
+    if settings.TX_NOTIFY:
+        listener = TxListener()
+        listener.connect()
 
-    while True:
-        latest = Transaction.objects.filter(in_msg_created_lt__gte=latest_lt).count()
-        if latest == 0:
+    def wait():
+        if listener is None:
             sleep(1)
         else:
-            logger.info(f"Latest lt: {latest_lt}, {latest_hash}, got: {latest}")
-            new_latest_lt, new_latest_hash = process_new_transaction(logic, latest_lt, latest_hash)
+            listener.wait(settings.TX_POLL_TIMEOUT)
+
+    # SIGTERM: checkpoint at latest processed tx after current batch and exit, restart continues right after it
+    shutdown = threading.Event()
+
+    def request_shutdown(signum, frame):
+        shutdown.set()
+        logic.checkpoint_requested = True
+        if listener is not None:
+            listener.interrupt()
+
+    signal.signal(signal.SIGTERM, request_shutdown)
+
+    latest_lt, latest_hash = process_new_transaction(logic, latest_lt, latest_hash, feed=feed, shutdown=shutdown)
+
+    while not shutdown.is_set():
+        timers.dump_if_due()
+        if not new_transactions(latest_lt, latest_hash).exists():
+            wait()
+        else:
+            logger.info(f"Latest lt: {latest_lt}, {latest_hash}, got new txs")
+            new_latest_lt, new_latest_hash = process_new_transaction(logic, latest_lt, latest_hash, feed=feed,
+                                                                     shutdown=shutdown)
             if new_latest_hash != latest_hash:
                 logic.state.save_to_db()
             else:
-                sleep(1)
+                wait()
 
             latest_lt = new_latest_lt
             latest_hash = new_latest_hash
 
+    logger.info(f"Shutdown at lt: {latest_lt}, {latest_hash}")
+    logic.checkpoint()
+    logic.finalize()
+    logic.state.save_to_db()
+
+    if feed is not None:
+        feed.close()
+
+    logger.info(f"Stopped")
+
 
 class Command(BaseCommand):
     help = 'Start ton20 index'
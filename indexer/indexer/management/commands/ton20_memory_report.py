@@ -0,0 +1,80 @@
+import gc
+import random
+import tracemalloc
+from time import time
+
+from django.core.management import BaseCommand
+from loguru import logger
+
+from indexer.utils.wallet_store import AddressTable, TickWallets
+
+
+def synthetic_wallets(total_ticks, total_wallets, seed=0):
+    """Yields (tick, address, amount, txhash), popular addresses hold several ticks"""
+
+    rnd = random.Random(seed)
+    holders = [f"0:{rnd.getrandbits(256):064X}" for _ in range(total_wallets // 2 or 1)]
+
+    for i in range(total_wallets):
+        tick = f"tick{i % total_ticks}"
+        address = holders[rnd.randrange(len(holders))] if i % 2 else f"0:{rnd.getrandbits(256):064X}"
+        yield tick, address, rnd.getrandbits(64), f"{rnd.getrandbits(256):064X}"
+
+
+def build_dicts(rows):
+    wallets = {}
+    for tick, address, amount, txhash in rows:
+        wallets.setdefault(tick, {})[address] = {
+            'amount': amount,
+            'txhash': txhash
+        }
+
+    return wallets
+
+
+def build_compact(rows):
+    addresses = AddressTable()
+    wallets = {}
+    for tick, address, amount, txhash in rows:
+        if tick not in wallets:
+            wallets[tick] = TickWallets(addresses)
+
+        wallets[tick].set(address, amount, txhash)
+
+    return wallets
+
+
+def measure(builder, rows):
+    gc.collect()
+    tracemalloc.start()
+    t = time()
+    result = builder(rows)
+    elapsed = time() - t
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total = sum(len(i) for i in result.values())
+    del result
+    return current, elapsed, total
+
+
+class Command(BaseCommand):
+    help = 'Compare memory footprint of dict based and compact wallets store on synthetic state'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wallets', type=int, default=1000000)
+        parser.add_argument('--ticks', type=int, default=100)
+
+    def handle(self, *args, **options):
+        logger.info(f"Synthetic state: {options['ticks']} ticks, {options['wallets']} wallet rows")
+
+        # Rows are generated inside the measured block, so every string kept by the store is counted
+        report = []
+        for name, builder in [('dicts', build_dicts), ('compact', build_compact)]:
+            size, elapsed, total = measure(builder, synthetic_wallets(options['ticks'], options['wallets']))
+            report.append((name, size, elapsed, total))
+
+        base = report[0][1]
+        for name, size, elapsed, total in report:
+            self.stdout.write(f"{name:>8}: {size / 1024 / 1024:10.1f} MB, {size / max(total, 1):7.1f} B/wallet, "
+                              f"build {elapsed:6.2f}s, x{base / max(size, 1):.2f} smaller than dicts")
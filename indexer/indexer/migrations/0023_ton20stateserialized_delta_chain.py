@@ -0,0 +1,42 @@
+# Generated by Django 4.2.10 on 2026-10-18 13:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('indexer', '0022_remove_transactionstatus_indexer_tra_in_msg__cfd0ad_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ton20stateserialized',
+            name='base_state_hash',
+            field=models.CharField(max_length=67, null=True),
+        ),
+        migrations.AddField(
+            model_name='ton20stateserialized',
+            name='chain_seqno',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ton20stateserialized',
+            name='delta',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.AddField(
+            model_name='ton20stateserialized',
+            name='is_delta',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='ton20stateserialized',
+            name='state_boc',
+            field=models.TextField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='ton20stateserialized',
+            index=models.Index(fields=['base_state_hash', 'chain_seqno'], name='indexer_ton_base_st_3e38c2_idx'),
+        ),
+    ]
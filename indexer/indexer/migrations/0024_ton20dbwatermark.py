@@ -0,0 +1,20 @@
+# Generated by Django 4.2.10 on 2026-10-18 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('indexer', '0023_ton20stateserialized_delta_chain'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ton20DbWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_hash', models.CharField(max_length=67, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('indexer', '0024_ton20dbwatermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ton20TickStats',
+            fields=[
+                ('tick', models.OneToOneField(db_column='tick', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='stats', serialize=False, to='indexer.ton20tick')),
+                ('holders', models.BigIntegerField(default=0)),
+                ('supply', models.DecimalField(decimal_places=0, default=0, max_digits=78)),
+                ('progress', models.FloatField(default=0)),
+                ('mints', models.BigIntegerField(default=0)),
+                ('transfers', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['holders'], name='indexer_ton_holders_b1167e_idx'), models.Index(fields=['progress'], name='indexer_ton_progres_a2e8a3_idx')],
+            },
+        ),
+    ]
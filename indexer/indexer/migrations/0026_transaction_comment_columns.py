@@ -0,0 +1,51 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('indexer', '0025_ton20tickstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='comment_amt',
+            field=models.DecimalField(decimal_places=0, max_digits=78, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='comment_op',
+            field=models.CharField(max_length=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='comment_p',
+            field=models.CharField(max_length=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='comment_tick',
+            field=models.CharField(max_length=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='comment_to',
+            field=models.CharField(max_length=200, null=True),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='comment_valid',
+            field=models.BooleanField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('comment_valid', True)), fields=['in_msg_created_lt', 'in_msg_hash'], name='indexer_tra_valid_feed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('comment_valid', True)), fields=['comment_tick', 'comment_op'], name='indexer_tra_valid_tick_idx'),
+        ),
+    ]
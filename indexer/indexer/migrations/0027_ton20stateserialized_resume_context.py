@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-18 14:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('indexer', '0026_transaction_comment_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ton20stateserialized',
+            name='resume_context',
+            field=models.BinaryField(null=True),
+        ),
+    ]
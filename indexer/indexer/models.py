@@ -8,6 +8,11 @@ class LatestIndex(models.Model):
     seqno = models.BigIntegerField()
 
 
+class Ton20DbWatermark(models.Model):
+    # Latest applied transaction at which Ton20Wallet / Ton20Tick tables were saved
+    transaction_hash = models.CharField(max_length=67, null=True)
+
+
 class Transaction(models.Model):
     mc_ref_seqno = models.DecimalField(max_digits=78, decimal_places=0)
 
@@ -32,6 +37,14 @@ class Transaction(models.Model):
     in_msg_src_addr_workchain_id = models.IntegerField(null=True)
     in_msg_src_addr_address_hex = models.CharField(max_length=200, null=True)
 
+    # in_msg_comment parsed on index (tx_unpack.comment_columns), NULL for txs indexed before it
+    comment_valid = models.BooleanField(null=True)
+    comment_p = models.CharField(max_length=200, null=True)
+    comment_op = models.CharField(max_length=200, null=True)
+    comment_tick = models.CharField(max_length=200, null=True)
+    comment_amt = models.DecimalField(max_digits=78, decimal_places=0, null=True)
+    comment_to = models.CharField(max_length=200, null=True)
+
     def __repr__(self):
         return f"<Transaction hash='{self.transaction_hash}', gen_utime='{self.gen_utime}'>"
 
@@ -66,7 +79,13 @@ class Transaction(models.Model):
             'in_msg_value_grams': self.in_msg_value_grams,
             'in_msg_hash': self.in_msg_hash,
             'in_msg_src_addr_workchain_id': self.in_msg_src_addr_workchain_id,
-            'in_msg_src_addr_address_hex': self.in_msg_src_addr_address_hex
+            'in_msg_src_addr_address_hex': self.in_msg_src_addr_address_hex,
+            'comment_valid': self.comment_valid,
+            'comment_p': self.comment_p,
+            'comment_op': self.comment_op,
+            'comment_tick': self.comment_tick,
+            'comment_amt': self.comment_amt,
+            'comment_to': self.comment_to
         }
 
     class Meta:
@@ -79,6 +98,11 @@ class Transaction(models.Model):
             models.Index(fields=['root_hash']),
             models.Index(fields=['transaction_hash']),
             models.Index(fields=['mc_ref_seqno']),
+            # Valid ton-20 ops only, for replay & analytics over them without spam
+            models.Index(fields=['in_msg_created_lt', 'in_msg_hash'], condition=models.Q(comment_valid=True),
+                         name='indexer_tra_valid_feed_idx'),
+            models.Index(fields=['comment_tick', 'comment_op'], condition=models.Q(comment_valid=True),
+                         name='indexer_tra_valid_tick_idx'),
         ]
 
 
@@ -113,22 +137,67 @@ class Ton20StateSerialized(models.Model):
     state_hash = models.CharField(max_length=67, unique=True, primary_key=True)
     in_msg_created_lt = models.BigIntegerField()
     transaction_hash = models.CharField(max_length=67, unique=True)
-    state_boc = models.TextField()
+
+    # Full snapshot, empty for deltas
+    state_boc = models.TextField(null=True)
+
+    # Snapshot chain: full base snapshot (chain_seqno = 0) and deltas after it,
+    # each delta holds changed ticks & wallets and deleted wallets since previous chain item
+    is_delta = models.BooleanField(default=False)
+    base_state_hash = models.CharField(max_length=67, null=True)
+    chain_seqno = models.IntegerField(default=0)
+    delta = models.BinaryField(null=True)
+
+    # Checkpoint commit: sender window & count of COMMIT_STATE_EACH restored on resume (Ton20Logic.resume_context)
+    resume_context = models.BinaryField(null=True)
 
     class Meta:
         indexes = [
             models.Index(fields=['in_msg_created_lt']),
             models.Index(fields=['transaction_hash']),
+            models.Index(fields=['base_state_hash', 'chain_seqno']),
         ]
 
     def to_cell(self):
         from tonpy import Cell
         return Cell(self.state_boc)
 
+    def chain_deltas(self):
+        """Deltas from chain base up to this state"""
+        if not self.is_delta:
+            return Ton20StateSerialized.objects.none()
+
+        return Ton20StateSerialized.objects.filter(base_state_hash=self.base_state_hash, is_delta=True,
+                                                   chain_seqno__lte=self.chain_seqno).order_by('chain_seqno')
+
+    def rebuild_state_boc(self):
+        """Apply deltas of chain to base snapshot, result hash must be equal to stored state_hash"""
+        from indexer.utils.ton20state import Ton20State
+
+        base = Ton20StateSerialized.objects.get(state_hash=self.base_state_hash)
+
+        state = Ton20State(incremental_serialize=True)
+        state.load(base.state_boc)
+
+        last_tx = state.apply_deltas(self.chain_deltas())
+        cell = state.serialize(last_tx)
+        if cell.get_hash() != self.state_hash:
+            raise ValueError(f"Rebuilt state hash mismatch: {cell.get_hash()} != {self.state_hash}")
+
+        return cell.to_boc()
+
     @staticmethod
-    def get_latest_state():
+    def get_latest_state(with_boc=True):
+        """with_boc=False - only chain info of latest state, BOC is not loaded or rebuilt"""
         try:
+            if not with_boc:
+                return Ton20StateSerialized.objects.defer('state_boc', 'delta').order_by('-in_msg_created_lt').first()
+
             latest_state = Ton20StateSerialized.objects.order_by('-in_msg_created_lt').first()
+
+            if latest_state is not None and latest_state.is_delta:
+                latest_state.state_boc = latest_state.rebuild_state_boc()
+
             return latest_state
         except Ton20StateSerialized.DoesNotExist:
             return None
@@ -167,6 +236,28 @@ class Ton20Tick(models.Model):
         ordering = ['tick']
 
 
+class Ton20TickStats(models.Model):
+    # Counters of tick at latest committed state, saved in one transaction with its Ton20StateSerialized
+    # Ton20Tick rows are saved separately with dirty wallets, so there's no FK constraint
+    tick = models.OneToOneField(Ton20Tick, primary_key=True, related_name='stats', db_column='tick',
+                                on_delete=models.DO_NOTHING, db_constraint=False)
+    holders = models.BigIntegerField(default=0)
+
+    # Minted supply (max - rest) & its share of max
+    supply = models.DecimalField(max_digits=78, decimal_places=0, default=0)
+    progress = models.FloatField(default=0)
+
+    # Successful ops
+    mints = models.BigIntegerField(default=0)
+    transfers = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['holders']),
+            models.Index(fields=['progress']),
+        ]
+
+
 class Ton20Wallet(models.Model):
     wallet = models.CharField(max_length=78)
     tick = models.CharField(max_length=255)
@@ -1,13 +1,16 @@
 from rest_framework import serializers
-from .models import Ton20Tick, Ton20Wallet, TransactionStatus, Ton20StateSerialized
+from .models import Ton20Tick, Ton20Wallet, TransactionStatus, Ton20StateSerialized, Ton20TickStats
 
 
-class Ton20TickSerializer(serializers.ModelSerializer):
+class Ton20TickStatsSerializer(serializers.ModelSerializer):
     class Meta:
-        model = Ton20Tick
-        fields = '__all__'
+        model = Ton20TickStats
+        exclude = ['tick']
 
 class Ton20TickSerializer(serializers.ModelSerializer):
+    # Null until first commit after deploy of tick
+    stats = Ton20TickStatsSerializer(read_only=True)
+
     class Meta:
         model = Ton20Tick
         fields = '__all__'
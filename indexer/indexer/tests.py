@@ -1,3 +1,496 @@
-from django.test import TestCase
+import copy
+import gzip
+import random
+import tempfile
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import orjson as json
+from django.conf import settings
+from django.db import connection
+from django.test import SimpleTestCase, TransactionTestCase
+from tonpy import Cell
+
+from indexer.models import AccountCache, TransactionStatus, Ton20StateSerialized, Ton20Tick, Ton20TickStats, \
+    Ton20Wallet, Ton20DbWatermark
+from indexer.utils.ton20logic import Ton20Logic, BLOCK_LT
+from indexer.utils.ton20shards import ShardedTon20Logic
+from indexer.utils.state_image import write_state_image
+from indexer.utils.ton20state import Ton20State
+from indexer.utils.tx_decode import parse_comment
+from indexer.utils.tx_feed import FEED_FIELDS
+from indexer.utils.tx_parent import SuccessTxCache
+
+# Statuses, snapshots & final state hash of ton20_stream(seed=20, count=3000) from original Ton20Logic (770d5fc)
+ORIGINAL_STATUSES = settings.BASE_DIR / 'indexer' / 'data' / 'replay_statuses.json.gz'
+
+# Ton20Logic.initial_check switches sender checks at this in_msg_created_at
+CHANGE_POINT = 1701955800
+ZERO_ACCOUNT = '0' * 64
+
+# Txs per block, messages of one block share BLOCK_LT bucket
+BLOCK_TXS = 40
+
+# 'xyz' deploy of 'XyZ' already exists, 33 chars tick is > 256 bits
+TICKS = ['abc', 'XyZ', 'xyz', 'nano', 'q', 'x' * 33, 5]
+
+
+def random_comment(rnd, addresses) -> dict:
+    """Mix of valid & invalid ton-20 ops, op fields get wrong types and values too (but `to`, see convert_tx)"""
+
+    kind = rnd.random()
+    if kind < 0.05:
+        return rnd.choice([{}, {'p': 'brc-20', 'op': 'mint', 'tick': 'abc', 'amt': '1'},
+                           {'p': 'ton-20', 'op': 'burn', 'tick': 'abc'}, {'p': 'ton-20'}, {'op': 'mint'}])
+
+    if kind < 0.15:
+        comment = {'p': 'ton-20', 'op': 'deploy', 'tick': rnd.choice(TICKS),
+                   'max': rnd.choice(['100000', '5000', '300', '0', 'x', 7, str(2 ** 256)]),
+                   'lim': rnd.choice(['100', '1000', '0', 100])}
+    elif kind < 0.65:
+        comment = {'p': 'ton-20', 'op': 'mint', 'tick': rnd.choice(TICKS),
+                   'amt': rnd.choice(['1', '10', '100', '100', '1000', '0', '-5', 'abc', 10, str(2 ** 256)])}
+    else:
+        comment = {'p': 'ton-20', 'op': 'transfer', 'tick': rnd.choice(TICKS),
+                   'to': rnd.choice(addresses + ['bad', '0:1111']),
+                   'amt': rnd.choice(['1', '5', '50', '500', 'x', 5])}
+
+    if rnd.random() < 0.03:
+        comment.pop(rnd.choice(list(comment)[2:]), None)
+
+    return comment
+
+
+def ton20_stream(seed: int, count: int) -> tuple:
+    """
+    (rows, accounts, whitelist) of process_new_transaction rows ordered by lt
+
+    First quarter of txs is sent before change point, mostly to zero account: senders which are not good accounts
+    go through parent check, half of their txs are whitelisted. Senders repeat in block, so some exceed 4 messages.
+    """
+
+    rnd = random.Random(seed)
+    addresses = [f"0:{rnd.getrandbits(256):064X}" for _ in range(24)]
+
+    # 18 contract wallets, 3 other accounts, 3 blacklisted wallets
+    accounts = [AccountCache(address=address, is_contract_wallet=i < 18 or i >= 21, account_blacklist=i >= 21,
+                             smc_hash='0' * 64) for i, address in enumerate(addresses)]
+
+    rows = []
+    whitelist = []
+    sender = addresses[0]
+
+    for i in range(count):
+        if rnd.random() > 0.3:
+            sender = rnd.choice(addresses)
+
+        block = i // BLOCK_TXS
+        before_change = i < count // 4
+        to_zero = rnd.random() < (0.9 if before_change else 0.05)
+
+        row = dict.fromkeys(FEED_FIELDS)
+        row.update(mc_ref_seqno=1 + block, workchain=0, lt=10 ** 13 + i,
+                   account=ZERO_ACCOUNT if to_zero else f"{rnd.getrandbits(256):064X}",
+                   transaction_hash=f"{rnd.getrandbits(256):064X}",
+                   in_msg_comment=parse_comment(json.dumps(random_comment(rnd, addresses))),
+                   in_msg_created_lt=10 ** 13 + block * BLOCK_LT + i % BLOCK_TXS,
+                   in_msg_created_at=(CHANGE_POINT - 1000 if before_change else CHANGE_POINT + 1000) + block,
+                   in_msg_hash=f"{rnd.getrandbits(256):064X}",
+                   in_msg_src_addr_workchain_id=0, in_msg_src_addr_address_hex=sender.split(':')[1])
+        rows.append(row)
+
+        if before_change and rnd.random() < 0.5:
+            whitelist.append(row['transaction_hash'])
+
+    return rows, accounts, whitelist
+
+
+def state_steps(seed: int, steps: int, ops: int) -> list:
+    """
+    [(ops, last_tx), ...] of valid Ton20State deploys, mints & transfers, op is (method, *args)
+
+    Each step deploys a tick which never gets wallets and creates & empties one wallet, emptied wallets get refilled
+    """
+
+    rnd = random.Random(seed)
+    addresses = [f"{rnd.choice([0, -1])}:{rnd.getrandbits(256):064X}" for _ in range(40)]
+    balances = {}
+
+    def txhash():
+        return f"{rnd.getrandbits(256):064X}"
+
+    def transfer(tick, from_, to_, amt):
+        wallets = balances[tick]
+        wallets[from_] -= amt
+        if wallets[from_] == 0:
+            del wallets[from_]
+
+        wallets[to_] = wallets.get(to_, 0) + amt
+        return 'transfer', tick, from_, to_, amt, txhash()
+
+    def mint(tick, wallet, amt):
+        balances[tick][wallet] = balances[tick].get(wallet, 0) + amt
+        return 'mint', tick, wallet, amt, txhash()
+
+    result = []
+    for step in range(steps):
+        tick = f"t{step}"
+        balances[tick] = {}
+        batch = [('deploy', tick, 10 ** 9, 1000, rnd.choice(addresses), txhash()),
+                 ('deploy', f"empty{step}", 100, 10, rnd.choice(addresses), txhash())]
+
+        fresh = f"0:{rnd.getrandbits(256):064X}"
+        batch += [mint(tick, fresh, 7), transfer(tick, fresh, rnd.choice(addresses), 7)]
+
+        for _ in range(ops):
+            tick = rnd.choice(list(balances))
+            wallets = balances[tick]
+
+            if not wallets or rnd.random() < 0.4:
+                batch.append(mint(tick, rnd.choice(addresses), rnd.randint(1, 1000)))
+            else:
+                from_ = rnd.choice(list(wallets))
+                amt = wallets[from_] if rnd.random() < 0.3 else rnd.randint(1, wallets[from_])
+                batch.append(transfer(tick, from_, rnd.choice(addresses), amt))
+
+        result.append((batch, {'lt': 10 ** 13 + step, 'transaction_hash': txhash(), 'mc_ref_seqno': 1 + step}))
+
+    return result
+
+
+def apply_ops(state, ops):
+    for method, *args in ops:
+        getattr(state, method)(*args)
+
+
+def state_contents(state) -> tuple:
+    return state.ticks, {tick: sorted(wallets.items()) for tick, wallets in state.wallets.items()}
+
+
+@skipUnless(connection.vendor == 'postgresql', "Ton20Logic writes state & statuses with Postgres COPY")
+class Ton20ReplayTestCase(TransactionTestCase):
+    """
+    Replays of one tx stream must give the same statuses, snapshots, wallets & ticks however they are applied:
+    serially, in tick shards or resumed from checkpoint
+    """
+
+    def setUp(self):
+        self.rows, accounts, whitelist = ton20_stream(seed=20, count=3000)
+        AccountCache.objects.bulk_create(accounts)
+        self.whitelist = set(whitelist)
+        self.not_wallets = {i.address.split(':')[1] for i in accounts
+                            if not i.is_contract_wallet or i.account_blacklist}
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+
+        source = Path(tmp.name) / 'whitelist.data.gz'
+        with gzip.open(source, 'wb') as f:
+            f.write(repr(whitelist).encode())
+
+        whitelist_patch = mock.patch('indexer.utils.tx_parent.success_tx_cache',
+                                     SuccessTxCache(Path(tmp.name) / 'whitelist.bin', source))
+        whitelist_patch.start()
+        self.addCleanup(whitelist_patch.stop)
+
+    def wallet_tx(self, comment: dict, **fields) -> dict:
+        """Tx of contract wallet after change point, in block of latest tx of stream"""
+
+        sender = AccountCache.objects.filter(is_contract_wallet=True, account_blacklist=False).first().address
+        return dict(copy.deepcopy(self.rows[-1]), account='1' * 64, in_msg_src_addr_address_hex=sender.split(':')[1],
+                    in_msg_comment=comment, **fields)
+
+    @staticmethod
+    def clean():
+        for model in (TransactionStatus, Ton20StateSerialized, Ton20Tick, Ton20TickStats, Ton20Wallet):
+            model.objects.all().delete()
+
+    def replay(self, logic, rows, batch_size=200) -> dict:
+        for i in range(0, len(rows), batch_size):
+            logic.add_transactions(copy.deepcopy(rows[i:i + batch_size]))
+
+        result = {'ticks': copy.deepcopy(logic.state.ticks),
+                  'wallets': {tick: sorted(wallets.items()) for tick, wallets in logic.state.wallets.items()},
+                  'state_hash': logic.state.serialize(rows[-1]).get_hash()}
+        logic.finalize()
+        logic.state.save_to_db()
+
+        result['statuses'] = list(TransactionStatus.objects.order_by('in_msg_created_lt', 'transaction_hash')
+                                  .values_list('transaction_hash', 'success', 'fail_reason', 'op_code', 'tick',
+                                               'initiator', 'mint_amount', 'transfer_amount', 'transfer_to'))
+        result['snapshots'] = list(Ton20StateSerialized.objects.order_by('in_msg_created_lt')
+                                   .values_list('state_hash', 'transaction_hash'))
+        result['db_wallets'] = sorted(Ton20Wallet.objects.values_list('tick', 'wallet', 'amount'))
+        result['db_ticks'] = sorted(Ton20Tick.objects.values_list('tick', 'max', 'lim', 'rest'))
+
+        return result
+
+    def test_stream_covers_checks(self):
+        self.clean()
+        result = self.replay(Ton20Logic(commit_state_each_x_txs=250), self.rows)
+
+        self.assertEqual(len(result['statuses']), len(self.rows))
+        self.assertTrue(any(success for _, success, *_ in result['statuses']))
+
+        reasons = {reason.split(':')[0] for _, _, reason, *_ in result['statuses']}
+        for reason in ["Json is not valid", "TX sended >4 times", "TX sended not to zero account",
+                       "TX sended to zero account after change point", "TX sended not in wallet", "Already exist",
+                       "Tick too large", "Can't parse params", "Can't find", "Tick invalid", "Tick not found",
+                       "Can't parse amt", "Amt > limit of tick", "Tick not exist", "Out of money", "Can't parse to",
+                       "Tick is full", "Tick rest less amt"]:
+            self.assertTrue(any(i.startswith(reason) for i in reasons), reason)
+
+        # Before change point txs of other accounts to zero account pass sender checks only if parent is whitelisted
+        statuses = {tx_hash: reason for tx_hash, _, reason, *_ in result['statuses']}
+        parent_checked = [tx for tx in self.rows if tx['in_msg_created_at'] < CHANGE_POINT
+                          and tx['account'] == ZERO_ACCOUNT and tx['in_msg_src_addr_address_hex'] in self.not_wallets
+                          and statuses[tx['transaction_hash']] != "Json is not valid"]
+        self.assertTrue(parent_checked)
+
+        for tx in parent_checked:
+            self.assertEqual(tx['transaction_hash'] not in self.whitelist,
+                             statuses[tx['transaction_hash']] == "TX sended >4 times", tx['transaction_hash'])
+
+    def test_statuses_equal_original(self):
+        expected = json.loads(gzip.decompress(ORIGINAL_STATUSES.read_bytes()))
+        self.assertEqual((expected['seed'], expected['count']), (20, len(self.rows)))
+
+        self.clean()
+        result = self.replay(Ton20Logic(commit_state_each_x_txs=expected['commit_state_each_x_txs']), self.rows)
+
+        statuses = {tx_hash: list(status) for tx_hash, *status in result['statuses']}
+        self.assertEqual(len(statuses), len(expected['statuses']))
+        for tx, status in zip(self.rows, expected['statuses']):
+            self.assertEqual(statuses[tx['transaction_hash']], status, tx['transaction_hash'])
+
+        self.assertEqual([list(i) for i in result['snapshots'][:len(expected['snapshots'])]], expected['snapshots'])
+        self.assertEqual(result['state_hash'], expected['state_hash'])
+
+    def test_sharded_equals_serial(self):
+        self.clean()
+        serial = self.replay(Ton20Logic(commit_state_each_x_txs=250), self.rows)
+
+        for workers in (2, 3):
+            self.clean()
+            sharded = self.replay(ShardedTon20Logic(apply_workers=workers, commit_state_each_x_txs=250), self.rows)
+
+            for key in serial:
+                self.assertEqual(serial[key], sharded[key], f"{key} of {workers} shards")
+
+    def test_resume_from_checkpoint(self):
+        self.clean()
+        serial = self.replay(Ton20Logic(commit_state_each_x_txs=250), self.rows)
+
+        # Checkpoints land inside of count commit intervals & blocks, sender window is restored from them
+        self.clean()
+        start = 0
+        for stop in (430, 431, 1777, len(self.rows)):
+            logic = Ton20Logic(commit_state_each_x_txs=250)
+
+            state = Ton20StateSerialized.get_latest_state()
+            if state is not None:
+                logic.state.deserialize(state.state_boc, state.in_msg_created_lt, state.transaction_hash,
+                                        warm_restart=False, deltas=state.chain_deltas())
+                logic.set_latest_snapshot(state)
+
+            logic.add_transactions(copy.deepcopy(self.rows[start:stop]))
+            logic.checkpoint_requested = True
+            logic.checkpoint()
+            logic.finalize()
+            logic.state.save_to_db()
+            start = stop
+
+        self.assertEqual(serial['statuses'], list(
+            TransactionStatus.objects.order_by('in_msg_created_lt', 'transaction_hash')
+            .values_list('transaction_hash', 'success', 'fail_reason', 'op_code', 'tick', 'initiator', 'mint_amount',
+                         'transfer_amount', 'transfer_to')))
+        self.assertEqual(serial['db_wallets'], sorted(Ton20Wallet.objects.values_list('tick', 'wallet', 'amount')))
+        self.assertEqual(serial['state_hash'], Ton20StateSerialized.get_latest_state(with_boc=False).state_hash)
+
+    def test_delta_chain_equals_full_snapshots(self):
+        self.clean()
+        full = self.replay(Ton20Logic(commit_state_each_x_txs=250), self.rows)
+        full_bocs = dict(Ton20StateSerialized.objects.values_list('state_hash', 'state_boc'))
+
+        self.clean()
+        chained = self.replay(Ton20Logic(commit_state_each_x_txs=250, snapshot_full_each=3), self.rows)
+        self.assertEqual(full, chained)
+
+        deltas = Ton20StateSerialized.objects.filter(is_delta=True).order_by('in_msg_created_lt')
+        self.assertTrue(deltas.exists())
+
+        # Base with deltas applied is the same BOC as full snapshot at delta
+        for delta in deltas:
+            state_boc = delta.rebuild_state_boc()
+            self.assertEqual(Cell(state_boc).get_hash(), delta.state_hash)
+            self.assertEqual(state_boc, full_bocs[delta.state_hash])
+
+        latest = Ton20StateSerialized.get_latest_state()
+        self.assertEqual(Cell(latest.state_boc).get_hash(), latest.state_hash)
+
+    def test_image_load_syncs_tables_by_watermark(self):
+        steps = state_steps(seed=4, steps=2, ops=200)
+        state = Ton20State()
+        for ops, last_tx in steps:
+            apply_ops(state, ops)
+
+        cell = state.serialize(last_tx)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = Path(tmp.name) / 'state.img'
+        state.write_image(path, cell.get_hash(), last_tx, cell.to_boc())
+
+        self.clean()
+        Ton20DbWatermark.objects.all().delete()
+        Ton20State().deserialize(cell.to_boc(), last_tx['lt'], last_tx['transaction_hash'])
+        expected = sorted(Ton20Wallet.objects.values_list('tick', 'wallet', 'amount', 'txhash'))
+
+        # Tables of other tx are compared with image and fixed
+        tick, wallet, _, _ = expected[0]
+        Ton20Wallet.objects.filter(tick=tick, wallet=wallet).update(amount=1)
+        Ton20Wallet.objects.filter(tick=expected[1][0], wallet=expected[1][1]).delete()
+        Ton20Wallet.objects.create(tick=tick, wallet=f"0:{'F' * 64}", amount=5, txhash='0' * 64)
+        Ton20DbWatermark.objects.update(transaction_hash='0' * 64)
+
+        loaded = Ton20State(incremental_serialize=True)
+        loaded.deserialize(None, last_tx['lt'], last_tx['transaction_hash'], warm_restart=True, image_path=path)
+        self.assertEqual(sorted(Ton20Wallet.objects.values_list('tick', 'wallet', 'amount', 'txhash')), expected)
+        self.assertEqual(Ton20DbWatermark.objects.get().transaction_hash, last_tx['transaction_hash'])
+
+        # Tables at tx of image are trusted as is
+        Ton20Wallet.objects.filter(tick=tick, wallet=wallet).update(amount=1)
+        loaded = Ton20State(incremental_serialize=True)
+        loaded.deserialize(None, last_tx['lt'], last_tx['transaction_hash'], warm_restart=True, image_path=path)
+        self.assertEqual(Ton20Wallet.objects.get(tick=tick, wallet=wallet).amount, 1)
+        self.assertEqual(loaded.serialize(last_tx).get_hash(), cell.get_hash())
+
+    def test_sender_limit_per_block(self):
+        lt = self.rows[-1]['in_msg_created_lt']
+        rows = [self.wallet_tx({'p': 'ton-20', 'op': 'deploy', 'tick': 'lim', 'max': '100', 'lim': '1'},
+                               transaction_hash=f"{0:064X}", in_msg_created_lt=lt)]
+
+        # 5th & 6th messages of sender in block fail, next block resets counter
+        for i, created_lt in enumerate([lt + 1, lt + 2, lt + 3, lt + 4, lt + 5, lt + BLOCK_LT], start=1):
+            rows.append(self.wallet_tx({'p': 'ton-20', 'op': 'mint', 'tick': 'lim', 'amt': '1'},
+                                       transaction_hash=f"{i:064X}", in_msg_created_lt=created_lt))
+
+        for logic in (Ton20Logic(), ShardedTon20Logic(apply_workers=2)):
+            self.clean()
+            self.replay(logic, rows)
+
+            statuses = TransactionStatus.objects.order_by('in_msg_created_lt').values_list('success', 'fail_reason')
+            self.assertEqual([(success, reason.split(':')[0]) for success, reason in statuses],
+                             [(True, 'no')] * 4 + [(False, 'TX sended >4 times')] * 2 + [(True, 'no')])
+
+    def test_empty_tick_deploy_raises(self):
+        # Deploy check of empty tick raises after "Already exist" check, index stops on such tx
+        tx = self.wallet_tx({'p': 'ton-20', 'op': 'deploy', 'tick': '', 'max': '100', 'lim': '1'})
+
+        for logic, error in ((Ton20Logic(), ValueError), (ShardedTon20Logic(apply_workers=2), RuntimeError)):
+            self.clean()
+            try:
+                with self.assertRaises(error):
+                    logic.add_transactions([copy.deepcopy(tx)])
+            finally:
+                logic.finalize()
+
+
+class Ton20StateTestCase(SimpleTestCase):
+    """Every way to serialize & load Ton20State must give the same state hash as full serialize"""
+
+    def test_incremental_serialize_equals_full(self):
+        full = Ton20State()
+        incremental = Ton20State(incremental_serialize=True)
+        loaded = None
+
+        for i, (ops, last_tx) in enumerate(state_steps(seed=1, steps=6, ops=300)):
+            for state in (full, incremental, loaded):
+                if state is not None:
+                    apply_ops(state, ops)
+
+            cell = full.serialize(last_tx)
+            self.assertEqual(cell.get_hash(), incremental.serialize(last_tx).get_hash(), f"step {i}")
+
+            # Persistent dicts of state loaded from BOC are changed in place too
+            if loaded is None:
+                loaded = Ton20State(incremental_serialize=True)
+                loaded.load(cell.to_boc())
+            else:
+                self.assertEqual(cell.get_hash(), loaded.serialize(last_tx).get_hash(), f"loaded, step {i}")
+
+        # Serialize without changes keeps hash
+        self.assertEqual(cell.get_hash(), incremental.serialize(last_tx).get_hash())
+
+    def test_pooled_wallets_cells_equal_serial(self):
+        serial = Ton20State()
+        pooled = [Ton20State(serialize_workers=2), Ton20State(incremental_serialize=True, serialize_workers=2)]
+
+        try:
+            with mock.patch('indexer.utils.ton20state.PARALLEL_MIN_WALLETS', 1):
+                for i, (ops, last_tx) in enumerate(state_steps(seed=2, steps=3, ops=200)):
+                    for state in [serial] + pooled:
+                        apply_ops(state, ops)
+
+                    state_hash = serial.serialize(last_tx).get_hash()
+                    for state in pooled:
+                        self.assertEqual(state_hash, state.serialize(last_tx).get_hash(), f"step {i}")
+
+            for state in pooled:
+                self.assertIsNotNone(state.pool)
+        finally:
+            for state in pooled:
+                state.close()
+
+    def test_state_image_round_trip(self):
+        steps = state_steps(seed=3, steps=4, ops=200)
+        state = Ton20State()
+        for ops, last_tx in steps[:3]:
+            apply_ops(state, ops)
+
+        cell = state.serialize(last_tx)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = Path(tmp.name) / 'state.img'
+        state.write_image(path, cell.get_hash(), last_tx, cell.to_boc())
+
+        for incremental in (False, True):
+            loaded = Ton20State(incremental_serialize=incremental)
+            self.assertEqual(loaded.load_image(path), (last_tx['transaction_hash'], last_tx['lt'],
+                                                       last_tx['mc_ref_seqno']))
+            self.assertEqual(state_contents(loaded), state_contents(state))
+            self.assertEqual(loaded.serialize(last_tx).get_hash(), cell.get_hash())
+
+        # Ticks not touched after lazy load stay in image, both in next serialize and in next image
+        lazy = Ton20State(incremental_serialize=True)
+        lazy.load_image(path)
+
+        # Only ticks deployed by last step are changed
+        ops, last_tx = steps[3]
+        ops = [op for op in ops if op[1] in ('t3', 'empty3')]
+        for i in (state, lazy):
+            apply_ops(i, ops)
+
+        cell = state.serialize(last_tx)
+        self.assertEqual(lazy.wallets.pending, {'t0', 't1', 't2', 'empty0', 'empty1', 'empty2'})
+        self.assertEqual(lazy.serialize(last_tx).get_hash(), cell.get_hash())
+
+        path = Path(tmp.name) / 'next.img'
+        lazy.write_image(path, cell.get_hash(), last_tx, cell.to_boc())
+        loaded = Ton20State()
+        loaded.load_image(path)
+        self.assertEqual(state_contents(loaded), state_contents(state))
+        self.assertEqual(loaded.serialize(last_tx).get_hash(), cell.get_hash())
+
+    def test_state_image_rejects_long_fields(self):
+        tick = {'max': 1, 'lim': 1, 'rest': 1, 'deploy_by': f"0:{'A' * 64}", 'txhash': '0' * 64}
+        last_tx = {'lt': 1, 'transaction_hash': '0' * 64, 'mc_ref_seqno': 1}
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = Path(tmp.name) / 'state.img'
+
+        for ticks in ({'x' * 33: tick}, {'ы' * 17: tick}, {'x': dict(tick, deploy_by='0:' + 'A' * 79)}):
+            with self.assertRaises(ValueError):
+                write_state_image(path, '0' * 64, last_tx, '', ticks, lambda _: (0, b''))
+
+        self.assertFalse(path.exists())
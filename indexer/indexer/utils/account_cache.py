@@ -0,0 +1,123 @@
+from time import sleep
+
+from django.db import connection
+from loguru import logger
+
+from indexer.models import AccountCache
+
+# Max addresses per IN query of prefetch
+PREFETCH_CHUNK = 10000
+
+
+def address_key(address: str) -> bytes:
+    """33 bytes key of `wc:HEX` address: int8 workchain + 256 bit address"""
+
+    wc, address = address.split(':')
+    return int(wc).to_bytes(1, 'big', signed=True) + bytes.fromhex(address.zfill(64))
+
+
+class LinesWriter:
+    """File-like COPY TO STDOUT target, passes each complete line to callback"""
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.tail = ''
+
+    def write(self, data):
+        if isinstance(data, bytes):
+            data = data.decode()
+
+        lines = (self.tail + data).split('\n')
+        self.tail = lines.pop()
+
+        for line in lines:
+            self.callback(line)
+
+
+class AccountTypes:
+    """
+    Compact account types for sender checks:
+
+    good: keys of contract wallets which are not blacklisted, loaded on start
+    other: keys of other known accounts, filled by prefetch & lookups
+
+    Unknown account is requested from DB, rows are inserted by start_index, so missing one is retried before error
+    """
+
+    def __init__(self, retries=5, retry_delay=1.0):
+        self.good = set()
+        self.other = set()
+        self.retries = retries
+        self.retry_delay = retry_delay
+
+    def __len__(self):
+        return len(self.good) + len(self.other)
+
+    def load(self):
+        """Stream good accounts with COPY, without model instances"""
+
+        def add(line):
+            self.good.add(address_key(line))
+
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY (SELECT address FROM {AccountCache._meta.db_table} "
+                               f"WHERE is_contract_wallet AND NOT account_blacklist) TO STDOUT", LinesWriter(add))
+
+    def add(self, address: str, is_contract_wallet: bool, account_blacklist: bool):
+        key = address_key(address)
+
+        if is_contract_wallet and not account_blacklist:
+            self.good.add(key)
+            self.other.discard(key)
+        else:
+            self.other.add(key)
+
+    def is_known(self, address: str) -> bool:
+        key = address_key(address)
+        return key in self.good or key in self.other
+
+    def fetch(self, addresses):
+        """One IN query per chunk, returns count of found rows"""
+
+        found = 0
+        addresses = list(addresses)
+
+        for i in range(0, len(addresses), PREFETCH_CHUNK):
+            for row in AccountCache.objects.filter(address__in=addresses[i:i + PREFETCH_CHUNK]) \
+                    .values_list('address', 'is_contract_wallet', 'account_blacklist'):
+                self.add(*row)
+                found += 1
+
+        return found
+
+    def prefetch(self, addresses):
+        """Load all unknown of addresses at once, missing ones stay unknown until lookup"""
+
+        unknown = {address for address in addresses if not self.is_known(address)}
+
+        if unknown:
+            self.fetch(unknown)
+
+    def __getitem__(self, address: str) -> bool:
+        """Is address contract wallet and not blacklisted"""
+
+        key = address_key(address)
+
+        for attempt in range(self.retries + 2):
+            if key in self.good:
+                return True
+
+            if key in self.other:
+                return False
+
+            if attempt > self.retries:
+                break
+
+            if attempt:
+                logger.warning(f"Account {address} is not in AccountCache yet, retry {attempt} / {self.retries}")
+                sleep(self.retry_delay)
+
+            self.fetch([address])
+
+        raise ValueError(f"Account {address} is not in AccountCache after {self.retries} retries, "
+                         f"start_index must insert it before ton20 index reaches its transactions")
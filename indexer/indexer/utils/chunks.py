@@ -1,3 +0,0 @@
-def chunks(data, size=1000):
-    for i in range(0, len(data), size):
-        yield data[i:i + size]
\ No newline at end of file
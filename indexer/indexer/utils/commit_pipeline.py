@@ -0,0 +1,214 @@
+import threading
+from queue import Queue
+from time import time
+
+from django.db import connection, transaction
+from loguru import logger
+from tonpy import VmDict
+
+from indexer.models import Ton20StateSerialized
+from indexer.utils.status_sink import StatusSink
+from indexer.utils.tick_stats import save_tick_stats
+from indexer.utils.stage_timers import timers
+from indexer.utils.ton20cells import tick_key, wallet_key, wallet_value, tick_header, state_cell, tick_wallets_dict, \
+    delete_wallet
+from indexer.utils.ton20state import changes_delta, encode_delta
+
+# Fields of commit tx used by state cell, delta & Ton20StateSerialized
+LAST_TX_FIELDS = ['lt', 'transaction_hash', 'mc_ref_seqno', 'in_msg_created_lt']
+
+
+def snapshot_row(state_hash, last_tx, base_state_hash, chain_seqno=0, state_boc=None,
+                 delta=None, resume_context=None) -> Ton20StateSerialized:
+    """Full snapshot with state_boc or delta of snapshot chain started at base_state_hash"""
+
+    if delta is None:
+        return Ton20StateSerialized(state_hash=state_hash,
+                                    in_msg_created_lt=int(last_tx['in_msg_created_lt']),
+                                    transaction_hash=last_tx['transaction_hash'],
+                                    state_boc=state_boc,
+                                    base_state_hash=base_state_hash,
+                                    resume_context=resume_context)
+
+    return Ton20StateSerialized(state_hash=state_hash,
+                                in_msg_created_lt=int(last_tx['in_msg_created_lt']),
+                                transaction_hash=last_tx['transaction_hash'],
+                                is_delta=True,
+                                base_state_hash=base_state_hash,
+                                chain_seqno=chain_seqno,
+                                delta=encode_delta(delta),
+                                resume_context=resume_context)
+
+
+class CommitJob:
+    """Frozen changes & tick stats rows of one commit, state_hash & state_boc (of full snapshot) are set by worker"""
+
+    def __init__(self, changes: dict, last_tx: dict, stats_rows: list, chain_seqno: int, status_mark: int,
+                 resume_context=None):
+        self.changes = changes
+        self.resume_context = resume_context
+        self.stats_rows = stats_rows
+        self.last_tx = last_tx
+        self.chain_seqno = chain_seqno
+        self.status_mark = status_mark
+        self.state_hash = None
+        self.state_boc = None
+
+
+class CommitPipeline:
+    """
+    Commits of Ton20Logic in background thread:
+
+    - commit point freezes changes since previous commit (Ton20State.freeze), txs are applied further right away
+    - thread owns persistent ticks & wallets dicts, applies frozen changes to them, serializes state
+      and saves Ton20StateSerialized with its own DB connection
+    - at most max_in_flight commits wait for thread, submit blocks while they are written
+
+    State hash is durable once its Ton20StateSerialized is saved together with Ton20TickStats, TransactionStatus
+    rows of its txs are committed before it. Commits are saved in order, so restart always continues from durable state.
+    Error of thread is raised on next submit / flush.
+    """
+
+    def __init__(self, status_sink: StatusSink, ticks_dict: VmDict, stored_ticks, base_state_hash=None,
+                 chain_seqno=0, snapshot_full_each=1, max_in_flight=2):
+        self.status_sink = status_sink
+
+        # Owned by thread: ticks_dict has stored_ticks at start, their wallets dicts are taken from it on first change
+        self.ticks_dict = ticks_dict
+        self.stored_ticks = set(stored_ticks)
+        self.wallets_dicts = {}
+        self.base_state_hash = base_state_hash
+
+        # Snapshot chain position of latest submitted commit
+        self.has_base = base_state_hash is not None
+        self.chain_seqno = chain_seqno
+        self.snapshot_full_each = snapshot_full_each
+
+        self.queue = Queue(maxsize=max_in_flight)
+        self.thread = None
+        self.error = None
+
+        # (state_hash, transaction_hash) of latest durable state
+        self.durable = None
+
+    def submit(self, changes: dict, last_tx, stats_rows=(), resume_context=None) -> CommitJob:
+        self.raise_error()
+
+        if self.has_base and self.chain_seqno + 1 < self.snapshot_full_each:
+            self.chain_seqno += 1
+        else:
+            self.chain_seqno = 0
+        self.has_base = True
+
+        job = CommitJob(changes, {field: last_tx[field] for field in LAST_TX_FIELDS}, stats_rows,
+                        self.chain_seqno, self.status_sink.mark(), resume_context)
+
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='commit-pipeline', daemon=True)
+            self.thread.start()
+
+        self.queue.put(job)
+        return job
+
+    def in_flight(self) -> int:
+        return self.queue.unfinished_tasks
+
+    def flush(self):
+        """Wait till all submitted commits are durable"""
+
+        self.queue.join()
+        self.raise_error()
+
+    def raise_error(self):
+        if self.error is not None:
+            raise RuntimeError(f"State commit failed: {self.error}") from self.error
+
+    def run(self):
+        try:
+            while True:
+                job = self.queue.get()
+
+                try:
+                    if job is None:
+                        break
+
+                    # After failure commits are dropped, restart continues from latest durable state
+                    if self.error is None:
+                        self.save(job)
+                except Exception as e:
+                    logger.error(f"State commit failed: {e}")
+                    self.error = e
+                finally:
+                    self.queue.task_done()
+        finally:
+            connection.close()
+
+    def apply_changes(self, changes: dict):
+        """Set changed ticks & wallets to persistent dicts, returns root of ticks dict"""
+
+        for tick, (max_, lim_, rest_, deploy_by, txhash) in changes['ticks'].items():
+            wallets_dict = self.wallets_dicts.get(tick)
+            if wallets_dict is None:
+                if tick in self.stored_ticks:
+                    wallets_dict = tick_wallets_dict(self.ticks_dict, tick)
+                else:
+                    wallets_dict = VmDict(264, False)
+
+                self.wallets_dicts[tick] = wallets_dict
+
+            for wallet, amount, wallet_txhash in changes['wallets'].get(tick, ()):
+                wallets_dict.set_builder_keycs(wallet_key(wallet), wallet_value(amount, wallet_txhash))
+
+            for wallet in changes['deleted'].get(tick, ()):
+                delete_wallet(wallets_dict, wallet)
+
+            wallets_cell = wallets_dict.get_cell() if changes['sizes'][tick] > 0 else None
+            self.ticks_dict[tick_key(tick)] = tick_header({'max': max_, 'lim': lim_, 'rest': rest_,
+                                                           'deploy_by': deploy_by, 'txhash': txhash}, wallets_cell)
+
+        return self.ticks_dict.get_cell()
+
+    def save(self, job: CommitJob):
+        t = time()
+        serialized_state = state_cell(job.last_tx, self.apply_changes(job.changes))
+        job.state_hash = serialized_state.get_hash()
+        serialize_time = time() - t
+        timers.add('commit.worker.serialize', serialize_time)
+
+        if job.chain_seqno == 0:
+            self.base_state_hash = job.state_hash
+            job.state_boc = serialized_state.to_boc()
+            total_state = snapshot_row(job.state_hash, job.last_tx, self.base_state_hash, state_boc=job.state_boc,
+                                       resume_context=job.resume_context)
+        else:
+            total_state = snapshot_row(job.state_hash, job.last_tx, self.base_state_hash, job.chain_seqno,
+                                       delta=changes_delta(job.changes, job.last_tx),
+                                       resume_context=job.resume_context)
+
+        t = time()
+        self.status_sink.wait(job.status_mark)
+        status_time = time() - t
+        timers.add('commit.worker.status_wait', status_time)
+
+        t = time()
+        with transaction.atomic():
+            total_state.save()
+            save_tick_stats(job.stats_rows)
+        timers.add('commit.worker.save', time() - t)
+
+        self.durable = (job.state_hash, job.last_tx['transaction_hash'])
+
+        logger.info(f"State {job.state_hash} is durable at tx: {job.last_tx['transaction_hash']}, "
+                    f"serialize: {serialize_time:.2f}s, wait TransactionStatus: {status_time:.2f}s, "
+                    f"save: {time() - t:.2f}s")
+
+    def close(self):
+        """Flush and stop background thread"""
+
+        try:
+            self.flush()
+        finally:
+            if self.thread is not None:
+                self.queue.put(None)
+                self.thread.join()
+                self.thread = None
@@ -0,0 +1,235 @@
+from itertools import chain
+from struct import Struct
+from time import time
+
+from django.db import connection
+from loguru import logger
+
+# PGCOPY binary format: signature, flags, header extension length
+BINARY_HEADER = b'PGCOPY\n\xff\r\n\x00' + Struct('>ii').pack(0, 0)
+BINARY_TRAILER = Struct('>h').pack(-1)
+
+FIELD_COUNT = Struct('>h')
+FIELD_LENGTH = Struct('>i')
+NULL = FIELD_LENGTH.pack(-1)
+
+INT4 = Struct('>i')
+INT8 = Struct('>q')
+FLOAT8 = Struct('>d')
+
+# Rows per chunk handed to COPY
+ROWS_PER_CHUNK = 1000
+
+
+class IteratorFile:
+    """File-like object over iterator of bytes chunks, used as COPY FROM STDIN source without full buffer in memory"""
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.buffer = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                break
+
+            self.buffer += chunk
+
+        if size < 0:
+            data, self.buffer = self.buffer, b''
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+
+        return data
+
+
+def encode_text(value) -> bytes:
+    return str(value).encode()
+
+
+def encode_bool(value) -> bytes:
+    return b'\x01' if value else b'\x00'
+
+
+def encode_int4(value) -> bytes:
+    return INT4.pack(value)
+
+
+def encode_int8(value) -> bytes:
+    return INT8.pack(value)
+
+
+def encode_float8(value) -> bytes:
+    return FLOAT8.pack(value)
+
+
+def encode_bytea(value) -> bytes:
+    return bytes(value)
+
+
+def encode_numeric(value) -> bytes:
+    """Integer as numeric: base 10000 digits, weight of first digit, sign, dscale"""
+
+    value = int(value)
+    sign = 0x4000 if value < 0 else 0
+    value = str(abs(value))
+
+    head = len(value) % 4 or 4
+    digits = [int(value[:head])] + [int(value[i:i + 4]) for i in range(head, len(value), 4)]
+    weight = len(digits) - 1
+
+    while digits and digits[-1] == 0:
+        digits.pop()
+
+    if not digits:
+        weight = 0
+
+    return Struct(f'>hhhh{len(digits)}h').pack(len(digits), weight, sign, 0, *digits)
+
+
+ENCODERS = {
+    'CharField': encode_text,
+    'TextField': encode_text,
+    'BooleanField': encode_bool,
+    'IntegerField': encode_int4,
+    'AutoField': encode_int4,
+    'BigIntegerField': encode_int8,
+    'BigAutoField': encode_int8,
+    'DecimalField': encode_numeric,
+    'FloatField': encode_float8,
+    'BinaryField': encode_bytea,
+}
+
+
+def model_encoders(model, columns):
+    fields = {field.column: field for field in model._meta.fields}
+
+    # Relation column has type of its target field
+    fields = {column: field.target_field if field.is_relation else field for column, field in fields.items()}
+    return [ENCODERS[fields[column].get_internal_type()] for column in columns]
+
+
+def binary_row(row, encoders) -> bytes:
+    """One row (tuple in columns order) in binary COPY format"""
+
+    fields = [FIELD_COUNT.pack(len(encoders))]
+
+    for value, encode in zip(row, encoders):
+        if value is None:
+            fields.append(NULL)
+        else:
+            data = encode(value)
+            fields.append(FIELD_LENGTH.pack(len(data)))
+            fields.append(data)
+
+    return b''.join(fields)
+
+
+def binary_chunks(rows, encoders, counter):
+    chunk = []
+
+    for row in rows:
+        chunk.append(binary_row(row, encoders))
+
+        counter[0] += 1
+        if counter[0] % ROWS_PER_CHUNK == 0:
+            yield b''.join(chunk)
+            chunk = []
+
+    yield b''.join(chunk)
+
+
+def copy_encoded(cursor, table, columns, chunks):
+    """Stream already encoded rows (iterable of bytes) into table with binary COPY"""
+
+    data = chain([BINARY_HEADER], chunks, [BINARY_TRAILER])
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT binary)", IteratorFile(data))
+
+
+def copy_binary(cursor, table, columns, encoders, rows) -> int:
+    """Stream rows (tuples in columns order) into table with binary COPY, returns rows count"""
+
+    counter = [0]
+    copy_encoded(cursor, table, columns, binary_chunks(rows, encoders, counter))
+    return counter[0]
+
+
+def staged_upsert(model, columns, conflict_fields, update_fields, copy) -> int:
+    """
+    Upsert into model table over temp staging table: copy(cursor, stage table) fills it and returns rows count,
+    then one INSERT ... SELECT ... ON CONFLICT. Empty update_fields means DO NOTHING.
+    """
+
+    table = model._meta.db_table
+    stage = f"{table}_stage"
+    columns_str = ', '.join(columns)
+
+    if update_fields:
+        action = "DO UPDATE SET " + ', '.join(f"{field}=EXCLUDED.{field}" for field in update_fields)
+    else:
+        action = "DO NOTHING"
+
+    t = time()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {stage}")
+        cursor.execute(f"CREATE TEMP TABLE {stage} AS SELECT {columns_str} FROM {table} WITH NO DATA")
+        count = copy(cursor, stage)
+
+        cursor.execute(f"""
+            INSERT INTO {table} ({columns_str}) SELECT {columns_str} FROM {stage}
+            ON CONFLICT ({', '.join(conflict_fields)}) {action}
+        """)
+        cursor.execute(f"DROP TABLE {stage}")
+
+    elapsed = time() - t
+    if count:
+        logger.info(f"Upsert {table}: {count} rows at: {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} rows/s)")
+
+    return count
+
+
+def copy_upsert(model, columns, conflict_fields, update_fields, rows) -> int:
+    """Upsert rows (tuples in columns order) into model table, rows must be unique by conflict_fields"""
+
+    encoders = model_encoders(model, columns)
+
+    return staged_upsert(model, columns, conflict_fields, update_fields,
+                         lambda cursor, stage: copy_binary(cursor, stage, columns, encoders, rows))
+
+
+def copy_update(model, columns, key_fields, rows) -> int:
+    """Update columns of existing rows (tuples in columns order, key_fields are among columns) over staging table"""
+
+    table = model._meta.db_table
+    stage = f"{table}_stage"
+    encoders = model_encoders(model, columns)
+    update_fields = [column for column in columns if column not in key_fields]
+
+    t = time()
+    with connection.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {stage}")
+        cursor.execute(f"CREATE TEMP TABLE {stage} AS SELECT {', '.join(columns)} FROM {table} WITH NO DATA")
+        count = copy_binary(cursor, stage, columns, encoders, rows)
+
+        cursor.execute(f"""
+            UPDATE {table} SET {', '.join(f"{field}={stage}.{field}" for field in update_fields)} FROM {stage}
+            WHERE {' AND '.join(f"{table}.{field}={stage}.{field}" for field in key_fields)}
+        """)
+        cursor.execute(f"DROP TABLE {stage}")
+
+    elapsed = time() - t
+    if count:
+        logger.info(f"Update {table}: {count} rows at: {elapsed:.2f}s ({count / max(elapsed, 1e-9):.0f} rows/s)")
+
+    return count
+
+
+def copy_upsert_encoded(model, columns, conflict_fields, update_fields, rows: list) -> int:
+    """Upsert list of rows encoded with binary_row"""
+
+    def copy(cursor, stage):
+        copy_encoded(cursor, stage, columns, rows)
+        return len(rows)
+
+    return staged_upsert(model, columns, conflict_fields, update_fields, copy)
@@ -0,0 +1,13 @@
+import os
+
+
+def run_shard_worker(conn):
+    """Spawn target of shard workers: sets up Django before importing models used by ops & state"""
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tonano.settings")
+    import django
+
+    django.setup()
+
+    from indexer.utils.ton20shards import shard_worker
+    shard_worker(conn)
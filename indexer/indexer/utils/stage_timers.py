@@ -0,0 +1,92 @@
+from time import perf_counter, time
+
+from django.conf import settings
+from loguru import logger
+
+# Histogram bucket i counts items of [2^(i-1), 2^i) microseconds, last bucket is open
+BUCKETS = 32
+
+
+class StageTimers:
+    """
+    Time & count of hot path stages: {stage: [count, total seconds, max seconds, histogram]}
+
+    add() is a few list operations, call sites measure with perf_counter pairs. Stage is written by one thread only,
+    commit worker uses own `commit.worker.*` stages.
+    """
+
+    def __init__(self, enabled=True, dump_each=0):
+        self.enabled = enabled
+        self.stages = {}
+
+        # Log report each dump_each seconds from dump_if_due, 0 - only on explicit dump
+        self.dump_each = dump_each
+        self.dumped_at = time()
+        self.dump_requested = False
+
+    def add(self, stage: str, elapsed: float, count=1):
+        """elapsed of count items, histogram gets average of item"""
+
+        if not self.enabled:
+            return
+
+        data = self.stages.get(stage)
+        if data is None:
+            data = self.stages[stage] = [0, 0.0, 0.0, [0] * BUCKETS]
+
+        data[0] += count
+        data[1] += elapsed
+        if elapsed > data[2]:
+            data[2] = elapsed
+
+        if count:
+            data[3][min(int(elapsed / count * 1e6).bit_length(), BUCKETS - 1)] += count
+
+    def reset(self):
+        self.stages = {}
+
+    @staticmethod
+    def percentile(histogram, count, p) -> float:
+        """Upper bound of bucket with p-th percentile item, seconds"""
+
+        rank = count * p / 100
+        seen = 0
+        for i, items in enumerate(histogram):
+            seen += items
+            if items and seen >= rank:
+                return (1 << i) / 1e6
+
+        return (1 << (BUCKETS - 1)) / 1e6
+
+    def snapshot(self) -> dict:
+        """{stage: {count, total, avg, p50, p99, max}}, seconds"""
+
+        return {stage: {'count': count,
+                        'total': total,
+                        'avg': total / count if count else 0.0,
+                        'p50': self.percentile(histogram, count, 50),
+                        'p99': self.percentile(histogram, count, 99),
+                        'max': top}
+                for stage, (count, total, top, histogram) in sorted(self.stages.items())}
+
+    def report(self) -> list:
+        return [f"{stage:>28}: {data['count']:>10}, total {data['total']:9.2f}s, avg {data['avg'] * 1e6:9.1f} us, "
+                f"p50 <{data['p50'] * 1e6:9.0f} us, p99 <{data['p99'] * 1e6:9.0f} us, max {data['max'] * 1e6:11.0f} us"
+                for stage, data in self.snapshot().items()]
+
+    def dump(self):
+        logger.info("Stage timers:\n" + "\n".join(self.report()))
+        self.dumped_at = time()
+        self.dump_requested = False
+
+    def request_dump(self):
+        """Safe to call from signal handler, report is logged by next dump_if_due"""
+
+        self.dump_requested = True
+
+    def dump_if_due(self):
+        if self.dump_requested or (self.enabled and self.dump_each and time() - self.dumped_at >= self.dump_each):
+            self.dump()
+
+
+timers = StageTimers(settings.STAGE_TIMERS, settings.STAGE_TIMERS_DUMP_EACH)
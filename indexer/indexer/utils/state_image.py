@@ -0,0 +1,166 @@
+import mmap
+import os
+import struct
+from bisect import bisect_left
+
+# Flat state image, little endian:
+#
+# header: magic, version, state_hash (hex), last_tx_hash, last_tx_lt, master_ref_seqno,
+#         ticks count, wallets count, state BOC length
+# ticks: fixed width records sorted by utf8 tick, each points to its wallets range
+# wallets: fixed width records, sorted by (wc, address) inside of each tick
+# state BOC: base64 BOC of same state
+MAGIC = b'TON20IMG'
+VERSION = 1
+
+# Widths of tick & deploy_by fields of tick record, longer values would be cut by struct
+TICK_BYTES = 32
+DEPLOY_BY_BYTES = 80
+
+HEADER = struct.Struct('<8sI64s32sQIQQQ')
+TICK = struct.Struct(f'<B{TICK_BYTES}s32s32s32s{DEPLOY_BY_BYTES}s32sQQ')
+WALLET = struct.Struct('<b32s32s32s')
+
+
+def state_image_path(directory: str, state_hash: str) -> str:
+    return os.path.join(directory, f"{state_hash}.img")
+
+
+def wallet_record(wallet: str, amount: int, txhash: bytes) -> bytes:
+    wc, address = wallet.split(':')
+    return WALLET.pack(int(wc), bytes.fromhex(address.zfill(64)), amount.to_bytes(32, 'big'), txhash)
+
+
+def write_state_image(path: str, state_hash: str, last_tx, state_boc: str, ticks: dict, wallet_records):
+    """
+    ticks: {tick: {'max', 'lim', 'rest', 'deploy_by', 'txhash'}}
+    wallet_records: callable(tick) -> (count, bytes of sorted wallet records)
+
+    Image is written to temporary file and moved in place, so readers never see partial image
+    """
+
+    for tick, data in ticks.items():
+        if len(tick.encode()) > TICK_BYTES:
+            raise ValueError(f"Tick is longer than {TICK_BYTES} bytes: {tick}")
+
+        if len(data['deploy_by'].encode()) > DEPLOY_BY_BYTES:
+            raise ValueError(f"deploy_by of {tick} is longer than {DEPLOY_BY_BYTES} bytes: {data['deploy_by']}")
+
+    boc = state_boc.encode()
+    sorted_ticks = sorted(ticks, key=lambda x: x.encode())
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        records = []
+        first_wallet = 0
+
+        f.seek(HEADER.size + TICK.size * len(sorted_ticks))
+        for tick in sorted_ticks:
+            count, data = wallet_records(tick)
+            f.write(data)
+            records.append((tick, first_wallet, count))
+            first_wallet += count
+
+        f.write(boc)
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, state_hash.encode(), bytes.fromhex(last_tx['transaction_hash'].zfill(64)),
+                            int(last_tx['lt']), int(last_tx['mc_ref_seqno']), len(sorted_ticks), first_wallet,
+                            len(boc)))
+
+        for tick, first, count in records:
+            data = ticks[tick]
+            tick_bytes = tick.encode()
+            f.write(TICK.pack(len(tick_bytes), tick_bytes, data['max'].to_bytes(32, 'big'),
+                              data['lim'].to_bytes(32, 'big'), data['rest'].to_bytes(32, 'big'),
+                              data['deploy_by'].encode(), bytes.fromhex(data['txhash']), first, count))
+
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp_path, path)
+
+
+class StateImage:
+    """Read only memory-mapped state image"""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, state_hash, last_tx_hash, last_tx_lt, master_ref_seqno, ticks_count, wallets_count, \
+            boc_length = HEADER.unpack_from(self.mmap, 0)
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Not a state image: {path}")
+
+        self.state_hash = state_hash.decode()
+        self.last_tx_hash = last_tx_hash.hex().upper()
+        self.last_tx_lt = last_tx_lt
+        self.master_ref_seqno = master_ref_seqno
+
+        self.wallets_offset = HEADER.size + TICK.size * ticks_count
+        self.boc_offset = self.wallets_offset + WALLET.size * wallets_count
+        self.boc_length = boc_length
+
+        # {tick: (tick data, first wallet, wallets count)}
+        self.ticks = {}
+        for i in range(ticks_count):
+            tick_len, tick, max_, lim_, rest_, deploy_by, txhash, first, count = \
+                TICK.unpack_from(self.mmap, HEADER.size + TICK.size * i)
+
+            tick = tick[:tick_len].decode()
+            self.ticks[tick] = ({
+                'max': int.from_bytes(max_, 'big'),
+                'lim': int.from_bytes(lim_, 'big'),
+                'rest': int.from_bytes(rest_, 'big'),
+                'deploy_by': deploy_by.rstrip(b'\x00').decode(),
+                'txhash': txhash.hex().upper()
+            }, first, count)
+
+    def state_boc(self) -> str:
+        return self.mmap[self.boc_offset:self.boc_offset + self.boc_length].decode()
+
+    def wallet_records(self, tick: str):
+        """(count, raw sorted wallet records) of tick"""
+
+        _, first, count = self.ticks[tick]
+        start = self.wallets_offset + WALLET.size * first
+        return count, self.mmap[start:start + WALLET.size * count]
+
+    def iter_wallets(self, tick: str):
+        """Yields (address, amount, raw txhash)"""
+
+        _, first, count = self.ticks[tick]
+        start = self.wallets_offset + WALLET.size * first
+
+        for wc, address, amount, txhash in WALLET.iter_unpack(self.mmap[start:start + WALLET.size * count]):
+            yield f"{wc}:{address.hex().upper()}", int.from_bytes(amount, 'big'), txhash
+
+    def lookup(self, tick: str, wallet: str):
+        """Binary search of wallet in tick, returns (amount, txhash) or None"""
+
+        if tick not in self.ticks:
+            return None
+
+        _, first, count = self.ticks[tick]
+        start = self.wallets_offset + WALLET.size * first
+        key = wallet_record(wallet, 0, bytes(32))[:33]
+
+        class Keys:
+            def __len__(_):
+                return count
+
+            def __getitem__(_, i):
+                offset = start + WALLET.size * i
+                return self.mmap[offset:offset + 33]
+
+        i = bisect_left(Keys(), key)
+        if i == count or Keys()[i] != key:
+            return None
+
+        _, _, amount, txhash = WALLET.unpack_from(self.mmap, start + WALLET.size * i)
+        return int.from_bytes(amount, 'big'), txhash.hex().upper()
+
+    def close(self):
+        self.mmap.close()
@@ -0,0 +1,121 @@
+import threading
+from queue import Queue
+
+from django.db import connection
+from loguru import logger
+
+from indexer.models import TransactionStatus
+from indexer.utils.pgcopy import binary_row, copy_upsert_encoded, model_encoders
+
+STATUS_COLUMNS = [field.column for field in TransactionStatus._meta.fields]
+
+
+class StatusSink:
+    """
+    Streams TransactionStatus rows to DB:
+
+    - each row is encoded to binary COPY format on add, no list of dicts is kept till commit
+    - full chunks are written by background thread with its own DB connection
+    - at most max_chunks wait for the thread, add blocks while they are written, so memory doesn't depend on commit size
+
+    Chunks are upserted with DO NOTHING, statuses of txs replayed after restart are skipped
+    """
+
+    def __init__(self, chunk_rows=10000, max_chunks=2):
+        self.chunk_rows = chunk_rows
+        self.encoders = model_encoders(TransactionStatus, STATUS_COLUMNS)
+        self.chunk = []
+        self.queue = Queue(maxsize=max_chunks)
+        self.thread = None
+        self.error = None
+        self.written = 0
+
+        # Chunks pushed to thread & chunks done by it, see mark / wait
+        self.pushed = 0
+        self.done = 0
+        self.done_changed = threading.Condition()
+
+    def add(self, status: dict):
+        self.raise_error()
+
+        # None & empty strings are NULL, same as CSV COPY of pandas rendered rows
+        self.chunk.append(binary_row([None if status[column] == '' else status[column] for column in STATUS_COLUMNS],
+                                     self.encoders))
+
+        if len(self.chunk) >= self.chunk_rows:
+            self.push()
+
+    def push(self):
+        if not self.chunk:
+            return
+
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name='status-sink', daemon=True)
+            self.thread.start()
+
+        self.queue.put(self.chunk)
+        self.chunk = []
+        self.pushed += 1
+
+    def mark(self) -> int:
+        """Push added rows, returned mark is passed to wait from any thread"""
+
+        self.push()
+        return self.pushed
+
+    def wait(self, mark: int):
+        """Wait till rows added before mark are committed"""
+
+        with self.done_changed:
+            self.done_changed.wait_for(lambda: self.done >= mark or self.error is not None)
+
+        self.raise_error()
+
+    def flush(self):
+        """Write all added rows, returns once they are committed"""
+
+        self.push()
+        self.queue.join()
+        self.raise_error()
+
+    def raise_error(self):
+        if self.error is not None:
+            raise RuntimeError(f"TransactionStatus write failed: {self.error}") from self.error
+
+    def run(self):
+        try:
+            while True:
+                chunk = self.queue.get()
+
+                try:
+                    if chunk is None:
+                        break
+
+                    # After failure rows are dropped, main thread raises on next add / flush
+                    if self.error is None:
+                        self.written += copy_upsert_encoded(TransactionStatus, STATUS_COLUMNS,
+                                                            conflict_fields=['transaction_hash'],
+                                                            update_fields=[], rows=chunk)
+                except Exception as e:
+                    logger.error(f"TransactionStatus write failed: {e}")
+                    self.error = e
+                finally:
+                    if chunk is not None:
+                        with self.done_changed:
+                            self.done += 1
+                            self.done_changed.notify_all()
+
+                    self.queue.task_done()
+        finally:
+            connection.close()
+
+    def close(self):
+        """Flush and stop background thread"""
+
+        try:
+            self.flush()
+        finally:
+            if self.thread is not None:
+                self.queue.put(None)
+                self.thread.join()
+                self.thread = None
@@ -0,0 +1,78 @@
+from django.db.models import Count
+from loguru import logger
+
+from indexer.models import Ton20TickStats, TransactionStatus
+from indexer.utils.pgcopy import copy_upsert
+
+STATS_COLUMNS = ['tick', 'holders', 'supply', 'progress', 'mints', 'transfers']
+
+
+def save_tick_stats(rows):
+    """Upsert rows of TickStats.rows"""
+
+    copy_upsert(Ton20TickStats, STATS_COLUMNS, conflict_fields=['tick'], update_fields=STATS_COLUMNS[1:], rows=rows)
+
+
+class TickStats:
+    """
+    Counters of successful ops per tick: {tick: [mints, transfers]}, counted from statuses of applied txs
+
+    Holders & supply are read from state when rows are taken, so here are only counters state doesn't have
+    """
+
+    def __init__(self):
+        self.ops = {}
+
+        # Ticks changed since latest rows
+        self.changed = set()
+
+    def add(self, status: dict):
+        if not status['success']:
+            return
+
+        tick = status['tick']
+        counters = self.ops.setdefault(tick, [0, 0])
+
+        if status['op_code'] == 'mint':
+            counters[0] += 1
+        elif status['op_code'] == 'transfer':
+            counters[1] += 1
+
+        self.changed.add(tick)
+
+    def load(self) -> bool:
+        """Counters of latest committed state, False if there's no saved stats yet"""
+
+        for tick, mints, transfers in Ton20TickStats.objects.values_list('tick', 'mints', 'transfers').iterator():
+            self.ops[tick] = [mints, transfers]
+
+        return len(self.ops) > 0
+
+    def backfill(self, latest_lt: int):
+        """Count ops of TransactionStatus up to state at latest_lt, once for state committed before stats existed"""
+
+        rows = TransactionStatus.objects.filter(success=True, op_code__in=['mint', 'transfer'],
+                                                in_msg_created_lt__lte=latest_lt) \
+            .values_list('tick', 'op_code').annotate(count=Count('*'))
+
+        for tick, op_code, count in rows:
+            self.ops.setdefault(tick, [0, 0])[0 if op_code == 'mint' else 1] = count
+
+        logger.info(f"Backfilled ops counters of {len(self.ops)} ticks from TransactionStatus")
+
+    def rows(self, state, ticks=None) -> list:
+        """Rows in STATS_COLUMNS order of changed (or given) ticks, values are copied so state can go further"""
+
+        if ticks is None:
+            ticks, self.changed = self.changed, set()
+
+        rows = []
+        for tick in ticks:
+            data = state.ticks[tick]
+            supply = data['max'] - data['rest']
+            mints, transfers = self.ops.get(tick, (0, 0))
+
+            rows.append((tick, len(state.wallets[tick]), supply, supply / data['max'] if data['max'] else 0.0,
+                         mints, transfers))
+
+        return rows
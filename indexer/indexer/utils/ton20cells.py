@@ -0,0 +1,111 @@
+from tonpy import CellBuilder, VmDict, Address, Cell
+
+
+# walletinfo$_ amount:uint256 last_txhash:bits256 = WalletInfo;
+#
+# tickinfo$000 max:uint256 lim:uint256 rest:uint256
+#             ^[deploy_by:MsgAddressInt deploy_txhash:bits256]
+#             wallets:(HashmapE 264 WalletInfo) = TickInfo;
+#
+# ton20state#64746f6e last_tx_hash:uint256 last_tx_lt:uint64 master_ref_seqno:uint32
+#                 ticks:(HashmapE 256 TickInfo) = Ton20State;
+
+
+def tick_key(tick: str) -> int:
+    return int(tick.encode().hex(), 16)
+
+
+def wallet_key(wallet: str):
+    a = Address(wallet)
+
+    return CellBuilder() \
+        .store_int(a.wc, 8) \
+        .store_uint(int(a.address, 16), 256) \
+        .end_cell().begin_parse()
+
+
+def wallet_value(amount: int, txhash: str) -> CellBuilder:
+    return CellBuilder() \
+        .store_uint(amount, 256) \
+        .store_uint(int(txhash, 16), 256)
+
+
+def delete_wallet(vmdict: VmDict, wallet: str):
+    """Wallet created & emptied since dict was built isn't in it, tonpy raises on delete of missing key"""
+
+    try:
+        vmdict.lookup_delete_keycs(wallet_key(wallet))
+    except RuntimeError:
+        pass
+
+
+def build_wallets_dict(wallets) -> VmDict:
+    """wallets: iterable of (address, amount, txhash)"""
+
+    vmdict = VmDict(264, False)
+
+    for wallet, amount, txhash in wallets:
+        vmdict.set_builder_keycs(wallet_key(wallet), wallet_value(amount, txhash))
+
+    return vmdict
+
+
+def build_wallets_boc(wallets) -> str:
+    """
+    Pool worker: wallets is TickWallets.export() of one tick, returns BOC of wallets dict root
+
+    Import of this module must stay free of django, so spawned workers start fast
+    """
+
+    addresses, amounts, txhashes = wallets
+
+    return build_wallets_dict(
+        (address, amounts[i], txhashes[i * 32:(i + 1) * 32].hex()) for i, address in enumerate(addresses)
+    ).get_cell().to_boc()
+
+
+def tick_header(tick_data: dict, wallets_cell: Cell = None) -> Cell:
+    """wallets_cell is root of wallets dict, None if tick has no wallets"""
+
+    header = CellBuilder() \
+        .store_bitstring('000') \
+        .store_uint(tick_data['max'], 256) \
+        .store_uint(tick_data['lim'], 256) \
+        .store_uint(tick_data['rest'], 256) \
+        .store_ref(CellBuilder().store_address(tick_data['deploy_by']) \
+                   .store_uint(int(tick_data['txhash'], 16), 256).end_cell())
+
+    if wallets_cell is None:
+        header = header.store_uint(0, 1)
+    else:
+        header = header.store_uint(1, 1).store_ref(wallets_cell)
+
+    return header.end_cell()
+
+
+def tick_wallets_dict(ticks_dict: VmDict, tick: str) -> VmDict:
+    """Wallets dict stored in header of existing tick of ticks dict"""
+
+    header = ticks_dict.lookup(tick_key(tick)).load_ref().begin_parse()
+    header.skip_bits(3 + 256 * 3)
+    header.load_ref()
+
+    if header.load_bool():
+        return VmDict(264, cell_root=header.load_ref())
+
+    return VmDict(264, False)
+
+
+def state_cell(last_tx, ticks_cell: Cell) -> Cell:
+    lt = last_tx['lt']
+    txhash = last_tx['transaction_hash']
+    mc_ref_seqno = int(last_tx['mc_ref_seqno'])
+
+    return CellBuilder() \
+        .store_uint(0x64746f6e, 32) \
+        .store_uint(int(txhash, 16), 256) \
+        .store_uint(int(lt), 64) \
+        .store_uint(int(mc_ref_seqno), 32) \
+        .store_uint(1, 1) \
+        .store_ref(ticks_cell) \
+        .end_cell()
@@ -0,0 +1,294 @@
+from collections import OrderedDict
+from time import perf_counter
+
+from django.conf import settings
+from tonpy import Address
+
+from indexer.utils.stage_timers import timers
+
+max_int = 2 ** 256
+
+OPS = ['transfer', 'mint', 'deploy']
+
+
+def try_int(x):
+    try:
+        x = int(x)
+        if x < max_int:
+            return x
+        else:
+            return 0
+    except Exception as e:
+        return 0
+
+
+def parse_address(address):
+    if ':' in address:
+        to_addr = address.split(':')
+        address = f"{to_addr[0]}:{to_addr[1].zfill(64)}"
+
+    try:
+        a = Address(address)
+        return f"{a.wc}:{a.address}"
+    except Exception as e:
+        return None
+
+
+class AddressCache:
+    """Bounded LRU of normalized `wc:HEX` addresses, None is cached for unparsable ones"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self.values = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __call__(self, address: str):
+        try:
+            value = self.values[address]
+        except KeyError:
+            self.misses += 1
+            value = self.values[address] = parse_address(address)
+
+            if len(self.values) > self.size:
+                self.values.popitem(last=False)
+                self.evictions += 1
+
+            return value
+
+        self.hits += 1
+        self.values.move_to_end(address)
+        return value
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        return f"size: {len(self.values)}, hits: {self.hits}, misses: {self.misses}, " \
+               f"evictions: {self.evictions}, hit rate: {self.hits / total if total else 0:.1%}"
+
+
+# Shared by ops, TransactionStatus conversion and API
+address_cache = AddressCache(settings.ADDRESS_CACHE_SIZE)
+
+
+def fix_address(address):
+    if not isinstance(address, str):
+        return None if address is None else parse_address(address)
+
+    return address_cache(address)
+
+
+def initiator(tx) -> str:
+    """Sender `wc:HEX` of tx, built once per tx"""
+
+    address = tx.get('initiator')
+    if address is None:
+        address = tx['initiator'] = f"{tx['in_msg_src_addr_workchain_id']}:{tx['in_msg_src_addr_address_hex']}"
+
+    return address
+
+
+def parse_amt(value) -> tuple:
+    """(amt, None) or (None, error message)"""
+
+    try:
+        if not isinstance(value, str):
+            raise ValueError(f"amt must be str, got: {type(value)}")
+
+        amt = int(value)
+        assert amt > 0, f"amt must be > 0, {amt}"
+        assert amt < max_int, f"amt must be < max_int, {amt}"
+    except Exception as e:
+        return None, str(e)
+
+    return amt, None
+
+
+def parse_params(params) -> tuple:
+    """(max, lim) of deploy or None"""
+
+    max_, lim_ = params
+
+    try:
+        if not isinstance(max_, str):
+            raise ValueError
+
+        if not isinstance(lim_, str):
+            raise ValueError
+
+        max_ = int(max_)
+        lim_ = int(lim_)
+        assert max_ > 0, f"Must be: max > 0: {max_}"
+        assert max_ < max_int, f"Must be: max < max_int: {max_}"
+        assert lim_ > 0, f"Must be: lim_ > 0: {lim_}"
+        assert lim_ < max_int, f"Must be: lim_ < max_int: {lim_}"
+    except Exception as e:
+        return None
+
+    return max_, lim_
+
+
+class ParseCache:
+    """Each distinct str value of batch is parsed once, other types are parsed every time"""
+
+    def __init__(self, parse):
+        self.parse = parse
+        self.values = {}
+
+    def __call__(self, value):
+        if not isinstance(value, (str, tuple)):
+            return self.parse(value)
+
+        try:
+            return self.values[value]
+        except KeyError:
+            result = self.values[value] = self.parse(value)
+            return result
+        except TypeError:
+            # Tuple with unhashable item
+            return self.parse(value)
+
+
+def convert_tx(tx, to_int=try_int):
+    if not isinstance(tx['in_msg_comment'], dict):
+        return {"transaction_hash": tx['transaction_hash'],
+                "success": False,
+                'tick': None,
+                'op_code': None,
+                'initiator': initiator(tx),
+                'mint_amount': 0,
+                'transfer_amount': 0,
+                'transfer_to': None,
+                'memo': None,
+                'in_msg_created_lt': tx['in_msg_created_lt'],
+                "fail_reason": "no"}
+
+    data = tx['in_msg_comment']
+    op_code = str(data.get('op', ''))[:200].lower()
+    return {
+        'transaction_hash': tx['transaction_hash'],
+        'tick': str(data.get('tick', None))[:200].lower(),
+        'op_code': op_code if op_code else None,
+        'initiator': initiator(tx),
+        'mint_amount': to_int(data.get('amt', 0)) if op_code == 'mint' else 0,
+        'transfer_amount': to_int(data.get('amt', 0)) if op_code != 'mint' else 0,
+        'transfer_to': fix_address(data.get('to', None)),
+        'memo': str(data.get('memo', ''))[:254],
+        'success': True,
+        'fail_reason': 'no',
+        'in_msg_created_lt': tx['in_msg_created_lt']
+    }
+
+
+def is_valid_json(comment) -> bool:
+    return 'p' in comment and comment['p'] == 'ton-20' and 'op' in comment and comment['op'] in OPS
+
+
+def check_deploy(comment, caches) -> dict:
+    for f in ['tick', 'max', 'lim']:
+        if f not in comment:
+            return {'fail': f"Can't find: {f}"}
+
+    if not isinstance(comment['tick'], str):
+        return {'fail': "Tick invalid"}
+
+    tick = comment['tick'].lower()
+    checks = {'fail': None, 'tick': tick, 'late_fail': None}
+
+    try:
+        too_large = len(bin(int(tick.encode().hex(), 16))[2:]) > 256
+    except ValueError as e:
+        # Empty tick, deploy raises it after "Already exist" check
+        checks['error'] = e
+        return checks
+
+    params = caches['params']((comment['max'], comment['lim']))
+
+    if too_large:
+        checks['late_fail'] = "Tick too large"
+    elif params is None:
+        checks['late_fail'] = "Can't parse params"
+    else:
+        checks['max'], checks['lim'] = params
+
+    return checks
+
+
+def check_transfer(comment, caches) -> dict:
+    for f in ['tick', 'to', 'amt']:
+        if f not in comment or not isinstance(comment[f], str):
+            return {'fail': f"Can't find {f}"}
+
+    amt, error = caches['amt'](comment['amt'])
+
+    return {
+        'fail': None,
+        'tick': comment['tick'].lower(),
+        'amt': amt,
+        'amt_fail': "Can't parse amt" if error else None,
+        'to': fix_address(comment['to'])
+    }
+
+
+def check_mint(comment, caches) -> dict:
+    for f in ['tick', 'amt']:
+        if f not in comment:
+            return {'fail': f"Can't find {f}"}
+
+    if not isinstance(comment['tick'], str):
+        return {'fail': "Tick invalid"}
+
+    amt, error = caches['amt'](comment['amt'])
+    if error:
+        return {'fail': f"Can't parse amt: {error}"}
+
+    return {'fail': None, 'tick': comment['tick'].lower(), 'amt': amt}
+
+
+OP_CHECKS = {
+    'deploy': check_deploy,
+    'transfer': check_transfer,
+    'mint': check_mint
+}
+
+
+def prevalidate(txs):
+    """
+    State independent checks of batch, each tx gets tx['checks']:
+
+    valid: comment is ton-20 json with known op
+    fail: first failure reason before any state check, None if there's no such
+    tick, amt, to, max, lim: parsed values of op, late_fail / amt_fail: failures after state checks
+    status: TransactionStatus row as if tx is applied, or exception of building it
+    error: exception deploy raises after state check
+
+    Amounts and deploy params are parsed once per distinct value of batch, addresses go through shared address_cache
+    """
+
+    caches = {
+        'amt': ParseCache(parse_amt),
+        'params': ParseCache(parse_params),
+        'int': ParseCache(try_int)
+    }
+
+    for tx in txs:
+        comment = tx['in_msg_comment']
+
+        if not is_valid_json(comment):
+            tx['checks'] = {'valid': False}
+            continue
+
+        checks = OP_CHECKS[comment['op']](comment, caches)
+        checks['valid'] = True
+
+        t = perf_counter()
+        try:
+            checks['status'] = convert_tx(tx, caches['int'])
+        except Exception as e:
+            # Raised once tx reaches status, same as before
+            checks['status'] = e
+        timers.add('convert_tx', perf_counter() - t)
+
+        tx['checks'] = checks
+
+    return txs
@@ -1,261 +1,150 @@
+import os
 import traceback
-from io import StringIO
-from time import time
+from time import time, perf_counter
 from typing import Tuple, Union
 
-from indexer.models import Transaction, AccountCache, TransactionStatus, Ton20StateSerialized, get_field_names
+from indexer.models import Transaction, TransactionStatus, Ton20StateSerialized, get_field_names
 from tonpy import VmDict
 from loguru import logger
-from collections import defaultdict
-from tonpy import Address
 
 from indexer.utils.ton20state import Ton20State
+from indexer.utils.state_image import state_image_path
 from indexer.utils.tx_parent import check_tx_parent
+from indexer.utils.account_cache import AccountTypes
+from indexer.utils.status_sink import StatusSink
+from indexer.utils.commit_pipeline import CommitPipeline, snapshot_row
+from indexer.utils.tick_stats import TickStats, save_tick_stats
+from indexer.utils.stage_timers import timers
+from indexer.utils.ton20checks import prevalidate, is_valid_json, initiator, address_cache
 import orjson as json
-import pandas as pd
-from django.db import connection
+from django.db import connection, transaction
 status_columns = get_field_names(TransactionStatus)
-max_int = 2 ** 256
 
 
-def try_int(x):
-    try:
-        x = int(x)
-        if x < max_int:
-            return x
-        else:
-            return 0
-    except Exception as e:
-        return 0
-
-
-def fix_address(address):
-    if address is None:
-        return None
-
-    if ':' in address:
-        to_addr = address.split(':')
-        address = f"{to_addr[0]}:{to_addr[1].zfill(64)}"
-
-    try:
-        a = Address(address)
-        return f"{a.wc}:{a.address}"
-    except Exception as e:
-        return None
+# Messages of one block have created_lt in same bucket
+BLOCK_LT = 1000000
 
 
-def convert_tx(tx):
-    if not isinstance(tx['in_msg_comment'], dict):
-        return {"transaction_hash": tx['transaction_hash'],
-                "success": False,
-                'tick': None,
-                'op_code': None,
-                'initiator': f"{tx['in_msg_src_addr_workchain_id']}:{tx['in_msg_src_addr_address_hex']}",
-                'mint_amount': 0,
-                'transfer_amount': 0,
-                'transfer_to': None,
-                'memo': None,
-                'in_msg_created_lt': tx['in_msg_created_lt'],
-                "fail_reason": "no"}
-
-    data = tx['in_msg_comment']
-    op_code = str(data.get('op', ''))[:200].lower()
-    return {
-        'transaction_hash': tx['transaction_hash'],
-        'tick': str(data.get('tick', None))[:200].lower(),
-        'op_code': op_code if op_code else None,
-        'initiator': f"{tx['in_msg_src_addr_workchain_id']}:{tx['in_msg_src_addr_address_hex']}",
-        'mint_amount': try_int(data.get('amt', 0)) if op_code == 'mint' else 0,
-        'transfer_amount': try_int(data.get('amt', 0)) if op_code != 'mint' else 0,
-        'transfer_to': fix_address(data.get('to', None)),
-        'memo': str(data.get('memo', ''))[:254],
-        'success': True,
-        'fail_reason': 'no',
-        'in_msg_created_lt': tx['in_msg_created_lt']
-    }
-
-
-class Ton20Logic:
+class SenderWindow:
     """
-    Main workflow:
-
-    # Start commit of new patch of TXs per next max_mc_ref
-    self.start()
-
-    # Add txs one by one ordered by lt/hash
-    for tx in txs:
-        self.add_transaction(...)
-
-    # Commit batch to DB
-    self.commit()
+    created_lt of messages per sender in block buckets: {bucket: {address: [lt, ...]}}
 
+    Txs come ordered by in_msg_created_lt, so once newer bucket appears older ones are never used again
+    and are dropped, memory is bounded by active blocks instead of whole commit batch
     """
 
-    def __init__(self,
-                 mc_ref_seqno=0,
-                 commit_state_each_x_txs=100000,
-                 status_txs_enabled=True):
-        self.mc_ref_seqno = mc_ref_seqno
-        self.max_mc_ref = mc_ref_seqno
-        self.committed = True
-        self.status_txs_enabled = status_txs_enabled
+    def __init__(self):
+        self.buckets = {}
+        self.latest = None
 
-        # {address: {block_lt: cnt}}
-        self.by_block_by_account = None
-        self.account_cache = {}
-        self.state = Ton20State()
-        self.uncommited_txs = 0
-        self.transactions_status = []
-        self.commit_state_each_x_txs = commit_state_each_x_txs
+    def add(self, address: str, lt: int) -> list:
+        """Register message of sender, returns all created_lt of sender in same bucket"""
 
-        self.clear_by_block_by_account()
-        self.load_account_cache()
+        bucket = lt - lt % BLOCK_LT
 
-    def load_account_cache(self):
-        for i in AccountCache.objects.all():
-            if i.is_contract_wallet and not i.account_blacklist:
-                self.account_cache[i.address] = True
-            else:
-                self.account_cache[i.address] = False
+        if self.latest is None or bucket > self.latest:
+            self.buckets = {}
+            self.latest = bucket
 
-    def check_account_type(self, address):
-        if address not in self.account_cache:
-            account = AccountCache.objects.filter(address=address).first()
-            self.account_cache[account.address] = account.is_contract_wallet and not account.account_blacklist
+        lts = self.buckets.setdefault(bucket, {}).setdefault(address, [])
+        lts.append(lt)
+        return lts
 
-        return self.account_cache[address]
+    def dump(self) -> dict:
+        return {'latest': self.latest, 'senders': self.buckets.get(self.latest, {})}
 
-    def finalize(self):
-        if self.transactions_status:
-            self.bulk_insert_status()
+    def restore(self, data: dict):
+        self.latest = data['latest']
+        self.buckets = {} if self.latest is None else {self.latest: data['senders']}
 
-    def bulk_insert_status(self):
-        if not self.transactions_status:
-            return
 
-        # Get the correct order of columns from the model
-        field_names = [field.name for field in TransactionStatus._meta.fields]
+class Ton20Ops:
+    """State dependent checks of prevalidated txs, applied to self.state"""
 
-        # Create DataFrame with the correct column order
-        df = pd.DataFrame(self.transactions_status, columns=field_names)
+    def __init__(self, state: Ton20State):
+        self.state = state
 
-        # Convert DataFrame to CSV string
-        buffer = StringIO()
-        df.to_csv(buffer, index=False, header=False)
-        buffer.seek(0)
+    def apply(self, tx) -> tuple[bool, str]:
+        op = tx['in_msg_comment']['op']
+        t = perf_counter()
 
-        table_name = TransactionStatus._meta.db_table
+        if op == 'transfer':
+            result = self.transfer(tx)
+        elif op == 'mint':
+            result = self.mint(tx)
+        elif op == 'deploy':
+            result = self.deploy(tx)
+        else:
+            return None
 
-        with connection.cursor() as cursor:
-            cursor.copy_expert(f"COPY {table_name} ({', '.join(field_names)}) FROM STDIN WITH CSV",
-                               buffer)
+        timers.add(op, perf_counter() - t)
+        return result
 
-        self.transactions_status = []
+    @staticmethod
+    def applied_status(tx, success, fail_reason) -> dict:
+        status = tx['checks']['status']
+        if isinstance(status, Exception):
+            raise status
 
-    def clear_by_block_by_account(self):
-        self.by_block_by_account = defaultdict(lambda: defaultdict(lambda: []))
+        status['success'] = success
+        status['fail_reason'] = fail_reason if fail_reason else 'no'
+        return status
 
     def deploy(self, tx) -> tuple[bool, str]:
-        for f in ['tick', 'max', 'lim']:
-            if f not in tx['in_msg_comment']:
-                return False, f"Can't find: {f}"
-
-        if not isinstance(tx['in_msg_comment']['tick'], str):
-            return False, "Tick invalid"
+        checks = tx['checks']
+        if checks['fail']:
+            return False, checks['fail']
 
-        tick = tx['in_msg_comment']['tick'].lower()
+        tick = checks['tick']
 
         if tick in self.state.ticks:
             return False, "Already exist"
 
-        if len(bin(int(tick.encode().hex(), 16))[2:]) > 256:
-            return False, "Tick too large"
-
-        try:
-            if not isinstance(tx['in_msg_comment']['max'], str):
-                raise ValueError
+        if 'error' in checks:
+            raise checks['error']
 
-            if not isinstance(tx['in_msg_comment']['lim'], str):
-                raise ValueError
+        if checks['late_fail']:
+            return False, checks['late_fail']
 
-            max_ = int(tx['in_msg_comment']['max'])
-            lim_ = int(tx['in_msg_comment']['lim'])
-            assert max_ > 0, f"Must be: max > 0: {max_}"
-            assert max_ < max_int, f"Must be: max < max_int: {max_}"
-            assert lim_ > 0, f"Must be: lim_ > 0: {lim_}"
-            assert lim_ < max_int, f"Must be: lim_ < max_int: {lim_}"
-        except Exception as e:
-            return False, "Can't parse params"
-
-        address = f"{tx['in_msg_src_addr_workchain_id']}:{tx['in_msg_src_addr_address_hex']}"
-        self.state.deploy(tick, max_, lim_, address, tx['transaction_hash'])
+        address = initiator(tx)
+        self.state.deploy(tick, checks['max'], checks['lim'], address, tx['transaction_hash'])
         return True, ''
 
     def transfer(self, tx) -> tuple[bool, str]:
-        for f in ['tick', 'to', 'amt']:
-            if f not in tx['in_msg_comment'] or not isinstance(tx['in_msg_comment'][f], str):
-                return False, f"Can't find {f}"
-
-        if not isinstance(tx['in_msg_comment']['tick'], str):
-            return False, "Tick not valid"
+        checks = tx['checks']
+        if checks['fail']:
+            return False, checks['fail']
 
-        if not isinstance(tx['in_msg_comment']['to'], str):
-            return False, "To not valid"
-
-        tick = tx['in_msg_comment']['tick'].lower()
-        address_from = f"{tx['in_msg_src_addr_workchain_id']}:{tx['in_msg_src_addr_address_hex']}"
+        tick = checks['tick']
+        address_from = initiator(tx)
 
         if tick not in self.state.ticks:
             return False, f"Tick not exist"
 
-        try:
-            if not isinstance(tx['in_msg_comment']['amt'], str):
-                raise ValueError(f"amt must be str, got: {type(tx['in_msg_comment']['amt'])}")
+        if checks['amt_fail']:
+            return False, checks['amt_fail']
 
-            amt = int(tx['in_msg_comment']['amt'])
-            assert amt > 0, f"amt must be > 0, {amt}"
-            assert amt < max_int, f"amt must be < max_int, {amt}"
-        except Exception as e:
-            return False, f"Can't parse amt"
+        amt = checks['amt']
 
         if tick not in self.state.wallets:
             return False, "Tick not exist"
 
-        if address_from not in self.state.wallets[tick] or self.state.wallets[tick][address_from]['amount'] < amt:
+        if address_from not in self.state.wallets[tick] or self.state.wallets[tick].get_amount(address_from) < amt:
             return False, f"Out of money"
 
-        try:
-            if ':' in tx['in_msg_comment']['to']:
-                to_addr = tx['in_msg_comment']['to'].split(':')
-                tx['in_msg_comment']['to'] = f"{to_addr[0]}:{to_addr[1].zfill(64)}"
-
-            a = Address(f"{tx['in_msg_comment']['to']}")
-            address_to = f"{a.wc}:{a.address}"
-        except Exception as e:
+        if checks['to'] is None:
             return False, f"Can't parse to"
 
-        self.state.transfer(tick, address_from, address_to, amt, tx['transaction_hash'])
+        self.state.transfer(tick, address_from, checks['to'], amt, tx['transaction_hash'])
         return True, ''
 
     def mint(self, tx) -> tuple[bool, str]:
-        for f in ['tick', 'amt']:
-            if f not in tx['in_msg_comment']:
-                return False, f"Can't find {f}"
-
-        if not isinstance(tx['in_msg_comment']['tick'], str):
-            return False, "Tick invalid"
-
-        tick = tx['in_msg_comment']['tick'].lower()
-
-        try:
-            if not isinstance(tx['in_msg_comment']['amt'], str):
-                raise ValueError(f"amt must be str, got: {type(tx['in_msg_comment']['amt'])}")
+        checks = tx['checks']
+        if checks['fail']:
+            return False, checks['fail']
 
-            amt = int(tx['in_msg_comment']['amt'])
-            assert amt > 0, f"amt must be > 0, {amt}"
-            assert amt < max_int, f"amt must be < max_int, {amt}"
-        except Exception as e:
-            return False, f"Can't parse amt: {e}"
+        tick = checks['tick']
+        amt = checks['amt']
 
         if tick not in self.state.ticks:
             return False, "Tick not found"
@@ -271,10 +160,152 @@ class Ton20Logic:
             # logger.warning(f"Apply not full sum for {tx['transaction_hash']}")
             return False, "Tick rest less amt"
 
-        address = f"{tx['in_msg_src_addr_workchain_id']}:{tx['in_msg_src_addr_address_hex']}"
+        address = initiator(tx)
         self.state.mint(tick, address, amt, tx['transaction_hash'])
         return True, ''
 
+
+class Ton20Logic(Ton20Ops):
+    """
+    Main workflow:
+
+    # Start commit of new patch of TXs per next max_mc_ref
+    self.start()
+
+    # Add batches of txs ordered by lt/hash
+    self.add_transactions(txs)
+
+    # Commit batch to DB
+    self.commit()
+
+    """
+
+    def __init__(self,
+                 mc_ref_seqno=0,
+                 commit_state_each_x_txs=100000,
+                 status_txs_enabled=True,
+                 incremental_serialize=False,
+                 serialize_workers=0,
+                 snapshot_full_each=1,
+                 state_image_dir=None,
+                 flush_dirty_each=0,
+                 status_chunk_rows=10000,
+                 commit_in_flight=0,
+                 commit_each_seconds=0,
+                 commit_dirty_each=0):
+        self.mc_ref_seqno = mc_ref_seqno
+        self.max_mc_ref = mc_ref_seqno
+        self.committed = True
+        self.status_txs_enabled = status_txs_enabled
+
+        # Messages per sender in current block buckets
+        self.by_block_by_account = None
+        self.account_types = AccountTypes()
+        super().__init__(Ton20State(incremental_serialize=incremental_serialize, serialize_workers=serialize_workers))
+        self.uncommited_txs = 0
+        self.status_sink = StatusSink(chunk_rows=status_chunk_rows)
+        self.tick_stats = TickStats()
+        self.commit_state_each_x_txs = commit_state_each_x_txs
+
+        # Full snapshot each N commits, deltas between them
+        self.snapshot_full_each = snapshot_full_each
+        self.base_state_hash = None
+        self.chain_seqno = 0
+
+        # Write memory-mapped state image next to each full snapshot
+        self.state_image_dir = state_image_dir
+
+        # Save dirty wallets to DB once there are so many of them, 0 - only on explicit save_to_db
+        self.flush_dirty_each = flush_dirty_each
+
+        # Serialize & save commits in background with so many commits in flight, 0 - commit in place
+        self.commit_in_flight = commit_in_flight
+        self.commits = None
+
+        # Checkpoint at end of batch once so many seconds passed or wallets changed since latest commit, 0 - off
+        self.commit_each_seconds = commit_each_seconds
+        self.commit_dirty_each = commit_dirty_each
+        self.checkpoint_requested = False
+
+        # Latest processed tx & count of txs processed since latest commit
+        self.last_tx = None
+        self.txs_since_commit = 0
+        self.committed_at = time()
+        self.committed_lt = None
+
+        self.clear_by_block_by_account()
+        self.load_account_cache()
+
+    def set_latest_snapshot(self, state: Ton20StateSerialized):
+        """Continue snapshot chain of latest committed state, checks continue from its resume context"""
+        self.base_state_hash = state.base_state_hash if state.is_delta else state.state_hash
+        self.chain_seqno = state.chain_seqno if state.is_delta else 0
+        self.committed_lt = state.in_msg_created_lt
+
+        if state.resume_context is not None:
+            context = json.loads(state.resume_context)
+            self.uncommited_txs = context['uncommited_txs']
+            self.by_block_by_account.restore(context['window'])
+
+    def write_state_image(self, state_hash, last_tx, state_boc, keep=2):
+        os.makedirs(self.state_image_dir, exist_ok=True)
+        self.state.write_image(state_image_path(self.state_image_dir, state_hash), state_hash, last_tx, state_boc)
+
+        images = sorted((os.path.join(self.state_image_dir, i) for i in os.listdir(self.state_image_dir)
+                         if i.endswith('.img')), key=os.path.getmtime)
+        for path in images[:-keep]:
+            os.remove(path)
+
+    def load_account_cache(self):
+        t = time()
+        self.account_types.load()
+        logger.info(f"Loaded account types: {len(self.account_types)} at: {time() - t}")
+
+    def check_account_type(self, address):
+        t = perf_counter()
+        result = self.account_types[address]
+        timers.add('account_type', perf_counter() - t)
+        return result
+
+    def prefetch_accounts(self, txs):
+        """Load account types of all senders of batch with one query"""
+
+        t = perf_counter()
+        self.account_types.prefetch(initiator(tx) for tx in txs if is_valid_json(tx['in_msg_comment']))
+        timers.add('account_prefetch', perf_counter() - t, len(txs))
+
+    def load_tick_stats(self, latest_lt):
+        """Ops counters of loaded state, table is filled from TransactionStatus once if state is older than it"""
+
+        t = time()
+        if not self.tick_stats.load() and self.state.ticks:
+            self.tick_stats.backfill(latest_lt)
+            save_tick_stats(self.tick_stats.rows(self.state, self.state.ticks))
+
+        logger.info(f"Loaded tick stats: {len(self.tick_stats.ops)} at: {time() - t}")
+
+    def start_commits(self):
+        """Hand persistent dicts of state over to CommitPipeline, must be called after state & snapshot chain load"""
+
+        t = time()
+        self.commits = CommitPipeline(self.status_sink, self.state.release_ticks_dict(), self.state.ticks,
+                                      base_state_hash=self.base_state_hash,
+                                      chain_seqno=self.chain_seqno,
+                                      snapshot_full_each=self.snapshot_full_each,
+                                      max_in_flight=self.commit_in_flight)
+        logger.info(f"Started commit pipeline at: {time() - t}")
+
+    def finalize(self):
+        if self.commits is not None:
+            self.commits.close()
+
+        self.status_sink.close()
+
+        self.state.close()
+
+    def clear_by_block_by_account(self):
+        self.by_block_by_account = SenderWindow()
+
     def initial_check(self, tx) -> tuple[bool, str]:
         """
         Check txs per block, check valid of structure, check receiver & sender
@@ -282,30 +313,30 @@ class Ton20Logic:
         change_point = 1701955800
 
         # success transaction
-        if 'p' in tx['in_msg_comment'] and tx['in_msg_comment']['p'] == 'ton-20' and 'op' in tx['in_msg_comment'] \
-                and tx['in_msg_comment']['op'] in ['transfer', 'mint', 'deploy']:
+        if is_valid_json(tx['in_msg_comment']):
             address = f"{tx['workchain']}:{tx['account']}"
             to_zero = address == "0:0000000000000000000000000000000000000000000000000000000000000000"
 
-            address_from = f"{tx['in_msg_src_addr_workchain_id']}:{tx['in_msg_src_addr_address_hex']}"
+            address_from = initiator(tx)
 
-            key = tx['in_msg_created_lt'] - (tx['in_msg_created_lt'] % 1000000)
             if tx['in_msg_created_at'] < change_point and to_zero and not self.check_account_type(address_from):
                 # This is only for initial accounts, we need to know parent TX
                 # Because you can send several TXs with 4 child in one block with highland
                 # And it'll not be tracked by LT
+                t = perf_counter()
                 success, fail_reason = check_tx_parent(tx['transaction_hash'])
+                timers.add('check_tx_parent', perf_counter() - t)
 
                 if not success:
                     return success, fail_reason
 
-                key = tx['transaction_hash']
-
-            self.by_block_by_account[address_from][key].append(tx['in_msg_created_lt'])
+                # Counter key is tx hash here, it's unique, so such tx is never sent >4 times
+            else:
+                lts = self.by_block_by_account.add(address_from, tx['in_msg_created_lt'])
 
-            # Up to 4 messages per 1 time
-            if len(self.by_block_by_account[address_from][key]) > 4:
-                return False, f"TX sended >4 times: {self.by_block_by_account[address_from][key]}, address, key"
+                # Up to 4 messages per 1 time
+                if len(lts) > 4:
+                    return False, f"TX sended >4 times: {lts}, address, key"
 
             # Before `change_point` to 0
             if tx['in_msg_created_at'] < change_point and not to_zero:
@@ -321,43 +352,84 @@ class Ton20Logic:
         else:
             return False, "Json is not valid"
 
-    def add_transaction(self, tx):
+    def add_transactions(self, txs):
+        """Add batch of txs ordered by lt/hash, state independent checks are done for whole batch first"""
+
+        self.prefetch_accounts(txs)
+
+        t = perf_counter()
+        prevalidate(txs)
+        timers.add('prevalidate', perf_counter() - t, len(txs))
+
+        for tx in txs:
+            self.add_transaction(tx)
+
+        self.checkpoint()
+        timers.dump_if_due()
+
+    def check_sender(self, tx) -> tuple[bool, str]:
+        """State independent part of add_transaction, must be called in tx order"""
+
         if tx['mc_ref_seqno'] < self.mc_ref_seqno:
             raise ValueError(f"Transactions should be already processed")
 
         if tx['mc_ref_seqno'] > self.max_mc_ref:
             self.max_mc_ref = tx['mc_ref_seqno']
 
-        success, fail_reason = self.initial_check(tx)
+        t = perf_counter()
+        result = self.initial_check(tx)
+        timers.add('initial_check', perf_counter() - t)
+        return result
+
+    @staticmethod
+    def failed_status(tx, fail_reason) -> dict:
+        return {"transaction_hash": tx['transaction_hash'],
+                "success": False,
+                'tick': None,
+                'op_code': None,
+                'initiator': initiator(tx),
+                'mint_amount': 0,
+                'transfer_amount': 0,
+                'transfer_to': None,
+                'memo': None,
+                'in_msg_created_lt': tx['in_msg_created_lt'],
+                "fail_reason": fail_reason if fail_reason else "no"}
+
+    def add_status(self, status):
+        """Status of applied tx"""
+
+        self.tick_stats.add(status)
+
+        if self.status_txs_enabled:
+            t = perf_counter()
+            self.status_sink.add(status)
+            timers.add('status_buffer', perf_counter() - t)
+
+    def flush_dirty(self):
+        if self.flush_dirty_each and self.state.dirty_size() >= self.flush_dirty_each:
+            logger.info(f"Flush dirty wallets: {self.state.dirty_size()}")
+            self.state.save_to_db()
+
+    def add_transaction(self, tx):
+        if 'checks' not in tx:
+            prevalidate([tx])
+
+        success, fail_reason = self.check_sender(tx)
+        self.state.applied_tx_hash = tx['transaction_hash']
+        self.last_tx = tx
+        self.txs_since_commit += 1
         if not success:
             if self.status_txs_enabled:
-                self.transactions_status.append({"transaction_hash": tx['transaction_hash'],
-                                                 "success": False,
-                                                 'tick': None,
-                                                 'op_code': None,
-                                                 'initiator': f"{tx['in_msg_src_addr_workchain_id']}:{tx['in_msg_src_addr_address_hex']}",
-                                                 'mint_amount': 0,
-                                                 'transfer_amount': 0,
-                                                 'transfer_to': None,
-                                                 'memo': None,
-                                                 'in_msg_created_lt': tx['in_msg_created_lt'],
-                                                 "fail_reason": fail_reason if fail_reason else "no"})
+                t = perf_counter()
+                self.status_sink.add(self.failed_status(tx, fail_reason))
+                timers.add('status_buffer', perf_counter() - t)
 
             return success, fail_reason
 
-        if tx['in_msg_comment']['op'] == 'transfer':
-            success, fail_reason = self.transfer(tx)
-        elif tx['in_msg_comment']['op'] == 'mint':
-            success, fail_reason = self.mint(tx)
-        elif tx['in_msg_comment']['op'] == 'deploy':
-            success, fail_reason = self.deploy(tx)
+        success, fail_reason = self.apply(tx)
+        self.add_status(self.applied_status(tx, success, fail_reason))
 
-        txs = convert_tx(tx)
-        txs['success'] = success
-        txs['fail_reason'] = fail_reason if fail_reason else 'no'
-
-        if self.status_txs_enabled:
-            self.transactions_status.append(txs)
+        self.flush_dirty()
 
         self.uncommited_txs += 1
         if self.uncommited_txs == self.commit_state_each_x_txs:
@@ -366,29 +438,128 @@ class Ton20Logic:
 
         return success, fail_reason
 
-    def commit(self, last_tx):
+    def resume_context(self) -> bytes:
+        """State of checks that isn't reset by checkpoint: sender window & count of commit_state_each_x_txs"""
+        return json.dumps({'uncommited_txs': self.uncommited_txs, 'window': self.by_block_by_account.dump()})
+
+    def checkpoint_due(self) -> bool:
+        # Latest state is taken by in_msg_created_lt, so commits never share it
+        if not self.txs_since_commit or self.last_tx['in_msg_created_lt'] == self.committed_lt:
+            return False
+
+        if self.checkpoint_requested:
+            return True
+
+        if self.commit_each_seconds and time() - self.committed_at >= self.commit_each_seconds:
+            return True
+
+        return bool(self.commit_dirty_each) and self.state.changed_size() >= self.commit_dirty_each
+
+    def checkpoint(self) -> bool:
+        """Commit at latest processed tx if it's due, returns True if committed"""
+
+        if not self.checkpoint_due():
+            return False
+
+        logger.info(f"Start checkpoint commit, txs since latest commit: {self.txs_since_commit}")
+        self.commit(self.last_tx, checkpoint=True)
+        return True
+
+    def commit(self, last_tx, checkpoint=False):
+        """
+        Commit each commit_state_each_x_txs clears sender window and restarts count, so commit points are
+        the same on each run. Checkpoint keeps them and saves them with state, restart from it gives the same result
+        """
         if self.max_mc_ref is None:
             logger.warning(f"There's no success transactions in current batch")
         else:
-            self.clear_by_block_by_account()
+            resume_context = None
+            if checkpoint:
+                resume_context = self.resume_context()
+            else:
+                self.clear_by_block_by_account()
+            logger.info(f"Address cache: {address_cache.stats()}")
 
-            logger.info(f"Start dump TransactionStatus")
-            t = time()
-            self.bulk_insert_status()
+            if self.commit_in_flight:
+                self.submit_commit(last_tx, resume_context)
+            else:
+                self.save_commit(last_tx, resume_context)
 
-            logger.info(f"TransactionStatus created at: {time() - t}")
+            if not checkpoint:
+                self.uncommited_txs = 0
 
-            logger.info(f"Start serialize state")
-            t = time()
-            serialized_state = self.state.serialize(last_tx)
+            self.txs_since_commit = 0
+            self.committed_at = time()
+            self.committed_lt = last_tx['in_msg_created_lt']
+            self.checkpoint_requested = False
+
+    def submit_commit(self, last_tx, resume_context=None):
+        """Freeze changes and pass them to CommitPipeline, state image is written once its full snapshot is durable"""
+
+        if self.commits is None:
+            self.start_commits()
+
+        t = time()
+        changes = self.state.freeze()
+        stats_rows = self.tick_stats.rows(self.state)
+        timers.add('commit.freeze', time() - t)
 
-            logger.info(f"Serialize state at: {time() - t}")
+        t = time()
+        job = self.commits.submit(changes, last_tx, stats_rows, resume_context)
+        timers.add('commit.submit', time() - t)
+        logger.info(f"Commit queued at: {time() - t}, in flight: {self.commits.in_flight()}, "
+                    f"latest durable: {self.commits.durable}")
+
+        if job.chain_seqno == 0 and self.state_image_dir:
             t = time()
-            total_state = Ton20StateSerialized(state_hash=serialized_state.get_hash(),
-                                               in_msg_created_lt=int(last_tx['in_msg_created_lt']),
-                                               transaction_hash=last_tx['transaction_hash'],
-                                               state_boc=serialized_state.to_boc())
+            self.commits.flush()
+            self.write_state_image(job.state_hash, last_tx, job.state_boc)
+            timers.add('commit.image', time() - t)
+            logger.info(f"Saved state image at: {time() - t}")
+
+    def save_commit(self, last_tx, resume_context=None):
+        logger.info(f"Start dump TransactionStatus")
+        t = time()
+        self.status_sink.flush()
+        timers.add('commit.status_flush', time() - t)
+
+        logger.info(f"TransactionStatus created at: {time() - t}")
+
+        logger.info(f"Start serialize state")
+        t = time()
+
+        delta = None
+        if self.base_state_hash is not None and self.chain_seqno + 1 < self.snapshot_full_each:
+            delta = self.state.build_delta(last_tx)
+            timers.add('commit.delta', time() - t)
+
+        serialize_started = time()
+        serialized_state = self.state.serialize(last_tx)
+        state_hash = serialized_state.get_hash()
+        timers.add('commit.serialize', time() - serialize_started)
+
+        logger.info(f"Serialize state at: {time() - t}")
+        t = time()
+        stats_rows = self.tick_stats.rows(self.state)
+
+        if delta is None:
+            self.base_state_hash = state_hash
+            self.chain_seqno = 0
+            total_state = snapshot_row(state_hash, last_tx, state_hash, state_boc=serialized_state.to_boc(),
+                                       resume_context=resume_context)
+        else:
+            self.chain_seqno += 1
+            total_state = snapshot_row(state_hash, last_tx, self.base_state_hash, self.chain_seqno, delta=delta,
+                                       resume_context=resume_context)
+
+        with transaction.atomic():
             total_state.save()
-            logger.info(f"Saved state to db at: {time() - t}")
+            save_tick_stats(stats_rows)
+        timers.add('commit.save', time() - t)
+        logger.info(f"Saved state to db at: {time() - t}")
 
-            self.uncommited_txs = 0
+        if delta is None and self.state_image_dir:
+            t = time()
+            self.write_state_image(state_hash, last_tx, total_state.state_boc)
+            timers.add('commit.image', time() - t)
+            logger.info(f"Saved state image at: {time() - t}")
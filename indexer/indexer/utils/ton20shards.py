@@ -0,0 +1,221 @@
+import traceback
+import zlib
+from multiprocessing import get_context
+from time import perf_counter
+from loguru import logger
+
+from indexer.utils.shard_process import run_shard_worker
+from indexer.utils.ton20checks import prevalidate
+from indexer.utils.ton20logic import Ton20Logic, Ton20Ops
+from indexer.utils.ton20state import Ton20State
+from indexer.utils.stage_timers import timers
+from indexer.utils.wallet_store import TickWallets
+
+# Fields of tx used by ops & TransactionStatus, only they are sent to shard workers
+# initiator is set by sender checks
+SHARD_TX_FIELDS = ['in_msg_comment', 'initiator', 'transaction_hash', 'in_msg_created_lt']
+
+
+def tick_shard(tick: str, shards: int) -> int:
+    return zlib.crc32(tick.encode()) % shards
+
+
+def tx_tick(tx) -> str:
+    """Tick used for sharding, txs without str tick fail before any state check, so any shard fits them"""
+
+    tick = tx['in_msg_comment'].get('tick')
+    return tick.lower() if isinstance(tick, str) else ''
+
+
+def shard_worker(conn):
+    """
+    Owns ticks of one shard, commands:
+
+    ('load', [(tick, tick data, TickWallets.export()), ...]) -> None
+    ('apply', [tx, ...]) -> ([status, ...], changes), txs are in order
+    ('stop', None) - exit without reply
+    """
+
+    ops = Ton20Ops(Ton20State())
+    state = ops.state
+
+    while True:
+        command, payload = conn.recv()
+
+        if command == 'stop':
+            break
+
+        try:
+            result = None
+
+            if command == 'load':
+                for tick, data, (addresses, amounts, txhashes) in payload:
+                    state.ticks[tick] = data
+                    wallets = state.wallets[tick] = TickWallets(state.addresses)
+
+                    for i, address in enumerate(addresses):
+                        wallets.append(address, amounts[i], txhashes[i * 32:(i + 1) * 32])
+            elif command == 'apply':
+                statuses = []
+                for tx in prevalidate(payload):
+                    success, fail_reason = ops.apply(tx)
+                    statuses.append(ops.applied_status(tx, success, fail_reason))
+
+                result = statuses, state.collect_changes()
+
+                # Main process keeps DB dirty sets & serialization, shard only reports changes
+                state.changed_wallets = {}
+                state.to_update_ticks = set()
+                state.to_update_wallets = set()
+                state.to_delete_wallets = set()
+            else:
+                raise ValueError(f"Unknown command: {command}")
+
+            conn.send(('ok', result))
+        except Exception as e:
+            conn.send(('error', traceback.format_exc()))
+
+
+class ShardedTon20Logic(Ton20Logic):
+    """
+    Ton20Logic with ops applied in worker processes, each worker owns ticks of its shard:
+
+    1. sender checks (per block counters, account types) run in main process in tx order
+    2. txs passed them are applied in tick shards in parallel, order inside of shard is kept
+    3. changes of shards are merged into main state, statuses are put back in tx order
+
+    Ticks never share balances, so state & TransactionStatus rows are the same as of serial run.
+    Each chunk ends at commit point, so snapshots are taken at the same txs too.
+    """
+
+    def __init__(self, *args, apply_workers=2, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.apply_workers = apply_workers
+        self.workers = None
+
+    def start_workers(self):
+        """Start workers and send them ticks of current state"""
+
+        context = get_context("spawn")
+        self.workers = []
+
+        for _ in range(self.apply_workers):
+            conn, child_conn = context.Pipe()
+            process = context.Process(target=run_shard_worker, args=(child_conn,), daemon=True)
+            process.start()
+            self.workers.append((process, conn))
+
+        shards = [[] for _ in self.workers]
+        for tick in self.state.ticks:
+            shards[tick_shard(tick, len(self.workers))].append(
+                (tick, self.state.ticks[tick], self.state.wallets[tick].export()))
+
+        self.request('load', shards)
+        logger.info(f"Started {len(self.workers)} shard workers, ticks: {len(self.state.ticks)}")
+
+    def request(self, command, payloads) -> list:
+        """Send command with own payload to each worker, returns results in workers order"""
+
+        for (_, conn), payload in zip(self.workers, payloads):
+            conn.send((command, payload))
+
+        results = []
+        for _, conn in self.workers:
+            status, result = conn.recv()
+            if status == 'error':
+                raise RuntimeError(f"Shard worker failed:\n{result}")
+
+            results.append(result)
+
+        return results
+
+    def stop_workers(self):
+        if self.workers is None:
+            return
+
+        for _, conn in self.workers:
+            conn.send(('stop', None))
+
+        for process, _ in self.workers:
+            process.join()
+
+        self.workers = None
+
+    def finalize(self):
+        super().finalize()
+        self.stop_workers()
+
+    def add_transaction(self, tx):
+        self.add_transactions([tx])
+
+    def add_transactions(self, txs):
+        if self.workers is None:
+            self.start_workers()
+
+        self.prefetch_accounts(txs)
+
+        position = 0
+        while position < len(txs):
+            position = self.add_chunk(txs, position)
+
+        self.checkpoint()
+        timers.dump_if_due()
+
+    def add_chunk(self, txs, start) -> int:
+        """Add txs from start up to the end or commit point, returns index of first not added tx"""
+
+        shards = [[] for _ in self.workers]
+
+        # Status of each tx in order: failed status or (shard, index in shard) of applied tx
+        order = []
+        commit_tx = None
+        end = start
+
+        while end < len(txs):
+            tx = txs[end]
+            end += 1
+
+            success, fail_reason = self.check_sender(tx)
+            if not success:
+                order.append(self.failed_status(tx, fail_reason))
+                continue
+
+            shard = tick_shard(tx_tick(tx), len(shards))
+            order.append((shard, len(shards[shard])))
+            shards[shard].append({field: tx[field] for field in SHARD_TX_FIELDS})
+
+            self.uncommited_txs += 1
+            if self.uncommited_txs == self.commit_state_each_x_txs:
+                commit_tx = tx
+                break
+
+        self.last_tx = txs[end - 1]
+        self.txs_since_commit += end - start
+
+        # Ops run in workers, main process times whole round trip of shards
+        t = perf_counter()
+        results = self.request('apply', shards)
+        timers.add('shard.apply', perf_counter() - t, end - start)
+
+        t = perf_counter()
+        for _, changes in results:
+            self.state.merge_changes(changes)
+        timers.add('shard.merge', perf_counter() - t)
+
+        self.state.applied_tx_hash = txs[end - 1]['transaction_hash']
+
+        for i in order:
+            if isinstance(i, dict):
+                if self.status_txs_enabled:
+                    self.status_sink.add(i)
+            else:
+                shard, index = i
+                self.add_status(results[shard][0][index])
+
+        self.flush_dirty()
+
+        if commit_tx is not None:
+            logger.info(f"Start commit batch")
+            self.commit(commit_tx)
+
+        return end
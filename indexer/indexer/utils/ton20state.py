@@ -1,61 +1,114 @@
 import codecs
+import zlib
+from multiprocessing import get_context
+from time import time
 
-from tonpy import CellBuilder, VmDict, Address, Cell, CellSlice
-from tqdm import tqdm
+import orjson as json
 
-from indexer.models import Ton20Tick, Ton20Wallet
+from tonpy import VmDict, Cell, CellSlice
+
+from indexer.models import Ton20Tick, Ton20Wallet, Ton20DbWatermark
 from django.db import connection, transaction
 from django.db.models import Q
 from loguru import logger
-import psycopg2.extras
 
-from indexer.utils.chunks import chunks
+from indexer.utils.pgcopy import copy_binary, copy_upsert, encode_text
+from indexer.utils.wallet_store import AddressTable, TickWallets, LazyWallets
+from indexer.utils.state_image import StateImage, write_state_image, wallet_record
+from indexer.utils.ton20cells import tick_key, wallet_key, wallet_value, build_wallets_dict, build_wallets_boc, \
+    tick_header, state_cell, tick_wallets_dict, delete_wallet
 
+# Smaller ticks are cheaper to build in place than to pickle into pool
+PARALLEL_MIN_WALLETS = 10000
 
-def bulk_upsert(model, conflict_fields, update_fields, records):
-    if not records:
-        return
 
-    table_name = model._meta.db_table
-    columns = [field.column for field in model._meta.fields if field.column != 'id']
-    conflict_fields_str = ', '.join(conflict_fields)
-    update_fields_str = ', '.join([f"{field}=EXCLUDED.{field}" for field in update_fields])
+def bulk_delete_wallets(pairs):
+    """Delete (tick, wallet) pairs: stream them to temp table with COPY and delete with one join"""
+    if not pairs:
+        return
 
-    values_list = []
-    for record in records:
-        values = [getattr(record, field) for field in columns]
-        values_list.append(values)
+    table_name = Ton20Wallet._meta.db_table
 
-    sql = f"""
-        INSERT INTO {table_name} ({', '.join(columns)}) VALUES %s
-        ON CONFLICT ({conflict_fields_str}) DO UPDATE SET {update_fields_str}
-    """
     with connection.cursor() as cursor:
-        psycopg2.extras.execute_values(cursor, sql, values_list)
+        cursor.execute("DROP TABLE IF EXISTS ton20_wallet_delete")
+        cursor.execute("CREATE TEMP TABLE ton20_wallet_delete (tick varchar(255), wallet varchar(78))")
+        copy_binary(cursor, "ton20_wallet_delete", ['tick', 'wallet'], [encode_text, encode_text], pairs)
+        cursor.execute(f"""
+            DELETE FROM {table_name} w USING ton20_wallet_delete d
+            WHERE w.tick = d.tick AND w.wallet = d.wallet
+        """)
+        deleted = cursor.rowcount
+        cursor.execute("DROP TABLE ton20_wallet_delete")
+
+    return deleted
+
+
+def encode_delta(delta: dict) -> bytes:
+    return zlib.compress(json.dumps(delta))
+
+
+def decode_delta(data) -> dict:
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+def changes_delta(changes: dict, last_tx) -> dict:
+    """Ton20StateSerialized delta of Ton20State.collect_changes()"""
+
+    return {
+        'last_tx': {
+            'lt': str(last_tx['lt']),
+            'transaction_hash': last_tx['transaction_hash'],
+            'mc_ref_seqno': int(last_tx['mc_ref_seqno'])
+        },
+        'ticks': {tick: [str(max_), str(lim_), str(rest_), deploy_by, txhash]
+                  for tick, (max_, lim_, rest_, deploy_by, txhash) in changes['ticks'].items()},
+        'wallets': {tick: [[wallet, str(amount), txhash] for wallet, amount, txhash in wallets]
+                    for tick, wallets in changes['wallets'].items()},
+        'deleted': changes['deleted']
+    }
 
 
 class Ton20State:
     """Here's no checks, just serialization & deserialization"""
 
-    def __init__(self, boc: str = None):
+    def __init__(self, boc: str = None, incremental_serialize: bool = False, serialize_workers: int = 0):
         self.ticks = {}
+
+        # {tick: TickWallets}, addresses are interned once for all ticks
+        self.addresses = AddressTable()
         self.wallets = {}
-        self.to_update_ticks = []
-        self.to_update_wallets = []
+        # Dirty entries to save to DB: {tick}, {(tick, wallet)}
+        self.to_update_ticks = set()
+        self.to_update_wallets = set()
         self.to_delete_wallets = set()
 
+        # Latest applied transaction, Ton20Wallet / Ton20Tick tables are equal to state at it after save_to_db
+        self.applied_tx_hash = None
+
+        # Wallets touched since latest serialize: {tick: {wallet, ...}}
+        self.changed_wallets = {}
+
+        # Keep dictionaries alive between serializations and re-encode only changed wallets & ticks
+        self.incremental_serialize = incremental_serialize
+        self.ticks_dict = None
+        self.wallets_dicts = {}
+
+        # Ticks loaded from state image, their wallets dicts are taken from ticks_dict root on first change
+        self.lazy_wallets_dicts = set()
+
+        # Build wallets dicts of large ticks in worker processes
+        self.serialize_workers = serialize_workers
+        self.pool = None
+
     def create_wallet(self, tick_: str, wallet_: str):
-        if frozenset([tick_, wallet_]) in self.to_delete_wallets:
+        if (tick_, wallet_) in self.to_delete_wallets:
             logger.info(f"Will move back: {tick_}, {wallet_}")
-            self.to_delete_wallets.remove(frozenset([tick_, wallet_]))
+            self.to_delete_wallets.remove((tick_, wallet_))
 
-        self.wallets[tick_][wallet_] = {
-            'amount': 0,
-            'txhash': '0' * 64
-        }
+        self.wallets[tick_].set(wallet_, 0, '0' * 64)
 
     def deploy(self, tick_: str, max_: int, lim_: int, address: str, txhash: str):
-        self.wallets[tick_] = {}
+        self.wallets[tick_] = TickWallets(self.addresses)
         self.ticks[tick_] = {
             'max': max_,
             'lim': lim_,
@@ -63,87 +116,151 @@ class Ton20State:
             'deploy_by': address,
             'txhash': txhash
         }
-        self.to_update_ticks.append(tick_)
+        self.to_update_ticks.add(tick_)
+        self.changed_wallets.setdefault(tick_, set())
 
     def mint(self, tick_: str, wallet_: str, amt_: int, txhash: str):
         if wallet_ not in self.wallets[tick_]:
             self.create_wallet(tick_, wallet_)
 
-        self.wallets[tick_][wallet_]['amount'] += amt_
-        self.wallets[tick_][wallet_]['txhash'] = txhash
+        self.wallets[tick_].add(wallet_, amt_, txhash)
         self.ticks[tick_]['rest'] -= amt_
-        self.to_update_wallets.append([tick_, wallet_])
+        self.to_update_ticks.add(tick_)
+        self.to_update_wallets.add((tick_, wallet_))
+        self.changed_wallets.setdefault(tick_, set()).add(wallet_)
 
     def transfer(self, tick_: str, from_: str, to_: str, amt_: int, txhash: str):
-        self.wallets[tick_][from_]['amount'] -= amt_
-        self.wallets[tick_][from_]['txhash'] = txhash
+        wallets = self.wallets[tick_]
 
-        if self.wallets[tick_][from_]['amount'] == 0:
-            self.to_delete_wallets.add(frozenset([tick_, from_]))
+        if wallets.add(from_, -amt_, txhash) == 0:
+            self.to_delete_wallets.add((tick_, from_))
             logger.info(f"Will delete: {tick_}, {from_}")
-            del self.wallets[tick_][from_]
+            wallets.remove(from_)
 
-        if to_ not in self.wallets[tick_]:
+        if to_ not in wallets:
             self.create_wallet(tick_, to_)
 
-        self.wallets[tick_][to_]['amount'] += amt_
-        self.wallets[tick_][to_]['txhash'] = txhash
-        self.to_update_wallets.extend([[tick_, to_], [tick_, from_]])
+        wallets.add(to_, amt_, txhash)
+        self.to_update_wallets.add((tick_, to_))
+        self.to_update_wallets.add((tick_, from_))
+        self.changed_wallets.setdefault(tick_, set()).update((from_, to_))
 
     def serialize(self, last_tx) -> Cell:
-        lt = last_tx['lt']
-        txhash = last_tx['transaction_hash']
-        mc_ref_seqno = int(last_tx['mc_ref_seqno'])
-
-        # walletinfo$_ amount:uint256 last_txhash:bits256 = WalletInfo;
-        #
-        # tickinfo$000 max:uint256 lim:uint256 rest:uint256
-        #             ^[deploy_by:MsgAddressInt deploy_txhash:bits256]
-        #             wallets:(HashmapE 264 WalletInfo) = TickInfo;
-        #
-        # ton20state#64746f6e last_tx_hash:uint256 last_tx_lt:uint64 master_ref_seqno:uint32
-        #                 ticks:(HashmapE 256 TickInfo) = Ton20State;
+        if self.incremental_serialize:
+            ticks_cell = self.serialize_ticks_incremental()
+        else:
+            ticks_cell = self.serialize_ticks()
+
+        self.changed_wallets = {}
+        return state_cell(last_tx, ticks_cell)
+
+    def build_wallets_cells(self, ticks) -> dict:
+        """Build wallets dicts of ticks from scratch, returns {tick: root cell or None if tick has no wallets}"""
+
+        cells = {}
+        parallel = []
+
+        for tick in ticks:
+            wallets = self.wallets[tick]
+
+            if len(wallets) == 0:
+                cells[tick] = None
+            elif self.serialize_workers > 1 and len(wallets) >= PARALLEL_MIN_WALLETS:
+                parallel.append(tick)
+            else:
+                cells[tick] = build_wallets_dict(wallets.items()).get_cell()
+
+        if parallel:
+            if self.pool is None:
+                self.pool = get_context("spawn").Pool(self.serialize_workers)
+
+            bocs = self.pool.imap(build_wallets_boc, (self.wallets[tick].export() for tick in parallel))
+            for tick, boc in zip(parallel, bocs):
+                cells[tick] = Cell(boc)
+
+        return cells
 
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def serialize_ticks(self) -> Cell:
         ticks = VmDict(256, False)
+        wallets_cells = self.build_wallets_cells(self.ticks)
 
         for tick in self.ticks:
-            tick_header = CellBuilder() \
-                .store_bitstring('000') \
-                .store_uint(self.ticks[tick]['max'], 256) \
-                .store_uint(self.ticks[tick]['lim'], 256) \
-                .store_uint(self.ticks[tick]['rest'], 256) \
-                .store_ref(CellBuilder().store_address(self.ticks[tick]['deploy_by']) \
-                           .store_uint(int(self.ticks[tick]['txhash'], 16), 256).end_cell())
-
-            if len(self.wallets[tick]) == 0:
-                tick_header = tick_header.store_uint(0, 1)
+            ticks[tick_key(tick)] = tick_header(self.ticks[tick], wallets_cells[tick])
+
+        return ticks.get_cell()
+
+    def serialize_ticks_incremental(self) -> Cell:
+        """Apply only wallets & ticks changed since latest serialize to persistent dictionaries"""
+
+        if self.ticks_dict is None:
+            self.ticks_dict = VmDict(256, False)
+
+        # Ticks without persistent dict yet are built from scratch, all their wallets are changed anyway
+        new_ticks = set()
+        for tick in self.changed_wallets:
+            if tick in self.wallets_dicts:
+                continue
+
+            if tick in self.lazy_wallets_dicts:
+                self.lazy_wallets_dicts.discard(tick)
+                self.wallets_dicts[tick] = self.load_wallets_dict(tick)
             else:
-                vmdict = VmDict(264, False)
+                new_ticks.add(tick)
+
+        for tick, cell in self.build_wallets_cells(new_ticks).items():
+            self.wallets_dicts[tick] = VmDict(264, False) if cell is None else VmDict(264, cell_root=cell)
 
-                for wallet in self.wallets[tick]:
-                    a = Address(wallet)
+        for tick, changed in self.changed_wallets.items():
+            wallets = self.wallets[tick]
+            wallets_dict = self.wallets_dicts[tick]
 
-                    key = CellBuilder() \
-                        .store_int(a.wc, 8) \
-                        .store_uint(int(a.address, 16), 256) \
-                        .end_cell().begin_parse()
+            if tick in new_ticks:
+                changed = ()
 
-                    vmdict.set_builder_keycs(key, CellBuilder() \
-                                             .store_uint(self.wallets[tick][wallet]['amount'], 256) \
-                                             .store_uint(int(self.wallets[tick][wallet]['txhash'], 16), 256))
+            for wallet in changed:
+                if wallet in wallets:
+                    wallets_dict.set_builder_keycs(wallet_key(wallet),
+                                                   wallet_value(wallets.get_amount(wallet), wallets.get_txhash(wallet)))
+                else:
+                    delete_wallet(wallets_dict, wallet)
 
-                tick_header = tick_header.store_uint(1, 1).store_ref(vmdict.get_cell())
+            wallets_cell = wallets_dict.get_cell() if len(wallets) > 0 else None
+            self.ticks_dict[tick_key(tick)] = tick_header(self.ticks[tick], wallets_cell)
 
-            ticks[int(tick.encode().hex(), 16)] = tick_header.end_cell()
+        return self.ticks_dict.get_cell()
 
-        return CellBuilder() \
-            .store_uint(0x64746f6e, 32) \
-            .store_uint(int(txhash, 16), 256) \
-            .store_uint(int(lt), 64) \
-            .store_uint(int(mc_ref_seqno), 32) \
-            .store_uint(1, 1) \
-            .store_ref(ticks.get_cell()) \
-            .end_cell()
+    def load_wallets_dict(self, tick) -> VmDict:
+        """Wallets dict of tick stored in persistent ticks dict"""
+
+        return tick_wallets_dict(self.ticks_dict, tick)
+
+    def release_ticks_dict(self) -> VmDict:
+        """
+        Ticks dict of current state for serialization outside of state, see CommitPipeline
+
+        Changes since latest serialize are kept for freeze. State drops its own persistent dictionaries,
+        serialize must not be called after it
+        """
+
+        if self.incremental_serialize:
+            self.serialize_ticks_incremental()
+            ticks = self.ticks_dict
+        elif self.ticks:
+            ticks = VmDict(256, cell_root=self.serialize_ticks())
+        else:
+            ticks = VmDict(256, False)
+
+        self.incremental_serialize = False
+        self.ticks_dict = None
+        self.wallets_dicts = {}
+        self.lazy_wallets_dicts = set()
+        return ticks
 
     def process_tick_wallet(self, tick):
         def process_wallet(key, value):
@@ -153,10 +270,7 @@ class Ton20State:
 
             amount = value.load_uint(256)
             last_txhash = hex(value.load_uint(256)).upper()[2:].zfill(64)
-            self.wallets[tick][address] = {
-                'amount': amount,
-                'txhash': last_txhash
-            }
+            self.wallets[tick].set(address, amount, last_txhash)
             return True
 
         return process_wallet
@@ -182,98 +296,322 @@ class Ton20State:
             'txhash': tick_deploy_txhash
         }
 
-        self.wallets[tick] = {}
+        self.wallets[tick] = TickWallets(self.addresses)
         if value.load_bool():
             c = value.load_ref()
             wallets = VmDict(256 + 8, cell_root=c)
             wallets.map(self.process_tick_wallet(tick))
 
+            if self.incremental_serialize:
+                self.wallets_dicts[tick] = wallets
+
         return True
 
-    def deserialize(self, state_boc, latest_lt, latest_hash):
-        logger.info(f"Start state deseiralize")
+    def collect_changes(self) -> dict:
+        """Ticks & wallets changed since latest serialize, same layout as delta with int values"""
+
+        ticks = {}
+        wallets = {}
+        deleted = {}
+
+        for tick, changed in self.changed_wallets.items():
+            data = self.ticks[tick]
+            ticks[tick] = [data['max'], data['lim'], data['rest'], data['deploy_by'], data['txhash']]
+
+            tick_wallets = self.wallets[tick]
+            for wallet in changed:
+                if wallet in tick_wallets:
+                    wallets.setdefault(tick, []).append(
+                        [wallet, tick_wallets.get_amount(wallet), tick_wallets.get_txhash(wallet)])
+                else:
+                    deleted.setdefault(tick, []).append(wallet)
+
+        return {'ticks': ticks, 'wallets': wallets, 'deleted': deleted}
+
+    def freeze(self) -> dict:
+        """
+        collect_changes() with wallets count of each changed tick, next changes are collected from scratch
+
+        Result holds only copied values, so state can be changed while it is serialized in background
+        """
+
+        changes = self.collect_changes()
+        changes['sizes'] = {tick: len(self.wallets[tick]) for tick in changes['ticks']}
+
+        self.changed_wallets = {}
+        return changes
+
+    def build_delta(self, last_tx) -> dict:
+        """Changes since latest serialize, must be called before serialize"""
+
+        return changes_delta(self.collect_changes(), last_tx)
+
+    def merge_changes(self, changes: dict):
+        """Apply collect_changes() of other state (tick shard) and mark changed entries dirty"""
+
+        self.apply_delta(changes)
+        self.to_update_ticks.update(changes['ticks'])
+
+        for tick, wallets in changes['wallets'].items():
+            for wallet, _, _ in wallets:
+                self.to_delete_wallets.discard((tick, wallet))
+                self.to_update_wallets.add((tick, wallet))
+
+        for tick, wallets in changes['deleted'].items():
+            for wallet in wallets:
+                self.to_delete_wallets.add((tick, wallet))
+
+    def apply_deltas(self, deltas):
+        """Apply Ton20StateSerialized deltas in chain order, returns last_tx of latest one"""
+
+        last_tx = None
+        for i in deltas.iterator():
+            delta = decode_delta(i.delta)
+            self.apply_delta(delta)
+            last_tx = delta['last_tx']
+
+        return last_tx
+
+    def apply_delta(self, delta: dict):
+        for tick, (max_, lim_, rest_, deploy_by, txhash) in delta['ticks'].items():
+            if tick not in self.wallets:
+                self.wallets[tick] = TickWallets(self.addresses)
+
+            self.ticks[tick] = {
+                'max': int(max_),
+                'lim': int(lim_),
+                'rest': int(rest_),
+                'deploy_by': deploy_by,
+                'txhash': txhash
+            }
+            self.changed_wallets.setdefault(tick, set())
+
+        for tick, wallets in delta['wallets'].items():
+            for wallet, amount, txhash in wallets:
+                self.wallets[tick].set(wallet, int(amount), txhash)
+                self.changed_wallets[tick].add(wallet)
+
+        for tick, wallets in delta['deleted'].items():
+            for wallet in wallets:
+                if wallet in self.wallets[tick]:
+                    self.wallets[tick].remove(wallet)
+                self.changed_wallets[tick].add(wallet)
+
+    @staticmethod
+    def parse_header(state_boc):
+        """(last_tx_hash, last_tx_lt, master_ref_seqno, ticks dict) of state BOC, ticks are not walked"""
+
         cc = CellSlice(state_boc)
         assert cc.load_uint(32) == 0x64746f6e
 
         last_tx_hash = hex(cc.load_uint(256)).upper()[2:].zfill(64)
-        logger.info(f"Last tx hash: {last_tx_hash} / {latest_hash}")
-        # assert last_tx_hash == latest_hash
-
         last_tx_lt = cc.load_uint(64)
         master_ref_seqno = cc.load_uint(32)
         ticks = VmDict(256, cell_root=cc.load_ref())
 
+        return last_tx_hash, last_tx_lt, master_ref_seqno, ticks
+
+    def load(self, state_boc):
+        """Load state from BOC without touching DB, returns (last_tx_hash, last_tx_lt, master_ref_seqno)"""
+
+        last_tx_hash, last_tx_lt, master_ref_seqno, ticks = self.parse_header(state_boc)
+
         logger.info(f"Start load ticks")
         ticks.map(self.process_tick)
 
-        self.to_update_ticks = list(self.ticks.keys())
-        self.to_update_wallets = [(tick, wallet) for tick in self.wallets for wallet in self.wallets[tick]]
+        self.changed_wallets = {}
+        if self.incremental_serialize:
+            self.ticks_dict = ticks
+
+        return last_tx_hash, last_tx_lt, master_ref_seqno
+
+    def mark_db_difference(self):
+        """Compare Ton20Tick / Ton20Wallet tables with loaded state and mark only differences to save"""
+
+        db_ticks = set()
+        for tick, max_, lim_, rest_, deploy_by, txhash in Ton20Tick.objects.values_list(
+                'tick', 'max', 'lim', 'rest', 'deploy_by', 'txhash').iterator():
+            data = self.ticks.get(tick)
+            if data is None:
+                continue
+
+            db_ticks.add(tick)
+            if (max_, lim_, rest_, deploy_by, txhash) != (data['max'], data['lim'], data['rest'],
+                                                          data['deploy_by'], data['txhash']):
+                self.to_update_ticks.add(tick)
+
+        self.to_update_ticks.update(tick for tick in self.ticks if tick not in db_ticks)
+
+        # Wallets are streamed grouped by tick, so only wallets of one tick are kept in memory to find missing ones
+        def mark_missing(tick, seen):
+            if tick in self.wallets:
+                self.to_update_wallets.update((tick, wallet) for wallet in self.wallets[tick] if wallet not in seen)
+
+        current_tick = None
+        seen = set()
+        db_wallet_ticks = set()
+
+        for tick, wallet, amount, txhash in Ton20Wallet.objects.order_by('tick').values_list(
+                'tick', 'wallet', 'amount', 'txhash').iterator(chunk_size=10000):
+            if tick != current_tick:
+                mark_missing(current_tick, seen)
+                current_tick = tick
+                seen = set()
+                db_wallet_ticks.add(tick)
+
+            wallets = self.wallets.get(tick)
+            if wallets is None or wallet not in wallets:
+                self.to_delete_wallets.add((tick, wallet))
+                continue
 
-        logger.info(f"Loaded: {len(self.to_update_ticks)} ticks and {len(self.to_update_wallets)} wallets")
+            seen.add(wallet)
+            if amount != wallets.get_amount(wallet) or txhash != wallets.get_txhash(wallet):
+                self.to_update_wallets.add((tick, wallet))
 
+        mark_missing(current_tick, seen)
+
+        for tick in self.wallets:
+            if tick not in db_wallet_ticks:
+                self.to_update_wallets.update((tick, wallet) for wallet in self.wallets[tick])
+
+    def load_image(self, path):
+        """
+        Load ticks from memory-mapped state image, wallets of tick are loaded on first access
+        Returns (last_tx_hash, last_tx_lt, master_ref_seqno)
+        """
+
+        image = StateImage(path)
+        self.ticks = {tick: dict(data) for tick, (data, _, _) in image.ticks.items()}
+        self.wallets = LazyWallets(image, self.addresses)
+
+        if self.incremental_serialize:
+            self.ticks_dict = self.parse_header(image.state_boc())[3]
+            self.lazy_wallets_dicts = set(self.ticks)
+
+        self.changed_wallets = {}
+        return image.last_tx_hash, image.last_tx_lt, image.master_ref_seqno
+
+    def write_image(self, path, state_hash, last_tx, state_boc):
+        def records(tick):
+            # Not touched ticks are copied from loaded image as is
+            if isinstance(self.wallets, LazyWallets) and tick in self.wallets.pending:
+                return self.wallets.image.wallet_records(tick)
+
+            data = sorted(wallet_record(*i) for i in self.wallets[tick].raw_items())
+            return len(data), b''.join(data)
+
+        write_state_image(path, state_hash, last_tx, state_boc, self.ticks, records)
+
+    def deserialize(self, state_boc, latest_lt, latest_hash, warm_restart=False, image_path=None, deltas=None,
+                    state_hash=None):
+        """
+        Load state from state_boc or from state image of chain base with deltas applied after it,
+        then sync Ton20Wallet / Ton20Tick tables
+        """
+
+        logger.info(f"Start state deseiralize")
+        timings = {}
+
+        t = time()
+        if image_path is None:
+            last_tx_hash, last_tx_lt, master_ref_seqno = self.load(state_boc)
+        else:
+            last_tx_hash, last_tx_lt, master_ref_seqno = self.load_image(image_path)
+
+            last_tx = self.apply_deltas(deltas) if deltas is not None else None
+            if last_tx is not None:
+                cell = self.serialize(last_tx)
+                if cell.get_hash() != state_hash:
+                    raise ValueError(f"State hash mismatch after image load: {cell.get_hash()} != {state_hash}")
+
+                last_tx_hash = last_tx['transaction_hash'].upper()
+        timings['load'] = time() - t
+        logger.info(f"Last tx hash: {last_tx_hash} / {latest_hash}")
+        # assert last_tx_hash == latest_hash
+
+        t = time()
+        watermark = Ton20DbWatermark.objects.first() if warm_restart else None
+
+        if watermark is not None and (watermark.transaction_hash or '').upper() == last_tx_hash:
+            logger.info(f"Ton20Wallet / Ton20Tick tables are already at state tx: {last_tx_hash}")
+        elif warm_restart:
+            self.mark_db_difference()
+        else:
+            self.to_update_ticks = set(self.ticks.keys())
+            self.to_update_wallets = {(tick, wallet) for tick in self.wallets for wallet in self.wallets[tick]}
+        timings['compare'] = time() - t
+
+        logger.info(f"Loaded: {len(self.ticks)} ticks, to save: {len(self.to_update_ticks)} ticks, "
+                    f"{len(self.to_update_wallets)} wallets, to delete: {len(self.to_delete_wallets)} wallets")
+
+        t = time()
+        self.applied_tx_hash = last_tx_hash
         self.save_to_db()
+        timings['save'] = time() - t
+
+        logger.info(f"State startup phases: " + ", ".join(f"{k}: {v:.2f}s" for k, v in timings.items()))
+        return timings
+
+    def dirty_size(self) -> int:
+        return len(self.to_update_wallets) + len(self.to_delete_wallets)
+
+    def changed_size(self) -> int:
+        """Wallets changed since latest commit"""
+        return sum(len(changed) for changed in self.changed_wallets.values())
 
     def save_to_db(self):
+        """Save only dirty ticks & wallets"""
+
         logger.info(f"Start saving to db")
-        self.to_update_ticks = set(self.to_update_ticks)
-
-        if len(self.to_update_wallets):
-            self.to_update_wallets = set(frozenset(a) for a in self.to_update_wallets)
-
-            # Prepare data for Ton20Tick
-            tick_objects = []
-            for tick, data in self.ticks.items():
-                if tick in self.to_update_ticks:
-                    tick_objects.append(
-                        Ton20Tick(
-                            tick=tick,
-                            max=data['max'],
-                            lim=data['lim'],
-                            rest=data['rest'],
-                            deploy_by=data['deploy_by'],
-                            txhash=data['txhash']
-                        )
-                    )
-
-            # Prepare data for Ton20Wallet
-            wallet_objects = []
-            for tick, wallets in self.wallets.items():
-                for address, data in wallets.items():
-                    if frozenset([tick, address]) in self.to_update_wallets:
-                        wallet_objects.append(
-                            Ton20Wallet(
-                                wallet=address,
-                                tick=tick,
-                                amount=data['amount'],
-                                txhash=data['txhash']
-                            )
-                        )
+
+        if len(self.to_update_wallets) or len(self.to_update_ticks) or len(self.to_delete_wallets):
+            ticks = self.ticks
+            tick_rows = (
+                (tick, ticks[tick]['max'], ticks[tick]['lim'], ticks[tick]['rest'], ticks[tick]['deploy_by'],
+                 ticks[tick]['txhash']) for tick in self.to_update_ticks
+            )
+
+            # Deleted wallets are skipped
+            wallets = self.wallets
+            wallet_rows = (
+                (address, tick, wallets[tick].get_amount(address), wallets[tick].get_txhash(address))
+                for tick, address in self.to_update_wallets if address in wallets[tick]
+            )
 
             with transaction.atomic():
                 if len(self.to_delete_wallets):
                     logger.info(f"Will delete wallets: {len(self.to_delete_wallets)}")
+                    t = time()
+                    deleted = bulk_delete_wallets(self.to_delete_wallets)
+                    logger.info(f"Deleted wallets: {deleted} at: {time() - t}")
 
-                    for tick, wallet in tqdm(self.to_delete_wallets, desc="delete wallets"):
-                        Ton20Wallet.objects.filter(wallet=wallet, tick=tick).delete()
+                    self.to_delete_wallets = set()
 
-                    self.to_delete_wallets = []
+                copy_upsert(Ton20Tick, ['tick', 'max', 'lim', 'rest', 'deploy_by', 'txhash'],
+                            conflict_fields=['tick'],
+                            update_fields=['max', 'lim', 'rest', 'deploy_by', 'txhash'],
+                            rows=tick_rows)
 
-                for chunk in tqdm(list(chunks(tick_objects)), desc="Ticks insert"):
-                    bulk_upsert(
-                        Ton20Tick,
-                        conflict_fields=['tick'],
-                        update_fields=['max', 'lim', 'rest', 'deploy_by', 'txhash'],
-                        records=chunk
-                    )
+                copy_upsert(Ton20Wallet, ['wallet', 'tick', 'amount', 'txhash'],
+                            conflict_fields=['wallet', 'tick'],
+                            update_fields=['amount', 'txhash'],
+                            rows=wallet_rows)
 
-                for chunk in tqdm(list(chunks(wallet_objects)), desc="Wallets insert"):
-                    bulk_upsert(
-                        Ton20Wallet,
-                        conflict_fields=['wallet', 'tick'],
-                        update_fields=['amount', 'txhash'],
-                        records=chunk
-                    )
+                self.save_watermark()
+        else:
+            self.save_watermark()
 
         logger.info(f"Done insert")
-        self.to_update_ticks = []
-        self.to_update_wallets = []
+        self.to_update_ticks = set()
+        self.to_update_wallets = set()
+
+    def save_watermark(self):
+        if self.applied_tx_hash is None:
+            return
+
+        watermark = Ton20DbWatermark.objects.first()
+        if watermark is None:
+            watermark = Ton20DbWatermark()
+
+        watermark.transaction_hash = self.applied_tx_hash
+        watermark.save()
@@ -0,0 +1,87 @@
+import re
+from datetime import datetime
+
+import orjson as json
+
+# Decoding of transaction feed blocks in spawn worker processes: the module must not import Django or models
+
+# COPY text format escapes, \N is NULL
+COPY_ESCAPE = re.compile(r'\\(?:([0-7]{1,3})|x([0-9a-fA-F]{1,2})|(.))')
+COPY_ESCAPES = {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t', 'v': '\v'}
+
+# Django internal field type -> decoder of COPY text value in decoder process
+# Decimals are sent as str and converted by consumer: pickling Decimal costs more than its decoding
+FIELD_DECODERS = {
+    'AutoField': int,
+    'BigAutoField': int,
+    'IntegerField': int,
+    'BigIntegerField': int,
+    'DateTimeField': datetime.fromisoformat,
+    'BooleanField': lambda value: value == 't',
+}
+
+
+def parse_comment(comment) -> dict:
+    """in_msg_comment as dict, anything else is empty dict"""
+
+    try:
+        comment = json.loads(comment)
+        if not isinstance(comment, dict):
+            comment = {}
+    except KeyboardInterrupt:
+        raise KeyboardInterrupt
+    except Exception as e:
+        comment = {}
+
+    return comment
+
+
+def unescape(value: str) -> str:
+    def replace(match):
+        octal, hexadecimal, char = match.groups()
+        if octal is not None:
+            return chr(int(octal, 8))
+        if hexadecimal is not None:
+            return chr(int(hexadecimal, 16))
+
+        return COPY_ESCAPES.get(char, char)
+
+    return COPY_ESCAPE.sub(replace, value)
+
+
+# Decoders & index of in_msg_comment of decoder process, set by init_decoder
+decoder_types = None
+comment_index = None
+
+
+def init_decoder(types, comment):
+    global decoder_types, comment_index
+
+    decoder_types = [FIELD_DECODERS.get(i) for i in types]
+    comment_index = comment
+
+
+def decode_block(block: bytes) -> list:
+    """Rows of COPY text block as lists of values with in_msg_comment parsed, decimals are left as str"""
+
+    rows = []
+    for line in block.decode().split('\n'):
+        if not line:
+            continue
+
+        row = line.split('\t')
+        for i, decoder in enumerate(decoder_types):
+            value = row[i]
+            if value == '\\N':
+                row[i] = None
+                continue
+
+            if '\\' in value:
+                value = row[i] = unescape(value)
+            if decoder is not None:
+                row[i] = decoder(value)
+
+        row[comment_index] = parse_comment(row[comment_index])
+        rows.append(row)
+
+    return rows
@@ -0,0 +1,196 @@
+import threading
+from collections import deque
+from decimal import Decimal
+from multiprocessing import get_context
+from queue import Queue, Empty, Full
+from time import perf_counter
+
+from django.db import connection
+from django.db.models import Q
+from loguru import logger
+
+from indexer.models import Transaction
+from indexer.utils.stage_timers import timers
+from indexer.utils.tx_decode import init_decoder, decode_block
+
+# Fields of Transaction read by Ton20Logic, its checks & resume, the rest (transaction_boc etc.) is never fetched
+FEED_FIELDS = ['mc_ref_seqno', 'workchain', 'lt', 'account', 'transaction_hash', 'in_msg_comment', 'in_msg_created_lt',
+               'in_msg_created_at', 'in_msg_hash', 'in_msg_src_addr_workchain_id', 'in_msg_src_addr_address_hex']
+FEED_COLUMNS = {'in_msg_comment': "CASE WHEN comment_valid = false THEN NULL ELSE in_msg_comment END"}
+
+
+def feed_query(latest_lt: int, latest_hash=None) -> tuple:
+    """
+    (sql, params) of FEED_FIELDS of txs after (latest_lt, latest_hash) in (in_msg_created_lt, in_msg_hash) order
+
+    latest_hash is in_msg_hash of latest applied tx, without it txs are taken from latest_lt inclusive.
+    Keyset is served by (in_msg_created_lt, in_msg_hash) index, so already applied txs are never read again.
+    """
+
+    # Comments of txs known to be invalid are not sent, logic fails them without reading (as comment_valid=False)
+    columns = ", ".join(FEED_COLUMNS.get(field, field) for field in FEED_FIELDS)
+
+    if latest_hash is None:
+        where, params = "in_msg_created_lt >= %s", [int(latest_lt)]
+    else:
+        where, params = "(in_msg_created_lt, in_msg_hash) > (%s, %s)", [int(latest_lt), latest_hash]
+
+    return f"SELECT {columns} FROM {Transaction._meta.db_table} WHERE {where} " \
+           f"ORDER BY in_msg_created_lt, in_msg_hash", params
+
+
+def new_transactions(latest_lt: int, latest_hash=None):
+    """Queryset of feed_query txs"""
+
+    if latest_hash is None:
+        return Transaction.objects.filter(in_msg_created_lt__gte=latest_lt)
+
+    return Transaction.objects.filter(Q(in_msg_created_lt__gt=latest_lt) |
+                                      Q(in_msg_created_lt=latest_lt, in_msg_hash__gt=latest_hash))
+
+
+def resume_hash(transaction_hash: str):
+    """in_msg_hash of tx of saved state, None if tx is not in DB (e.g. state is loaded from dump)"""
+
+    return Transaction.objects.filter(transaction_hash=transaction_hash).values_list('in_msg_hash', flat=True).first()
+
+
+class CopyWriter:
+    """File-like target of COPY TO STDOUT, cuts stream into blocks of whole rows and puts them to bounded queue"""
+
+    def __init__(self, queue: Queue, stop: threading.Event, block_rows: int):
+        self.queue = queue
+        self.stop = stop
+        self.block_rows = block_rows
+        self.chunks = []
+        self.rows = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.rows += data.count(b'\n')
+
+        if self.rows >= self.block_rows:
+            self.push()
+
+    def push(self, final=False):
+        data = b''.join(self.chunks)
+        end = len(data) if final else data.rfind(b'\n') + 1
+
+        self.chunks = [data[end:]] if end < len(data) else []
+        self.rows = 0
+
+        if end:
+            self.put(data[:end])
+
+    def put(self, item):
+        while True:
+            # Raising here aborts COPY, so reader stops as soon as consumer is gone
+            if self.stop.is_set():
+                raise InterruptedError("Transaction feed is stopped")
+
+            try:
+                self.queue.put(item, timeout=0.5)
+                return
+            except Full:
+                pass
+
+
+class TxFeed:
+    """
+    Transactions of feed_query in (in_msg_created_lt, in_msg_hash) order, read in 3 stages:
+
+    1. reader thread streams rows with COPY TO STDOUT (own DB connection) and cuts them into blocks
+    2. decoder processes convert blocks to tx dicts and parse in_msg_comment
+    3. rows() yields decoded blocks in order of reading
+
+    Memory is bounded: at most max_blocks raw blocks wait for decoders and max_blocks are decoded ahead of consumer.
+    """
+
+    def __init__(self, workers=2, block_rows=1000, max_blocks=None):
+        self.workers = workers
+        self.block_rows = block_rows
+        self.max_blocks = max_blocks or 2 * workers
+
+        self.field_names = FEED_FIELDS
+        types = [Transaction._meta.get_field(field).get_internal_type() for field in FEED_FIELDS]
+        self.decimals = [i for i, field_type in enumerate(types) if field_type == 'DecimalField']
+
+        self.pool = get_context("spawn").Pool(workers, initializer=init_decoder,
+                                              initargs=(types, self.field_names.index('in_msg_comment')))
+
+    def read(self, query: tuple, queue: Queue, stop: threading.Event):
+        try:
+            writer = CopyWriter(queue, stop, self.block_rows)
+            with connection.cursor() as cursor:
+                sql = cursor.mogrify(*query).decode()
+                cursor.copy_expert(f"COPY ({sql}) TO STDOUT", writer)
+
+            writer.push(final=True)
+            writer.put(None)
+        except Exception as e:
+            if not stop.is_set():
+                logger.error(f"Transaction feed reader failed: {e}")
+                try:
+                    writer.put(e)
+                except InterruptedError:
+                    pass
+        finally:
+            connection.close()
+
+    def rows(self, latest_lt: int, latest_hash=None, shutdown=None):
+        """Yields lists of up to block_rows tx dicts of feed_query, ends after current block once shutdown is set"""
+
+        queue = Queue(maxsize=self.max_blocks)
+        stop = threading.Event()
+        reader = threading.Thread(target=self.read, args=(feed_query(latest_lt, latest_hash), queue, stop),
+                                  name='tx-feed-reader', daemon=True)
+        reader.start()
+
+        pending = deque()
+        exhausted = False
+
+        try:
+            while True:
+                # Keep decoders busy while consumer applies previous block
+                while not exhausted and len(pending) < self.max_blocks:
+                    try:
+                        block = queue.get(block=not pending)
+                    except Empty:
+                        break
+
+                    if isinstance(block, Exception):
+                        raise RuntimeError(f"Transaction feed reader failed: {block}") from block
+
+                    if block is None:
+                        exhausted = True
+                    else:
+                        pending.append(self.pool.apply_async(decode_block, (block,)))
+
+                if not pending:
+                    break
+
+                t = perf_counter()
+                rows = pending.popleft().get()
+                timers.add('feed.wait', perf_counter() - t, max(len(rows), 1))
+
+                t = perf_counter()
+                batch = []
+                for row in rows:
+                    for i in self.decimals:
+                        if row[i] is not None:
+                            row[i] = Decimal(row[i])
+
+                    batch.append(dict(zip(self.field_names, row)))
+                timers.add('feed.rows', perf_counter() - t, max(len(rows), 1))
+
+                yield batch
+
+                if shutdown is not None and shutdown.is_set():
+                    break
+        finally:
+            stop.set()
+            reader.join()
+
+    def close(self):
+        self.pool.terminate()
+        self.pool.join()
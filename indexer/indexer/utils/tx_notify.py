@@ -0,0 +1,93 @@
+import os
+import select
+
+import orjson as json
+from django.db import connection, connections
+from loguru import logger
+
+# Channel of start_index -> start_ton20 wakeups, payload: {"seqno": latest mc seqno, "lt": max in_msg_created_lt}
+CHANNEL = 'ton20_new_txs'
+
+
+def notify_new_transactions(seqno: int, lt: int):
+    """Publish inserted batch, delivered to listeners once current transaction (autocommit - this statement) commits"""
+
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_notify(%s, %s)", [CHANNEL, json.dumps({'seqno': seqno, 'lt': lt}).decode()])
+    except Exception as e:
+        # Listeners fall back to polling, so missed notification only delays them
+        logger.error(f"Can't notify about new transactions: {e}")
+
+
+class TxListener:
+    """
+    LISTEN of CHANNEL on own connection (Django connections can be closed & reopened under it)
+
+    Notifications sent while listener is busy are queued by connection, so check & wait has no lost wakeups.
+    interrupt() (safe in signal handler) ends current or next wait right away.
+    """
+
+    def __init__(self, alias='default'):
+        self.alias = alias
+        self.conn = None
+
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        os.set_blocking(self.wakeup_write, False)
+
+    def connect(self):
+        wrapper = connections[self.alias]
+        self.conn = wrapper.get_new_connection(wrapper.get_connection_params())
+        self.conn.autocommit = True
+
+        with self.conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {CHANNEL}")
+
+    def wait(self, timeout: float):
+        """Block till notification or timeout, returns payload of latest notification or None"""
+
+        try:
+            if self.conn is None:
+                self.connect()
+
+            if not self.conn.notifies:
+                ready = select.select([self.conn, self.wakeup_read], [], [], timeout)[0]
+
+                if self.wakeup_read in ready:
+                    os.read(self.wakeup_read, 1024)
+                    return None
+
+                if ready:
+                    self.conn.poll()
+
+            if not self.conn.notifies:
+                return None
+
+            payload = self.conn.notifies[-1].payload
+            self.conn.notifies.clear()
+
+            return json.loads(payload)
+        except Exception as e:
+            logger.error(f"LISTEN {CHANNEL} failed, reconnect on next wait: {e}")
+            self.close()
+
+            # Keep polling interval while DB is unavailable
+            if select.select([self.wakeup_read], [], [], timeout)[0]:
+                os.read(self.wakeup_read, 1024)
+            return None
+
+    def interrupt(self):
+        try:
+            os.write(self.wakeup_write, b'\0')
+        except BlockingIOError:
+            # Pipe is full, wakeup is pending anyway
+            pass
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+
+            self.conn = None
@@ -1,7 +1,14 @@
+import ast
+import gzip
+import mmap
+import os
 import requests
+from bisect import bisect_left
 from time import sleep
 from datetime import timedelta, datetime
-import gzip
+
+from django.conf import settings
+from loguru import logger
 
 
 # def get_parent(tx_hash: str, gen_utime: datetime, lt) -> str:
@@ -24,20 +31,72 @@ import gzip
 #         sleep(0.1)
 #         return get_parent(tx_hash, gen_utime, lt)
 
+WHITELIST_SOURCE = settings.BASE_DIR / 'indexer' / 'data' / 'success_first_wave.data.gz'
+WHITELIST_PATH = settings.BASE_DIR / 'indexer' / 'data' / 'success_first_wave.bin'
+HASH_SIZE = 32
+
+
+def convert_whitelist(source=WHITELIST_SOURCE, path=WHITELIST_PATH) -> int:
+    """
+    Convert gzipped python list of hex tx hashes to sorted array of 32 bytes hashes, returns count of hashes
+
+    File is written next to the target and renamed, so readers never see partial one
+    """
+
+    with gzip.open(source, 'rb') as f:
+        hashes = sorted({bytes.fromhex(i) for i in ast.literal_eval(f.read().decode())})
+
+    tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+    tmp_path.write_bytes(b''.join(hashes))
+    os.replace(tmp_path, path)
+
+    return len(hashes)
+
+
 class SuccessTxCache:
-    def __init__(self):
+    """
+    Whitelist of tx hashes: sorted 32 bytes hashes memory-mapped from WHITELIST_PATH, membership by binary search
+
+    Nothing is parsed on load, pages are read by OS on first lookups and shared between processes.
+    Binary file is built from WHITELIST_SOURCE on first use if it's missing (or `manage.py convert_whitelist`).
+    """
+
+    def __init__(self, path=WHITELIST_PATH, source=WHITELIST_SOURCE):
+        self.path = path
+        self.source = source
         self.cache = None
+        self.size = 0
 
     def init_cache(self):
-        with gzip.open('indexer/data/success_first_wave.data.gz', 'rb') as f:
-            file_content = f.read()
-        self.cache = set(eval(file_content))
+        if not self.path.exists():
+            count = convert_whitelist(self.source, self.path)
+            logger.info(f"Converted {count} whitelisted tx hashes to {self.path}")
+
+        with open(self.path, 'rb') as f:
+            self.cache = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self.cache) % HASH_SIZE:
+            raise ValueError(f"Broken whitelist {self.path}, size is not multiple of {HASH_SIZE}")
+
+        self.size = len(self.cache) // HASH_SIZE
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i) -> bytes:
+        return self.cache[i * HASH_SIZE:(i + 1) * HASH_SIZE]
 
     def __contains__(self, item):
         if self.cache is None:
             self.init_cache()
 
-        return item in self.cache
+        try:
+            key = bytes.fromhex(item)
+        except ValueError:
+            return False
+
+        i = bisect_left(self, key)
+        return i < self.size and self[i] == key
 
 
 success_tx_cache = SuccessTxCache()
@@ -1,6 +1,39 @@
 from tonpy import CellSlice, Cell
 from tonpy.autogen.block import MessageAny
 
+from indexer.utils.ton20checks import is_valid_json, parse_amt, fix_address
+from indexer.utils.tx_decode import parse_comment
+
+
+def comment_columns(text) -> dict:
+    """
+    Parsed in_msg_comment for Transaction comment_* columns
+
+    comment_valid is the same check start_ton20 does (ton-20 json with known op), so rows with False are never applied
+    """
+
+    comment = parse_comment(text)
+
+    def field(name, lower=False):
+        value = comment.get(name)
+        if value is None:
+            return None
+
+        value = str(value)[:200]
+        return value.lower() if lower else value
+
+    tick = comment.get('tick')
+    to = comment.get('to')
+
+    return {
+        'comment_valid': is_valid_json(comment),
+        'comment_p': field('p'),
+        'comment_op': field('op', lower=True),
+        'comment_tick': tick.lower()[:200] if isinstance(tick, str) else None,
+        'comment_amt': parse_amt(comment.get('amt'))[0],
+        'comment_to': fix_address(to) if isinstance(to, str) else None,
+    }
+
 
 def get_in_msg_info(tx_boc):
     result = {
@@ -40,4 +73,6 @@ def get_in_msg_info(tx_boc):
             result['in_msg_comment'] = text.replace("\x00", "\uFFFD")
         except Exception as e:
             print(e)
+
+    result.update(comment_columns(result['in_msg_comment']))
     return result
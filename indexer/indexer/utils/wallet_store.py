@@ -0,0 +1,209 @@
+from array import array
+
+
+class AddressTable:
+    """Interns `wc:HEX` addresses to int ids, one table is shared by all ticks"""
+
+    __slots__ = ('ids', 'addresses')
+
+    def __init__(self):
+        self.ids = {}
+        self.addresses = []
+
+    def intern(self, address: str) -> int:
+        address_id = self.ids.get(address)
+
+        if address_id is None:
+            address_id = len(self.addresses)
+            self.ids[address] = address_id
+            self.addresses.append(address)
+
+        return address_id
+
+    def get_id(self, address: str):
+        return self.ids.get(address)
+
+    def __getitem__(self, address_id: int) -> str:
+        return self.addresses[address_id]
+
+    def __len__(self):
+        return len(self.addresses)
+
+
+class TickWallets:
+    """
+    Wallets of one tick stored in parallel arrays:
+
+    slots: {address_id: slot}
+    ids[slot] - address id, amounts[slot] - balance, txhashes[slot * 32:(slot + 1) * 32] - raw last txhash
+    """
+
+    __slots__ = ('addresses', 'slots', 'ids', 'amounts', 'txhashes')
+
+    def __init__(self, addresses: AddressTable):
+        self.addresses = addresses
+        self.slots = {}
+        self.ids = array('Q')
+        self.amounts = []
+        self.txhashes = bytearray()
+
+    def _slot(self, wallet: str):
+        address_id = self.addresses.get_id(wallet)
+        if address_id is None:
+            return None
+
+        return self.slots.get(address_id)
+
+    def __contains__(self, wallet: str):
+        return self._slot(wallet) is not None
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def __iter__(self):
+        addresses = self.addresses
+        for address_id in self.ids:
+            yield addresses[address_id]
+
+    def get_amount(self, wallet: str) -> int:
+        slot = self._slot(wallet)
+        if slot is None:
+            raise KeyError(wallet)
+
+        return self.amounts[slot]
+
+    def get_txhash(self, wallet: str) -> str:
+        slot = self._slot(wallet)
+        if slot is None:
+            raise KeyError(wallet)
+
+        return self.txhashes[slot * 32:(slot + 1) * 32].hex().upper()
+
+    def set(self, wallet: str, amount: int, txhash: str):
+        address_id = self.addresses.intern(wallet)
+        slot = self.slots.get(address_id)
+
+        if slot is None:
+            self.slots[address_id] = len(self.amounts)
+            self.ids.append(address_id)
+            self.amounts.append(amount)
+            self.txhashes += bytes.fromhex(txhash)
+        else:
+            self.amounts[slot] = amount
+            self.txhashes[slot * 32:(slot + 1) * 32] = bytes.fromhex(txhash)
+
+    def append(self, wallet: str, amount: int, txhash: bytes):
+        """Add new wallet with raw txhash, wallet must not exist"""
+
+        address_id = self.addresses.intern(wallet)
+        self.slots[address_id] = len(self.amounts)
+        self.ids.append(address_id)
+        self.amounts.append(amount)
+        self.txhashes += txhash
+
+    def add(self, wallet: str, amount: int, txhash: str) -> int:
+        """Add amount (can be negative) to existing wallet, returns new balance"""
+
+        slot = self._slot(wallet)
+        if slot is None:
+            raise KeyError(wallet)
+
+        self.amounts[slot] += amount
+        self.txhashes[slot * 32:(slot + 1) * 32] = bytes.fromhex(txhash)
+        return self.amounts[slot]
+
+    def remove(self, wallet: str):
+        """Remove wallet, last slot is moved to the free one"""
+
+        address_id = self.addresses.get_id(wallet)
+        slot = self.slots.pop(address_id)
+        last = len(self.amounts) - 1
+
+        if slot != last:
+            moved_id = self.ids[last]
+            self.ids[slot] = moved_id
+            self.amounts[slot] = self.amounts[last]
+            self.txhashes[slot * 32:(slot + 1) * 32] = self.txhashes[last * 32:]
+            self.slots[moved_id] = slot
+
+        self.ids.pop()
+        self.amounts.pop()
+        del self.txhashes[last * 32:]
+
+    def export(self):
+        """Plain (addresses, amounts, txhashes) copy, cheap to pickle into other processes"""
+
+        addresses = self.addresses
+        return [addresses[i] for i in self.ids], list(self.amounts), bytes(self.txhashes)
+
+    def items(self):
+        """Yields (address, amount, txhash)"""
+
+        addresses = self.addresses
+        txhashes = self.txhashes
+
+        for slot, address_id in enumerate(self.ids):
+            yield addresses[address_id], self.amounts[slot], txhashes[slot * 32:(slot + 1) * 32].hex().upper()
+
+    def raw_items(self):
+        """Yields (address, amount, raw txhash)"""
+
+        addresses = self.addresses
+        txhashes = self.txhashes
+
+        for slot, address_id in enumerate(self.ids):
+            yield addresses[address_id], self.amounts[slot], bytes(txhashes[slot * 32:(slot + 1) * 32])
+
+
+class LazyWallets(dict):
+    """{tick: TickWallets}, ticks of state image are loaded on first access"""
+
+    def __init__(self, image, addresses: AddressTable):
+        super().__init__()
+        self.image = image
+        self.addresses = addresses
+        self.pending = set(image.ticks)
+
+    def load(self, tick: str) -> TickWallets:
+        wallets = TickWallets(self.addresses)
+        for address, amount, txhash in self.image.iter_wallets(tick):
+            wallets.append(address, amount, txhash)
+
+        self.pending.discard(tick)
+        dict.__setitem__(self, tick, wallets)
+        return wallets
+
+    def load_all(self):
+        for tick in list(self.pending):
+            self.load(tick)
+
+    def __missing__(self, tick):
+        if tick in self.pending:
+            return self.load(tick)
+
+        raise KeyError(tick)
+
+    def __contains__(self, tick):
+        return dict.__contains__(self, tick) or tick in self.pending
+
+    def __len__(self):
+        return dict.__len__(self) + len(self.pending)
+
+    def __iter__(self):
+        self.load_all()
+        return dict.__iter__(self)
+
+    def get(self, tick, default=None):
+        return self[tick] if tick in self else default
+
+    def keys(self):
+        self.load_all()
+        return dict.keys(self)
+
+    def values(self):
+        self.load_all()
+        return dict.values(self)
+
+    def items(self):
+        self.load_all()
+        return dict.items(self)
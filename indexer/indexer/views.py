@@ -1,3 +1,5 @@
+import threading
+
 import django_filters
 from django.shortcuts import render
 from django_filters.rest_framework import DjangoFilterBackend
@@ -8,19 +10,20 @@ from rest_framework.views import APIView
 from indexer.models import Ton20Tick, Ton20Wallet, TransactionStatus, Ton20StateSerialized
 from indexer.serializers import Ton20TickSerializer, Ton20WalletSerializer, TransactionStatusSerializer, \
     Ton20StateSerializedSerializer
-from tonpy import Address
 from django_filters import rest_framework as filters
 from loguru import logger
 
 from rest_framework.filters import OrderingFilter
+from indexer.utils.ton20checks import parse_address
+
 
+def normalize_address(address):
+    # Not address_cache: it is a lock-free LRU owned by the indexer thread, and user input would evict hot entries
+    normalized = parse_address(address)
+    if normalized is None:
+        raise ValueError(f"Invalid address: {address}")
 
-def fix_address(address):
-    if ':' in address:
-        to_addr = address.split(':')
-        return f"{to_addr[0]}:{to_addr[1].zfill(64)}"
-    else:
-        return address
+    return normalized
 
 
 class WalletByAddressView(APIView):
@@ -28,8 +31,7 @@ class WalletByAddressView(APIView):
     pagination_class = None
 
     def get(self, request, address, format=None):
-        a = Address(fix_address(address))
-        wallets = Ton20Wallet.objects.filter(wallet=f"{a.workchain}:{a.address}")
+        wallets = Ton20Wallet.objects.filter(wallet=normalize_address(address))
         serializer = Ton20WalletSerializer(wallets, many=True)
         return Response(serializer.data)
 
@@ -39,8 +41,7 @@ class WalletByAddressAndTickView(APIView):
     pagination_class = None
 
     def get(self, request, address, tick, format=None):
-        a = Address(fix_address(address))
-        wallets = Ton20Wallet.objects.filter(wallet=f"{a.workchain}:{a.address}")
+        wallets = Ton20Wallet.objects.filter(wallet=normalize_address(address))
         serializer = Ton20WalletSerializer(wallets, many=True)
         return Response(serializer.data)
 
@@ -50,13 +51,17 @@ class TickByTickView(APIView):
     pagination_class = None
 
     def get(self, request, tick, format=None):
-        ticks = Ton20Tick.objects.filter(tick=tick)
+        ticks = Ton20Tick.objects.select_related('stats').filter(tick=tick)
         serializer = Ton20TickSerializer(ticks, many=True)
         return Response(serializer.data)
 
 
 class CustomTickFilter(filters.FilterSet):
     ticks = filters.CharFilter(method='filter_by_ticks')
+    holders_min = filters.NumberFilter(field_name='stats__holders', lookup_expr='gte')
+    holders_max = filters.NumberFilter(field_name='stats__holders', lookup_expr='lte')
+    progress_min = filters.NumberFilter(field_name='stats__progress', lookup_expr='gte')
+    progress_max = filters.NumberFilter(field_name='stats__progress', lookup_expr='lte')
 
     class Meta:
         model = Ton20Tick
@@ -67,13 +72,43 @@ class CustomTickFilter(filters.FilterSet):
         return queryset.filter(tick__in=tick_list)
 
 
+class StateBOCCache:
+    """
+    BOC of latest state of process, rebuilt from chain only when head state_hash changes
+
+    Rebuild of delta head loads base BOC, applies all deltas and re-serializes whole state, while result of
+    state_hash never changes, so each head is rebuilt once and concurrent requests wait for it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.state_hash = None
+        self.state_boc = None
+
+    def get(self, state: Ton20StateSerialized) -> str:
+        with self.lock:
+            if self.state_hash != state.state_hash:
+                self.state_boc = state.rebuild_state_boc() if state.is_delta else state.state_boc
+                self.state_hash = state.state_hash
+
+            return self.state_boc
+
+
+state_boc_cache = StateBOCCache()
+
+
 class LatestStateBOCView(APIView):
     serializer_class = Ton20StateSerializedSerializer
     pagination_class = None
 
     def get(self, request, *args, **kwargs):
         try:
-            latest_state = Ton20StateSerialized.objects.latest('in_msg_created_lt')
+            # Only chain info of head is read on each request, BOC comes from cache
+            latest_state = Ton20StateSerialized.get_latest_state(with_boc=False)
+            if latest_state is None:
+                raise Ton20StateSerialized.DoesNotExist
+
+            latest_state.state_boc = state_boc_cache.get(latest_state)
             serializer = Ton20StateSerializedSerializer(latest_state)
             return Response(serializer.data, status=HTTP_200_OK)
         except Ton20StateSerialized.DoesNotExist:
@@ -85,10 +120,12 @@ class LatestStateBOCView(APIView):
 
 
 class Ton20TickListView(generics.ListAPIView):
-    queryset = Ton20Tick.objects.all()
+    queryset = Ton20Tick.objects.select_related('stats')
     serializer_class = Ton20TickSerializer
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, OrderingFilter)
     filterset_class = CustomTickFilter
+    ordering_fields = ['tick', 'stats__holders', 'stats__progress', 'stats__supply', 'stats__mints',
+                       'stats__transfers']
 
 
 class TransactionStatusFilter(django_filters.FilterSet):
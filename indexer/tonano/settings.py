@@ -21,6 +21,50 @@ load_dotenv()
 COMMIT_STATE_EACH = int(os.getenv('COMMIT_STATE_EACH'))
 NPROC = int(os.getenv('NPROC'))
 
+# Keep state dictionaries in memory between commits and serialize only changed wallets
+INCREMENTAL_SERIALIZE = bool(int(os.getenv('INCREMENTAL_SERIALIZE', '0')))
+
+# Processes used to build wallets dicts of large ticks on serialize, 0 or 1 - build in place
+SERIALIZE_WORKERS = int(os.getenv('SERIALIZE_WORKERS', '0'))
+
+# Full state snapshot each N commits, deltas of changed ticks & wallets between them
+SNAPSHOT_FULL_EACH = int(os.getenv('SNAPSHOT_FULL_EACH', '1'))
+
+# On start write only difference between loaded state and Ton20Wallet / Ton20Tick tables
+WARM_RESTART = bool(int(os.getenv('WARM_RESTART', '1')))
+
+# Directory for memory-mapped state images written next to full snapshots, empty - disabled
+STATE_IMAGE_DIR = os.getenv('STATE_IMAGE_DIR') or None
+
+# Save dirty wallets to DB once there are so many of them, 0 - only after each batch of new transactions
+FLUSH_DIRTY_EACH = int(os.getenv('FLUSH_DIRTY_EACH', '0'))
+
+# Apply ton-20 ops in so many tick shard worker processes, 0 - in main process
+APPLY_WORKERS = int(os.getenv('APPLY_WORKERS', '0'))
+
+# Max normalized addresses kept in shared address cache
+ADDRESS_CACHE_SIZE = int(os.getenv('ADDRESS_CACHE_SIZE', '1000000'))
+
+# Serialize & save state commits in background thread with so many commits in flight, 0 - commit in place
+COMMIT_IN_FLIGHT = int(os.getenv('COMMIT_IN_FLIGHT', '0'))
+
+# Checkpoint commit once so many seconds passed / wallets changed since latest commit (0 - off), SIGTERM always
+# checkpoints, so restart replays only txs after latest checkpoint. Checkpoint costs as much as commit (full snapshot
+# with SNAPSHOT_FULL_EACH=1), so enable them with INCREMENTAL_SERIALIZE & snapshot deltas
+COMMIT_EACH_SECONDS = int(os.getenv('COMMIT_EACH_SECONDS', '0'))
+COMMIT_DIRTY_EACH = int(os.getenv('COMMIT_DIRTY_EACH', '0'))
+
+# Read transactions with COPY in background thread and decode them in so many processes, 0 - cursor in main process
+READ_WORKERS = int(os.getenv('READ_WORKERS', '0'))
+
+# start_index notifies start_ton20 about inserted txs (LISTEN / NOTIFY), without notification it polls each N seconds
+TX_NOTIFY = bool(int(os.getenv('TX_NOTIFY', '1')))
+TX_POLL_TIMEOUT = float(os.getenv('TX_POLL_TIMEOUT', '10'))
+
+# Time hot path stages of ton20 index, log their histograms each N seconds (0 - only on SIGUSR1)
+STAGE_TIMERS = bool(int(os.getenv('STAGE_TIMERS', '1')))
+STAGE_TIMERS_DUMP_EACH = int(os.getenv('STAGE_TIMERS_DUMP_EACH', '300'))
+
 LCPARAMS = {
     'mode': 'roundrobin',
     'my_rr_servers': json.loads(os.getenv('NODES')),